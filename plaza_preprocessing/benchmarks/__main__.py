@@ -0,0 +1,103 @@
+import argparse
+import logging
+import sys
+from plaza_preprocessing import __main__ as plaza_main
+from benchmarks import suite
+
+logger = logging.getLogger('benchmarks')
+
+
+def main():
+    """entry point, see README.md for usage"""
+    args = parse_args(sys.argv[1:])
+    setup_logging()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+def run(args):
+    """ run the smoke matrix, or the full matrix with --full. Options that are given replace either default """
+    config = suite.load_config(args.config)
+    files = _select(args.files, args.full, sorted(suite.BENCHMARK_FILES), suite.SMOKE_FILES)
+    strategies = _select(args.strategies, args.full, suite.GRAPH_STRATEGIES, suite.SMOKE_GRAPH_STRATEGIES)
+    algorithms = _select(
+        args.algorithms, args.full, suite.SHORTEST_PATH_ALGORITHMS, suite.SMOKE_SHORTEST_PATH_ALGORITHMS)
+    synthetic_sweeps = {} if args.no_synthetic else {
+        parameter: _select(getattr(args, parameter), args.full, suite.SYNTHETIC_SWEEPS[parameter],
+                           suite.SMOKE_SYNTHETIC_SWEEPS[parameter])
+        for parameter in ('vertices', 'holes', 'entries')
+    }
+    results = suite.run_benchmarks(files, strategies, algorithms, synthetic_sweeps, config, args.repeat)
+    suite.write_results(results, args.output)
+    logger.info(f"Benchmark results written to {args.output}")
+
+
+def _select(value, full, full_default, smoke_default):
+    if value is not None:
+        return value
+    return full_default if full else smoke_default
+
+
+def compare(args):
+    """ print all regressions, returns 1 if there are any """
+    regressions = suite.compare_results(
+        suite.load_results(args.baseline), suite.load_results(args.current), args.threshold, args.min_difference)
+    for regression in regressions:
+        change = regression['current_s'] / regression['baseline_s'] - 1 if regression['baseline_s'] else float('inf')
+        logger.info(f"REGRESSION {regression['case']} {regression['timing']}: "
+                    f"{regression['baseline_s']:.3f}s -> {regression['current_s']:.3f}s ({change:+.0%})")
+    if regressions:
+        logger.info(f"{len(regressions)} regressions above {args.threshold:.0%}")
+        return 1
+    logger.info("No regressions")
+    return 0
+
+
+def setup_logging():
+    plaza_main.setup_logging(quiet=True)
+    logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark the plaza preprocessing.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser('run', help='run the benchmarks and write the results to a JSON file')
+    run_parser.add_argument('output', help='JSON file for the results, e.g. baseline.json')
+    run_parser.add_argument('--config', metavar='filename', help='config file, the default config is used if omitted')
+    run_parser.add_argument('--full', action='store_true',
+                            help='run all files, strategies, algorithms and synthetic sweeps (takes hours) '
+                                 'instead of the smoke matrix')
+    run_parser.add_argument('--files', nargs='*', choices=sorted(suite.BENCHMARK_FILES), metavar='name',
+                            help='bundled test files to run')
+    run_parser.add_argument('--strategies', nargs='+', choices=suite.GRAPH_STRATEGIES, metavar='strategy',
+                            help='graph strategies to run')
+    run_parser.add_argument('--algorithms', nargs='+', choices=suite.SHORTEST_PATH_ALGORITHMS, metavar='algorithm',
+                            help='shortest path algorithms to run')
+    run_parser.add_argument('--vertices', nargs='*', type=int, metavar='N',
+                            help='outer ring vertex counts of the synthetic plazas')
+    run_parser.add_argument('--holes', nargs='*', type=int, metavar='N', help='hole counts of the synthetic plazas')
+    run_parser.add_argument('--entries', nargs='*', type=int, metavar='N', help='entry counts of the synthetic plazas')
+    run_parser.add_argument('--no-synthetic', action='store_true', help='do not run synthetic plazas')
+    run_parser.add_argument('--repeat', type=plaza_main._positive_int, default=1, metavar='N',
+                            help='run every case N times and keep the fastest run')
+
+    compare_parser = subparsers.add_parser('compare', help='compare results with a baseline, fails on regressions')
+    compare_parser.add_argument('baseline', help='JSON file with the baseline results')
+    compare_parser.add_argument('current', help='JSON file with the current results')
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help='relative slowdown that counts as regression (default 0.2)')
+    compare_parser.add_argument('--min-difference', type=float, default=0.05, metavar='SECONDS',
+                                help='ignore slowdowns smaller than this (default 0.05)')
+
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+from copy import deepcopy
+from itertools import product
+from plaza_preprocessing import __main__, configuration
+from plaza_preprocessing.report import Report
+from benchmarks import synthetic
+"""
+Run the preprocessing on the bundled test files and on synthetic plazas and compare the results
+"""
+
+logger = logging.getLogger('benchmarks')
+
+TESTFILEPATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'tests', 'testfiles')
+
+BENCHMARK_FILES = {
+    'bahnhofplatz_bern': 'bahnhofplatz-bern.osm',
+    'bahnhofstrasse': 'bahnhofstrasse.osm',
+    'bundeshaus_bern': 'bundeshaus-bern.osm',
+    'europaallee': 'europaallee.osm',
+    'fischmarktplatz': 'fischmarktplatz.osm',
+    'kreuzplatz': 'kreuzplatz.osm',
+    'sechselaeutenplatz': 'sechselaeutenplatz.osm',
+    'zentrum_witikon': 'zentrum_witikon.osm',
+    'zuerich_hb': 'zuerich_hauptbahnhof.osm'
+}
+
+GRAPH_STRATEGIES = ('visibility', 'visibility-reflex', 'visibility-sweep', 'visibility-lazy', 'spiderweb',
+                    'spiderweb-adaptive', 'navmesh', 'auto')
+SHORTEST_PATH_ALGORITHMS = ('astar', 'dijkstra', 'csr-dijkstra')
+
+# synthetic plazas: every parameter is varied on its own, the others keep their base value
+SYNTHETIC_BASE = {'vertices': 64, 'holes': 4, 'entries': 8}
+SYNTHETIC_SWEEPS = {
+    'vertices': [16, 64, 256, 1024],
+    'holes': [0, 4, 16, 64],
+    'entries': [4, 8, 16, 32, 64]
+}
+
+# the default run: a few minutes to catch regressions, the full matrix above takes hours
+SMOKE_FILES = ('kreuzplatz', 'bahnhofplatz_bern')
+SMOKE_GRAPH_STRATEGIES = ('visibility', 'spiderweb', 'auto')
+SMOKE_SHORTEST_PATH_ALGORITHMS = ('astar',)
+SMOKE_SYNTHETIC_SWEEPS = {
+    'vertices': [64, 256],
+    'holes': [],
+    'entries': []
+}
+
+
+def run_benchmarks(files, graph_strategies, algorithms, synthetic_sweeps, config, repeat=1):
+    """
+    run every file with every combination of graph strategy and shortest path algorithm.
+    Returns the benchmark results, every case keeps the fastest of repeat runs
+    """
+    cases = {}
+    with tempfile.TemporaryDirectory() as tempdir:
+        inputs = [(name, os.path.join(TESTFILEPATH, BENCHMARK_FILES[name]), None) for name in files]
+        for parameters in get_synthetic_parameters(synthetic_sweeps):
+            name = synthetic.synthetic_name(**parameters)
+            filename = os.path.join(tempdir, f'{name}.osm')
+            synthetic.write_synthetic_plaza(filename, **parameters)
+            inputs.append((name, filename, parameters))
+
+        out_file = os.path.join(tempdir, 'merged.osm.pbf')
+        for (name, filename, parameters), graph_strategy, algorithm in product(inputs, graph_strategies, algorithms):
+            case_config = deepcopy(config)
+            case_config['graph-strategy'] = graph_strategy
+            case_config['shortest-path-algorithm'] = algorithm
+            key = f'{name}/{graph_strategy}/{algorithm}'
+            logger.info(f"Running {key}")
+            runs = [_run_case(filename, out_file, case_config) for _ in range(repeat)]
+            case = min(runs, key=lambda run: run['total_time_s'])
+            case.update({'file': name, 'graph-strategy': graph_strategy, 'shortest-path-algorithm': algorithm})
+            if parameters is not None:
+                case['synthetic'] = parameters
+            cases[key] = case
+
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'cases': cases
+    }
+
+
+def get_synthetic_parameters(synthetic_sweeps):
+    """ parameters of all synthetic plazas, without duplicates """
+    parameters = []
+    for parameter, values in synthetic_sweeps.items():
+        for value in values:
+            plaza_parameters = {**SYNTHETIC_BASE, parameter: value}
+            if plaza_parameters not in parameters:
+                parameters.append(plaza_parameters)
+    return parameters
+
+
+def _run_case(filename, out_file, config):
+    report = Report()
+    start_time = time.perf_counter()
+    __main__.preprocess_osm(filename, out_file, config, report)
+    total_time = time.perf_counter() - start_time
+    plaza_stats = [stats for stats in report.plazas if stats['status'] == 'processed']
+    return {
+        'total_time_s': total_time,
+        'stages': report.stages,
+        'plazas': len(plaza_stats),
+        'output_edges': sum(stats['output_edges'] for stats in plaza_stats)
+    }
+
+
+def compare_results(baseline, current, threshold, min_difference_s):
+    """
+    compare the total and stage times of all cases that are in both results.
+    Returns a list of regressions, a time regressed if it is more than threshold (relative)
+    and min_difference_s (absolute) slower than the baseline
+    """
+    regressions = []
+    for key, current_case in sorted(current['cases'].items()):
+        baseline_case = baseline['cases'].get(key)
+        if baseline_case is None:
+            logger.warning(f"{key} is not in the baseline")
+            continue
+        timings = [('total', baseline_case['total_time_s'], current_case['total_time_s'])]
+        for stage, current_stage in current_case['stages'].items():
+            if stage in baseline_case['stages']:
+                timings.append((stage, baseline_case['stages'][stage]['wall_time_s'], current_stage['wall_time_s']))
+        for timing, baseline_time, current_time in timings:
+            if current_time - baseline_time > max(baseline_time * threshold, min_difference_s):
+                regressions.append({
+                    'case': key,
+                    'timing': timing,
+                    'baseline_s': baseline_time,
+                    'current_s': current_time
+                })
+    return regressions
+
+
+def load_results(filename):
+    with open(filename) as results_file:
+        return json.load(results_file)
+
+
+def write_results(results, filename):
+    with open(filename, 'w') as results_file:
+        json.dump(results, results_file, indent=2, sort_keys=True)
+
+
+def load_config(config_path):
+    """ load the config file, or the default config if no path is given """
+    if config_path is not None:
+        return configuration.load_config(config_path)
+    with tempfile.TemporaryDirectory() as tempdir:
+        return configuration.load_config(os.path.join(tempdir, 'config.yml'))
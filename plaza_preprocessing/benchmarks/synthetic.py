@@ -0,0 +1,122 @@
+import math
+import os
+import random
+from osmium import SimpleWriter
+from osmium.osm.mutable import Node, Way
+"""
+Generate OSM files with a single synthetic plaza of configurable complexity
+"""
+
+CENTER = (8.54, 47.37)
+# radius of the plaza in degrees (roughly 100 meters)
+RADIUS = 0.001
+# holes are placed inside this fraction of the radius, entry ways end at ENTRY_END * RADIUS
+HOLE_AREA = 0.6
+ENTRY_START = 1.3
+ENTRY_END = 0.8
+
+
+def write_synthetic_plaza(filename, vertices, holes, entries, seed=0):
+    """
+    write an OSM file with one plaza with the given number of outer ring vertices.
+    The plaza has holes buildings on it and entries footways that cross its boundary
+    """
+    if vertices < 3:
+        raise ValueError("A plaza needs at least 3 vertices")
+    random_generator = random.Random(seed)
+    writer = _SyntheticWriter()
+
+    plaza_coords = _create_outer_ring(vertices, random_generator)
+    writer.add_way(plaza_coords, {'highway': 'pedestrian', 'area': 'yes'}, closed=True)
+    for building_coords in _create_buildings(holes):
+        writer.add_way(building_coords, {'building': 'yes'}, closed=True)
+    for entry_coords in _create_entry_lines(entries):
+        writer.add_way(entry_coords, {'highway': 'footway'})
+
+    writer.write(filename)
+
+
+def synthetic_name(vertices, holes, entries):
+    return f"synthetic-v{vertices}-h{holes}-e{entries}"
+
+
+def _create_outer_ring(vertices, random_generator):
+    """ points on a circle with a jittered radius, counter-clockwise """
+    coords = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        radius = RADIUS * random_generator.uniform(0.9, 1.0)
+        coords.append(_polar_to_coords(angle, radius))
+    return coords
+
+
+def _create_buildings(holes):
+    """ square buildings on a grid inside the plaza, they do not touch each other or the outer ring """
+    if holes == 0:
+        return []
+    cells_per_side = math.ceil(math.sqrt(holes))
+    # square inscribed in the circle with radius HOLE_AREA * RADIUS
+    side = 2 * HOLE_AREA * RADIUS / math.sqrt(2)
+    cell_size = side / cells_per_side
+    building_size = cell_size * 0.4
+    x_start = CENTER[0] - side / 2
+    y_start = CENTER[1] - side / 2
+    buildings = []
+    for i in range(holes):
+        column, row = i % cells_per_side, i // cells_per_side
+        x = x_start + (column + 0.3) * cell_size
+        y = y_start + (row + 0.3) * cell_size
+        buildings.append([(x, y), (x + building_size, y), (x + building_size, y + building_size),
+                          (x, y + building_size)])
+    return buildings
+
+
+def _create_entry_lines(entries):
+    """ lines from outside of the plaza to inside of it, evenly distributed around the plaza """
+    lines = []
+    for i in range(entries):
+        # shift by half a step so that the lines do not cross the outer ring exactly at a vertex
+        angle = 2 * math.pi * (i + 0.5) / entries
+        lines.append([_polar_to_coords(angle, ENTRY_START * RADIUS), _polar_to_coords(angle, ENTRY_END * RADIUS)])
+    return lines
+
+
+def _polar_to_coords(angle, radius):
+    return CENTER[0] + radius * math.cos(angle), CENTER[1] + radius * math.sin(angle)
+
+
+class _SyntheticWriter:
+    """ collects nodes and ways and writes them sorted by type and id """
+
+    def __init__(self):
+        self.nodes = []
+        self.ways = []
+
+    def add_way(self, coords, tags, closed=False):
+        """ add a way with new nodes for all coords, closed ways end with their first node """
+        node_ids = [self._add_node(c) for c in coords]
+        if closed:
+            node_ids.append(node_ids[0])
+        way = Way(nodes=node_ids, tags=tags)
+        way.id = len(self.ways) + 1
+        way.version = 1
+        self.ways.append(way)
+
+    def write(self, filename):
+        if os.path.exists(filename):
+            os.remove(filename)
+        writer = SimpleWriter(filename)
+        try:
+            for node in self.nodes:
+                writer.add_node(node)
+            for way in self.ways:
+                writer.add_way(way)
+        finally:
+            writer.close()
+
+    def _add_node(self, coords):
+        node = Node(location=coords)
+        node.id = len(self.nodes) + 1
+        node.version = 1
+        self.nodes.append(node)
+        return node.id
@@ -5,31 +5,74 @@ from os import path
 from plaza_preprocessing.importer import importer
 from plaza_preprocessing.merger import merger
 from plaza_preprocessing.optimizer import optimizer, shortest_paths
+from plaza_preprocessing.incremental import incremental, plazaindex
 from plaza_preprocessing.optimizer.graphprocessor.graphprocessor import GraphProcessor
-from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import VisibilityGraphProcessor
-from plaza_preprocessing.optimizer.graphprocessor.spiderwebgraph import SpiderWebGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import VisibilityGraphProcessor, \
+    ReflexVisibilityGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.spiderwebgraph import SpiderWebGraphProcessor, \
+    AdaptiveSpiderWebGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.navmeshgraph import NavMeshGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.rotationalsweep import RotationalSweepGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.lazyvisibility import LazyVisibilityGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.autograph import AutoGraphProcessor
 from plaza_preprocessing import configuration
+from plaza_preprocessing.report import Report
 
 logger = logging.getLogger('plaza_preprocessing')
 
 
 def plaza_preprocessing():
     """entry point"""
-    source, destination, config_file, verbose_log = parse_args(sys.argv[1:])
-
-    setup_logging(verbose=verbose_log)
-    config = configuration.load_config(config_file)
-    preprocess_osm(source, destination, config)
+    args = parse_args(sys.argv[1:])
+
+    setup_logging(verbose=args.verbose)
+    config = configuration.load_config(args.config)
+    if args.workers is not None:
+        config['workers'] = args.workers
+    if args.cache is not None:
+        config['cache-path'] = args.cache
+    report = Report()
+    if args.changes and plazaindex.index_exists(args.plaza_index):
+        preprocess_osm_changes(args.source, args.destination, config, args.changes, args.previous, args.plaza_index,
+                               report)
+    else:
+        if args.changes:
+            logger.warning(f"Plaza index {args.plaza_index} does not exist, processing all plazas")
+        preprocess_osm(args.source, args.destination, config, report, args.plaza_index)
+    if args.report is not None:
+        report.write(args.report)
 
 
-def preprocess_osm(osm_filename: str, out_file: str, config: dict):
+def preprocess_osm(osm_filename: str, out_file: str, config: dict, report: Report = None,
+                   plaza_index_path: str = None):
+    """ preprocess all plazas, the plaza index for incremental runs is written if plaza_index_path is given """
+    report = report or Report()
     shortest_path_strategy = _get_shortest_path_strategy(config)
     process_strategy = _get_process_strategy(config)
     logger.info(f"Using {config['graph-strategy']} graph with {config['shortest-path-algorithm']} algorithm")
-    osm_holder = importer.import_osm(osm_filename, config['tag-filter'])
-
-    processed_plazas = optimizer.preprocess_plazas(osm_holder, process_strategy, shortest_path_strategy, config)
-    merger.merge_plaza_graphs(processed_plazas, osm_filename, out_file, config['footway-tags'])
+    with report.stage('import'):
+        osm_holder = importer.import_osm(osm_filename, config['tag-filter'], config.get('two-pass-import', False),
+                                         config.get('record-entry-ways', False))
+
+    processed_plazas = optimizer.preprocess_plazas(
+        osm_holder, process_strategy, shortest_path_strategy, config, report)
+    overflow_keys = set()
+    if plaza_index_path is not None:
+        processed_plazas = incremental.track_overflow_plazas(processed_plazas, overflow_keys)
+    merger.merge_plaza_graphs(processed_plazas, osm_filename, out_file, config['footway-tags'],
+                              config.get('merge-tool', 'pyosmium'), osm_holder.ways, report)
+    if plaza_index_path is not None:
+        plazaindex.write_plaza_index(plaza_index_path, osm_holder.plazas, overflow_keys)
+
+
+def preprocess_osm_changes(osm_filename: str, out_file: str, config: dict, change_files, previous_file: str,
+                           plaza_index_path: str, report: Report = None):
+    """ preprocess the plazas affected by change files, see incremental.preprocess_changes """
+    shortest_path_strategy = _get_shortest_path_strategy(config)
+    process_strategy = _get_process_strategy(config)
+    logger.info(f"Using {config['graph-strategy']} graph with {config['shortest-path-algorithm']} algorithm")
+    incremental.preprocess_changes(osm_filename, out_file, previous_file, change_files, plaza_index_path,
+                                   process_strategy, shortest_path_strategy, config, report)
 
 
 def setup_logging(verbose=False, quiet=False):
@@ -56,14 +99,30 @@ def parse_args(args):
     parser.add_argument('--config', default='plaza_preprocessing_config.yml', metavar="filename",
                         help='specify a config file location. A default config will be created'
                              ' if the path does not exist')
-    parser.add_argument('-v', action='store_true', help='verbose log output')
+    parser.add_argument('--workers', type=_positive_int, metavar='N',
+                        help='number of worker processes used to process plazas, overrides the config')
+    parser.add_argument('--cache', metavar='filename',
+                        help='SQLite file to cache processed plazas between runs, overrides the config')
+    parser.add_argument('--report', metavar='filename',
+                        help='write a JSON report with the timings of every stage and statistics of every plaza')
+    parser.add_argument('--plaza-index', metavar='basename',
+                        help='index of the processed plazas (basename.dat and basename.idx), written after every run'
+                             ' and used by incremental runs')
+    parser.add_argument('--changes', nargs='+', metavar='file', type=_existing_file,
+                        help='OSM change files that were applied to the source since the last run. Only the plazas'
+                             ' touched by the changes are processed, needs --previous and --plaza-index')
+    parser.add_argument('--previous', metavar='file', type=_existing_file,
+                        help='processed OSM file of the last run, used with --changes')
+    parser.add_argument('-v', dest='verbose', action='store_true', help='verbose log output')
 
     if len(args) == 0:
         parser.print_help()
         sys.exit(1)
 
     result = parser.parse_args(args)
-    return result.source, result.destination, result.config, result.v
+    if result.changes and (result.previous is None or result.plaza_index is None):
+        parser.error('--changes needs --previous and --plaza-index')
+    return result
 
 
 def _existing_file(value):
@@ -73,14 +132,37 @@ def _existing_file(value):
     return value
 
 
+def _positive_int(value):
+    """used for argparse to check for a positive number"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} is not a positive number")
+    return number
+
+
 def _get_process_strategy(config: dict) -> GraphProcessor:
     strategy_config = config['graph-strategy']
     lookup_buffer = config['entry-point-lookup-buffer'] * 2  # max tolerance should be twice the entry point buffer
     if strategy_config == 'visibility':
         return VisibilityGraphProcessor(visibility_delta_m=lookup_buffer)
+    elif strategy_config == 'visibility-reflex':
+        return ReflexVisibilityGraphProcessor(visibility_delta_m=lookup_buffer)
+    elif strategy_config == 'visibility-sweep':
+        return RotationalSweepGraphProcessor(visibility_delta_m=lookup_buffer)
+    elif strategy_config == 'visibility-lazy':
+        return LazyVisibilityGraphProcessor(visibility_delta_m=lookup_buffer)
     elif strategy_config == 'spiderweb':
         spacing = config['spiderweb-grid-size']
         return SpiderWebGraphProcessor(spacing_m=spacing, visibility_delta_m=lookup_buffer)
+    elif strategy_config == 'spiderweb-adaptive':
+        spacing = config['spiderweb-grid-size']
+        max_spacing = config.get('spiderweb-max-grid-size', 32)
+        return AdaptiveSpiderWebGraphProcessor(spacing_m=spacing, max_spacing_m=max_spacing,
+                                               visibility_delta_m=lookup_buffer)
+    elif strategy_config == 'navmesh':
+        return NavMeshGraphProcessor(visibility_delta_m=lookup_buffer)
+    elif strategy_config == 'auto':
+        return AutoGraphProcessor(visibility_delta_m=lookup_buffer, max_detour=config.get('auto-max-detour', 1.1))
     else:
         raise ValueError("invalid value for process strategy")
 
@@ -91,6 +173,8 @@ def _get_shortest_path_strategy(config: dict):
         return shortest_paths.compute_astar_shortest_paths
     elif strategy_config == 'dijkstra':
         return shortest_paths.compute_dijkstra_shortest_paths
+    elif strategy_config == 'csr-dijkstra':
+        return shortest_paths.compute_csr_dijkstra_shortest_paths
     else:
         raise ValueError("invalid value for shortest path algorithm")
 
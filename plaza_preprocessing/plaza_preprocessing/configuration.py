@@ -48,13 +48,25 @@ tag-filter:
 footway-tags: # tags that will be used for the newly generated ways
   - highway: footway
 
-graph-strategy: visibility # one of visibility, spiderweb
+graph-strategy: visibility # one of visibility, visibility-reflex, visibility-sweep, visibility-lazy, spiderweb, spiderweb-adaptive, navmesh, auto
 spiderweb-grid-size: 2 # grid size in meters, if spiderweb is used
+spiderweb-max-grid-size: 32 # grid size in meters of open areas, if spiderweb-adaptive is used
+auto-max-detour: 1.1 # with auto, the strategy is chosen per plaza among those with paths at most this much longer
 obstacle-buffer: 2 # minimal distance from any obstacles in meters
 
-shortest-path-algorithm: astar # one of astar, dijkstra
+shortest-path-algorithm: astar # one of astar, dijkstra, csr-dijkstra
+merge-shortest-paths: false # merge shortest paths into a network without duplicate segments
 
 entry-point-lookup-buffer: 0.05 # tolerance in meters, will be used to detect slightly offset entry points
+
+merge-tool: pyosmium # one of pyosmium, osmosis (must be installed and in PATH)
+
+two-pass-import: false # read plazas first and only import obstacles near plazas, reads the input twice
+record-entry-ways: false # keep the node lists of lines during import, the merger does not read the input again
+workers: 1 # number of worker processes used to process plazas
+
+cache-path: # SQLite file to cache processed plazas between runs, no caching if empty
+cache-max-size: 1024 # maximum size of the cached results in megabytes
 """
 
 SCHEMA = {
@@ -89,20 +101,52 @@ SCHEMA = {
        },
        'graph-strategy': {
            'type': 'string',
-           'enum': ['visibility', 'spiderweb']
+           'enum': ['visibility', 'visibility-reflex', 'visibility-sweep', 'visibility-lazy', 'spiderweb',
+                    'spiderweb-adaptive', 'navmesh', 'auto']
        },
        'spiderweb-grid-size': {
            'type': 'number'
        },
+       'spiderweb-max-grid-size': {
+           'type': 'number'
+       },
+       'auto-max-detour': {
+           'type': 'number',
+           'minimum': 1
+       },
        'obstacle-buffer': {
            'type': 'number'
        },
        'shortest-path-algorithm': {
            'type': 'string',
-           'enum': ['astar', 'dijkstra']
+           'enum': ['astar', 'dijkstra', 'csr-dijkstra']
+       },
+       'merge-shortest-paths': {
+           'type': 'boolean'
        },
        'entry-point-lookup-buffer': {
            'type': 'number',
+       },
+       'merge-tool': {
+           'type': 'string',
+           'enum': ['pyosmium', 'osmosis']
+       },
+       'two-pass-import': {
+           'type': 'boolean'
+       },
+       'record-entry-ways': {
+           'type': 'boolean'
+       },
+       'workers': {
+           'type': 'integer',
+           'minimum': 1
+       },
+       'cache-path': {
+           'type': ['string', 'null']
+       },
+       'cache-max-size': {
+           'type': 'number',
+           'minimum': 0
        }
     },
     'additionalProperties': False,
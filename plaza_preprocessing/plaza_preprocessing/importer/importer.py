@@ -1,5 +1,6 @@
 import logging
 import osmium
+import rtree
 from osmium._osmium import InvalidLocationError
 import shapely.wkb as wkblib
 from plaza_preprocessing.importer import osmholder
@@ -8,56 +9,195 @@ from plaza_preprocessing import configuration
 logger = logging.getLogger('plaza_preprocessing.importer')
 WKBFAB = osmium.geom.WKBFactory()
 
-OSM_MAX_ID = 10**10 
+OSM_MAX_ID = 2**40  # IDs generated by the merger start here, see plazatransformer.OSM_ID_START
 
 
-def import_osm(filename, tag_filters):
+def import_osm(filename, tag_filters, two_pass=False, record_ways=False, plazas=None, record_way_ids=None):
     """ imports a OSM / PBF file and returns a holder with all plazas, buildings,
-    lines and points with shapely geometries """
+    lines and points with shapely geometries.
+    With two_pass, the plazas are read first and only the objects near a plaza are kept.
+    With plazas (e.g. from import_plazas), only these plazas and the objects near them are imported.
+    With record_ways, the node lists of the lines are kept for the merger,
+    lines with an id in record_way_ids are recorded even if they are not near a plaza """
     logger.info(f'importing {filename}')
-    handler = _PlazaHandler(tag_filters)
+    plaza_index = None
+    invalid_count = 0
+    if two_pass and plazas is None:
+        plaza_handler = _PlazaAreaHandler(tag_filters)
+        _apply_handler(plaza_handler, filename)
+        plazas = _sort_plazas(plaza_handler.plazas)
+        invalid_count += plaza_handler.invalid_count
+        logger.debug(f'found {len(plazas)} plazas in the first pass')
+    if plazas is not None:
+        plaza_index = _create_plaza_index(plazas)
 
-    index_type = 'sparse_mem_array'
-    handler.apply_file(filename, locations=True, idx=index_type)
+    handler = _PlazaHandler(tag_filters, plaza_index, record_ways, record_way_ids)
+    _apply_handler(handler, filename)
+    if plazas is None:
+        plazas = _sort_plazas(handler.plazas)
 
-    logger.debug(f'found {len(handler.plazas)} plazas')
+    logger.debug(f'found {len(plazas)} plazas')
     logger.debug(f'found {len(handler.buildings)} buildings')
     logger.debug(f'found {len(handler.lines)} lines')
     logger.debug(f'found {len(handler.points)} points')
 
-    if handler.invalid_count > 0:
-        logger.warning(f'encountered {handler.invalid_count} invalid objects (may be because of boundaries)')
-    return osmholder.OSMHolder(handler.plazas, handler.buildings, handler.lines, handler.points)
+    invalid_count += handler.invalid_count
+    if invalid_count > 0:
+        logger.warning(f'encountered {invalid_count} invalid objects (may be because of boundaries)')
+    ways = handler.ways.build() if record_ways else None
+    return osmholder.OSMHolder(
+        plazas, handler.buildings.build(), handler.lines.build(), handler.points.build(), ways)
+
+
+def import_plazas(filename, tag_filters, observer=None):
+    """
+    only import the plazas of a OSM / PBF file, in the same order as import_osm.
+    The node and way methods of observer are called with every node and way of the file,
+    to collect other data in the same pass
+    """
+    logger.info(f'importing plazas of {filename}')
+    if observer is None:
+        plaza_handler = _PlazaAreaHandler(tag_filters)
+    else:
+        plaza_handler = _ObservedPlazaAreaHandler(tag_filters, observer)
+    _apply_handler(plaza_handler, filename)
+    if plaza_handler.invalid_count > 0:
+        logger.warning(f'encountered {plaza_handler.invalid_count} invalid plazas (may be because of boundaries)')
+    return _sort_plazas(plaza_handler.plazas)
+
+
+def _apply_handler(handler, filename):
+    index_type = 'sparse_mem_array'
+    handler.apply_file(filename, locations=True, idx=index_type)
+
 
+def _sort_plazas(plazas):
+    """ sort plazas by area id and polygon index, which is the order of their ID blocks in the merger """
+    return sorted(plazas, key=lambda plaza: (plaza['area_id'], plaza['polygon_index']))
 
-class _PlazaHandler(osmium.SimpleHandler):
+
+def _create_plaza_index(plazas):
+    """ create rtree index with the bounding boxes of all plazas """
+    plaza_index = rtree.index.Index()
+    for i, plaza in enumerate(plazas):
+        plaza_index.insert(i, plaza['geometry'].bounds)
+    return plaza_index
+
+
+def _get_way_bounds(way):
+    """ bounding box of a way with valid node locations """
+    lons = [node.lon for node in way.nodes]
+    lats = [node.lat for node in way.nodes]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+def _get_area_bounds(area):
+    """ bounding box of the outer rings of an area, None if it has no outer ring """
+    lons = [node.lon for ring in area.outer_rings() for node in ring]
+    lats = [node.lat for ring in area.outer_rings() for node in ring]
+    if not lons:
+        return None
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+class _AreaHandler(osmium.SimpleHandler):
+    """ base handler that creates plazas from areas """
     def __init__(self, tag_filters):
         super().__init__()
         self.tag_filters = tag_filters
         self.plazas = []
-        self.buildings = []
-        self.points = []
-        self.lines = []
         self.invalid_count = 0
 
+    def _add_plaza(self, area):
+        self._check_max_id(area.id)
+        multipolygon_geom = self._create_multipolygon(area)
+        if multipolygon_geom:
+            for polygon_index, polygon in enumerate(multipolygon_geom.geoms):
+                plaza = {
+                    'osm_id': area.orig_id(),
+                    'area_id': area.id,
+                    'polygon_index': polygon_index,
+                    'geometry': polygon
+                }
+                self.plazas.append(plaza)
+
+    def _create_multipolygon(self, area):
+        try:
+            building_wkb = WKBFAB.create_multipolygon(area)
+            return wkblib.loads(building_wkb, hex=True)
+
+        except InvalidLocationError:
+            logger.debug(f'Encountered invalid location in area {area.id}')
+            self.invalid_count += 1
+            return None
+        except RuntimeError as ex:
+            logger.debug(f'Error importing way {area.id}: {ex}')
+            self.invalid_count += 1
+            return None
+
+    def _is_plaza(self, area):
+        return configuration.filter_tags(area.tags, self.tag_filters['plaza'])
+
+    def _check_max_id(self, osm_id):
+        if osm_id >= OSM_MAX_ID:
+            logger.error(f"OSM id {osm_id} is larger than the allowed {OSM_MAX_ID}")
+
+
+class _PlazaAreaHandler(_AreaHandler):
+    """ first pass of the two pass import, only reads plazas """
+    def area(self, area):
+        if self._is_plaza(area):
+            self._add_plaza(area)
+
+
+class _ObservedPlazaAreaHandler(_PlazaAreaHandler):
+    """ reads plazas and passes all nodes and ways to an observer """
+    def __init__(self, tag_filters, observer):
+        super().__init__(tag_filters)
+        self.observer = observer
+
+    def node(self, node):
+        self.observer.node(node)
+
+    def way(self, way):
+        self.observer.way(way)
+
+
+class _PlazaHandler(_AreaHandler):
+    """ reads plazas and the lines, buildings and points used to process them.
+    With a plaza index, plazas are skipped and only objects that are near a plaza are kept.
+    With record_ways, the node lists, versions and tags of the lines near a plaza or in record_way_ids are kept
+    in ways """
+    def __init__(self, tag_filters, plaza_index=None, record_ways=False, record_way_ids=None):
+        super().__init__(tag_filters)
+        self.plaza_index = plaza_index
+        self.ways = osmholder.WayArrayBuilder() if record_ways else None
+        self.record_way_ids = record_way_ids or set()
+        self.buildings = osmholder.GeometryArrayBuilder()
+        self.points = osmholder.GeometryArrayBuilder()
+        self.lines = osmholder.LineArrayBuilder()
+
     def node(self, node):
         if self._is_relevant_node(node):
             self._check_max_id(node.id)
-            point_wkb = WKBFAB.create_point(node)
-            point_geometry = wkblib.loads(point_wkb, hex=True)
-            self.points.append(point_geometry)
+            location = node.location
+            bounds = (location.lon, location.lat, location.lon, location.lat)
+            if self._is_near_plaza(bounds):
+                self.points.append(bytes.fromhex(WKBFAB.create_point(node)), bounds)
 
     def way(self, way):
         if self._is_relevant_way(way):
             self._check_max_id(way.id)
             try:
-                line_wkb = WKBFAB.create_linestring(way)
-                line_geometry = wkblib.loads(line_wkb, hex=True)
-                self.lines.append({
-                    'id': way.id,
-                    'geometry': line_geometry,
-                    'tags': {t.k: t.v for t in way.tags}
-                })
+                bounds = _get_way_bounds(way)
+                if self._is_near_plaza(bounds):
+                    line_wkb = WKBFAB.create_linestring(way)
+                    flags = osmholder.LINE_IS_BARRIER if self._is_barrier(way) else 0
+                    self.lines.append(way.id, bytes.fromhex(line_wkb), bounds, flags)
+                    if self.ways is not None:
+                        self._record_way(way)
+                elif self.ways is not None and way.id in self.record_way_ids:
+                    self._record_way(way)
             except InvalidLocationError:
                 logger.debug(f'Encountered invalid location in way {way.id}')
                 self.invalid_count += 1
@@ -67,34 +207,36 @@ class _PlazaHandler(osmium.SimpleHandler):
 
     def area(self, area):
         if self._is_plaza(area):
-            self._check_max_id(area.id)
-            multipolygon_geom = self._create_multipolygon(area)
-            if multipolygon_geom:
-                for polygon in multipolygon_geom.geoms:
-                    plaza = {
-                        'osm_id': area.orig_id(),
-                        'geometry': polygon
-                    }
-                    self.plazas.append(plaza)
+            if self.plaza_index is None:
+                self._add_plaza(area)
 
         elif self._is_relevant_building(area):
+            # with a plaza index, the geometry is only created for buildings near a plaza
+            if self.plaza_index is not None and not self._is_area_near_plaza(area):
+                return
             geometry = self._create_multipolygon(area)
             if geometry:
-                self.buildings.append(geometry)
+                bounds = geometry.bounds
+                if self._is_near_plaza(bounds):
+                    self.buildings.append(geometry.wkb, bounds)
 
-    def _create_multipolygon(self, area):
-        try:
-            building_wkb = WKBFAB.create_multipolygon(area)
-            return wkblib.loads(building_wkb, hex=True)
+    def _record_way(self, way):
+        self.ways.append(
+            way.id, way.version, [node.ref for node in way.nodes], [(node.lon, node.lat) for node in way.nodes],
+            {t.k: t.v for t in way.tags})
 
+    def _is_near_plaza(self, bounds):
+        return self.plaza_index is None or self.plaza_index.count(bounds) > 0
+
+    def _is_area_near_plaza(self, area):
+        """ check the bounds of the outer rings, areas with invalid locations are counted as invalid """
+        try:
+            bounds = _get_area_bounds(area)
+            return bounds is not None and self._is_near_plaza(bounds)
         except InvalidLocationError:
             logger.debug(f'Encountered invalid location in area {area.id}')
             self.invalid_count += 1
-            return None
-        except RuntimeError as ex:
-            logger.debug(f'Error importing way {area.id}: {ex}')
-            self.invalid_count += 1
-            return None
+            return False
 
     def _is_relevant_node(self, node):
         return node.tags.get("level", "0") == "0" and \
@@ -105,16 +247,11 @@ class _PlazaHandler(osmium.SimpleHandler):
         return not way.is_closed() and \
             "highway" in way.tags or \
             way.tags.get("railway") == "tram" or \
-            configuration.filter_tags(way.tags, self.tag_filters['barrier'])
+            self._is_barrier(way)
 
-    def _is_plaza(self, area):
-        return configuration.filter_tags(area.tags, self.tag_filters['plaza'])
+    def _is_barrier(self, way):
+        return configuration.filter_tags(way.tags, self.tag_filters['barrier'])
 
     def _is_relevant_building(self, area):
         return "building" in area.tags \
             and area.tags.get("layer", "0") == "0"
-
-    def _check_max_id(self, osm_id):
-        if osm_id >= OSM_MAX_ID:
-            logger.error(f"OSM id {osm_id} is larger than the allowed {OSM_MAX_ID}")
-
@@ -1,8 +1,187 @@
+from array import array
+import numpy as np
+import shapely.wkb as wkblib
+
+# flags of imported lines
+LINE_IS_BARRIER = 1
+
 
 class OSMHolder:
-    """holder for importer OSM objects"""
-    def __init__(self, plazas, buildings, lines, points):
+    """
+    holder for importer OSM objects, buildings, lines and points are stored column-wise.
+    ways holds the node lists of the lines if they were recorded during the import
+    """
+    def __init__(self, plazas, buildings: 'GeometryArray', lines: 'LineArray', points: 'GeometryArray',
+                 ways: 'WayArray' = None):
         self.plazas = plazas
         self.buildings = buildings
         self.lines = lines
         self.points = points
+        self.ways = ways
+
+
+class GeometryArray:
+    """
+    geometries stored as concatenated WKB with their bounding boxes.
+    Shapely geometries are only created on access
+    """
+    def __init__(self, wkb_data: bytearray, offsets: np.ndarray, bounds: np.ndarray):
+        self.wkb_data = wkb_data
+        self.offsets = offsets
+        self.bounds = bounds
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return wkblib.loads(bytes(self.wkb_data[self.offsets[index]:self.offsets[index + 1]]))
+
+
+class LineArray:
+    """ lines with their OSM way ids and flags (e.g. LINE_IS_BARRIER) """
+    def __init__(self, geometries: GeometryArray, ids: np.ndarray, flags: np.ndarray):
+        self.geometries = geometries
+        self.ids = ids
+        self.flags = flags
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        """ return the line at index as dict with id, geometry and is_barrier """
+        return {
+            'id': int(self.ids[index]),
+            'geometry': self.geometries[index],
+            'is_barrier': bool(self.flags[index] & LINE_IS_BARRIER)
+        }
+
+    @property
+    def bounds(self):
+        return self.geometries.bounds
+
+
+class GeometryArrayBuilder:
+    """ collects geometries for a GeometryArray """
+    def __init__(self):
+        self._wkb_data = bytearray()
+        self._offsets = array('q', [0])
+        self._bounds = array('d')
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def append(self, geometry_wkb: bytes, bounds):
+        self._wkb_data += geometry_wkb
+        self._offsets.append(len(self._wkb_data))
+        self._bounds.extend(bounds)
+
+    def build(self) -> GeometryArray:
+        offsets = np.array(self._offsets, dtype=np.int64)
+        bounds = np.array(self._bounds, dtype=np.float64).reshape(-1, 4)
+        return GeometryArray(self._wkb_data, offsets, bounds)
+
+
+class LineArrayBuilder:
+    """ collects lines for a LineArray """
+    def __init__(self):
+        self._geometries = GeometryArrayBuilder()
+        self._ids = array('q')
+        self._flags = array('B')
+
+    def __len__(self):
+        return len(self._ids)
+
+    def append(self, osm_id: int, geometry_wkb: bytes, bounds, flags: int):
+        self._geometries.append(geometry_wkb, bounds)
+        self._ids.append(osm_id)
+        self._flags.append(flags)
+
+    def build(self) -> LineArray:
+        ids = np.array(self._ids, dtype=np.int64)
+        flags = np.array(self._flags, dtype=np.uint8)
+        return LineArray(self._geometries.build(), ids, flags)
+
+
+class WayArray:
+    """
+    node refs, node coordinates, versions and tags of OSM ways, looked up by way id.
+    The nodes of way i are node_refs[node_offsets[i]:node_offsets[i + 1]],
+    tags are stored as NUL separated keys and values
+    """
+    def __init__(self, ids: np.ndarray, versions: np.ndarray, node_offsets: np.ndarray, node_refs: np.ndarray,
+                 node_coords: np.ndarray, tag_data: bytearray, tag_offsets: np.ndarray):
+        self.ids = ids
+        self.versions = versions
+        self.node_offsets = node_offsets
+        self.node_refs = node_refs
+        self.node_coords = node_coords
+        self.tag_data = tag_data
+        self.tag_offsets = tag_offsets
+        self._sorted_indices = np.argsort(ids, kind='mergesort')
+        self._sorted_ids = ids[self._sorted_indices]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, way_id):
+        return self._find_index(way_id) is not None
+
+    def get_way(self, way_id) -> dict:
+        """ return a way as dict with version, nodes (id and coords of every node) and tags """
+        index = self._find_index(way_id)
+        if index is None:
+            raise KeyError(way_id)
+        start, end = self.node_offsets[index], self.node_offsets[index + 1]
+        return {
+            'version': int(self.versions[index]),
+            'nodes': [{'id': node_id, 'coords': tuple(coords)}
+                      for node_id, coords in zip(self.node_refs[start:end].tolist(),
+                                                 self.node_coords[start:end].tolist())],
+            'tags': self._get_tags(index)
+        }
+
+    def _find_index(self, way_id):
+        position = np.searchsorted(self._sorted_ids, way_id)
+        if position < len(self._sorted_ids) and self._sorted_ids[position] == way_id:
+            return self._sorted_indices[position]
+        return None
+
+    def _get_tags(self, index):
+        tag_bytes = self.tag_data[self.tag_offsets[index]:self.tag_offsets[index + 1]]
+        if not tag_bytes:
+            return {}
+        keys_and_values = bytes(tag_bytes).decode('utf-8').split('\0')
+        return dict(zip(keys_and_values[::2], keys_and_values[1::2]))
+
+
+class WayArrayBuilder:
+    """ collects ways for a WayArray """
+    def __init__(self):
+        self._ids = array('q')
+        self._versions = array('l')
+        self._node_offsets = array('q', [0])
+        self._node_refs = array('q')
+        self._node_coords = array('d')
+        self._tag_data = bytearray()
+        self._tag_offsets = array('q', [0])
+
+    def __len__(self):
+        return len(self._ids)
+
+    def append(self, way_id: int, version: int, node_refs, node_coords, tags: dict):
+        self._ids.append(way_id)
+        self._versions.append(version)
+        self._node_refs.extend(node_refs)
+        self._node_offsets.append(len(self._node_refs))
+        for lon, lat in node_coords:
+            self._node_coords.append(lon)
+            self._node_coords.append(lat)
+        self._tag_data += '\0'.join(part for tag in tags.items() for part in tag).encode('utf-8')
+        self._tag_offsets.append(len(self._tag_data))
+
+    def build(self) -> WayArray:
+        return WayArray(
+            np.array(self._ids, dtype=np.int64), np.array(self._versions, dtype=np.int64),
+            np.array(self._node_offsets, dtype=np.int64), np.array(self._node_refs, dtype=np.int64),
+            np.array(self._node_coords, dtype=np.float64).reshape(-1, 2),
+            self._tag_data, np.array(self._tag_offsets, dtype=np.int64))
@@ -0,0 +1,86 @@
+import logging
+from osmium import SimpleHandler
+"""
+Find the objects that were touched by OSM change files (.osc) and their bounds
+"""
+
+logger = logging.getLogger('plaza_preprocessing.incremental.changes')
+
+
+class Changes:
+    """ ids of all nodes, ways and relations in the change files and the new locations of the nodes """
+
+    def __init__(self):
+        self.node_ids = set()
+        self.way_ids = set()
+        self.relation_ids = set()
+        self.bounds = []
+
+    @property
+    def area_ids(self):
+        """ ids of the areas that osmium creates from the changed ways and relations """
+        return {way_id * 2 for way_id in self.way_ids} | {relation_id * 2 + 1 for relation_id in self.relation_ids}
+
+
+def read_changes(change_files) -> Changes:
+    """
+    read the touched objects of all change files.
+    The member ways of changed relations count as changed ways, so that the bounds of changed
+    multipolygons are found with find_changed_bounds
+    """
+    change_handler = _ChangeHandler()
+    for change_file in change_files:
+        change_handler.apply_file(change_file)
+    changes = change_handler.changes
+    logger.info(f"Changes touched {len(changes.node_ids)} nodes, {len(changes.way_ids)} ways "
+                f"and {len(changes.relation_ids)} relations")
+    return changes
+
+
+def find_changed_bounds(osm_file, changes: Changes):
+    """ bounds of the changed nodes and ways in osm_file, including ways with a changed node """
+    bounds_handler = ChangedBoundsHandler(changes)
+    bounds_handler.apply_file(osm_file, locations=True, idx='sparse_mem_array')
+    return bounds_handler.bounds
+
+
+class _ChangeHandler(SimpleHandler):
+
+    def __init__(self):
+        super().__init__()
+        self.changes = Changes()
+
+    def node(self, node):
+        self.changes.node_ids.add(node.id)
+        if node.visible and node.location.valid():
+            location = node.location
+            self.changes.bounds.append((location.lon, location.lat, location.lon, location.lat))
+
+    def way(self, way):
+        self.changes.way_ids.add(way.id)
+
+    def relation(self, relation):
+        self.changes.relation_ids.add(relation.id)
+        self.changes.way_ids.update(member.ref for member in relation.members if member.type == 'w')
+
+
+class ChangedBoundsHandler(SimpleHandler):
+    """ collects the bounds of changed objects, must be applied with locations """
+
+    def __init__(self, changes: Changes):
+        super().__init__()
+        self.changes = changes
+        self.bounds = []
+
+    def node(self, node):
+        if node.id in self.changes.node_ids and node.location.valid():
+            location = node.location
+            self.bounds.append((location.lon, location.lat, location.lon, location.lat))
+
+    def way(self, way):
+        if way.id in self.changes.way_ids or any(node.ref in self.changes.node_ids for node in way.nodes):
+            locations = [node.location for node in way.nodes if node.location.valid()]
+            if locations:
+                lons = [location.lon for location in locations]
+                lats = [location.lat for location in locations]
+                self.bounds.append((min(lons), min(lats), max(lons), max(lats)))
@@ -0,0 +1,276 @@
+import logging
+import os
+import shutil
+import tempfile
+import rtree
+from osmium import SimpleHandler, SimpleWriter
+from plaza_preprocessing.importer import importer
+from plaza_preprocessing.optimizer import optimizer, utils
+from plaza_preprocessing.merger import merger, plazatransformer
+from plaza_preprocessing.incremental import changes as osmchanges
+from plaza_preprocessing.incremental import plazaindex
+from plaza_preprocessing.incremental.plazaindex import get_plaza_key
+from plaza_preprocessing.report import Report
+"""
+Incremental preprocessing: only the plazas touched by OSM change files are processed again,
+the objects of all other plazas are copied from the previous processed file
+"""
+
+logger = logging.getLogger('plaza_preprocessing.incremental')
+
+
+def preprocess_changes(osm_file, out_file, previous_file, change_files, plaza_index_path,
+                       process_strategy, shortest_path_strategy, config, report: Report = None):
+    """
+    preprocess the plazas that are affected by the change files and write the result to out_file.
+    osm_file must be the original file with the changes applied, previous_file and the plaza index
+    must be the result of the last run (on osm_file without the changes).
+    previous_file is read once, osm_file three times (plazas, objects near affected plazas and the merge).
+    The plaza index is updated after the run
+    """
+    report = report or Report()
+    with tempfile.TemporaryDirectory() as tempdir:
+        previous_node_file = os.path.join(tempdir, 'previous_nodes.pbf')
+        previous_way_file = os.path.join(tempdir, 'previous_ways.pbf')
+        with report.stage('changes'):
+            changes = osmchanges.read_changes(change_files)
+            previous = _scan_previous_file(previous_file, changes, previous_node_file, previous_way_file)
+
+        with report.stage('import'):
+            source_bounds = osmchanges.ChangedBoundsHandler(changes)
+            plazas = importer.import_plazas(osm_file, config['tag-filter'], observer=source_bounds)
+        changed_bounds = previous.bounds + changes.bounds + source_bounds.bounds
+
+        with plazaindex.PlazaIndex(plaza_index_path) as plaza_index:
+            old_plazas = plaza_index.get_plazas()
+            margin = utils.meters_to_degrees(config['obstacle-buffer'] + config['entry-point-lookup-buffer'])
+            affected_keys = find_affected_plazas(
+                plazas, plaza_index, _expand_bounds(changed_bounds, margin), changes.area_ids, previous.dependencies)
+        kept_keys = (set(old_plazas) & {get_plaza_key(plaza) for plaza in plazas}) - affected_keys
+        affected_plazas = [plaza for plaza in plazas if get_plaza_key(plaza) in affected_keys]
+        logger.info(f"{len(affected_plazas)} of {len(plazas)} plazas are affected by the changes")
+
+        overflow_keys = set()
+        processed_plazas = []
+        ways = None
+        if affected_plazas:
+            with report.stage('import'):
+                # the entry ways of the kept plazas are recorded as well, the merger does not read osm_file for them
+                holder = importer.import_osm(osm_file, config['tag-filter'], plazas=affected_plazas,
+                                             record_ways=config.get('record-entry-ways', False),
+                                             record_way_ids=set(previous.entry_nodes))
+            ways = holder.ways
+            processed_plazas = track_overflow_plazas(optimizer.preprocess_plazas(
+                holder, process_strategy, shortest_path_strategy, config, report), overflow_keys)
+
+        plaza_node_file = os.path.join(tempdir, 'plaza_nodes.pbf')
+        plaza_way_file = os.path.join(tempdir, 'plaza_ways.pbf')
+        merged_file = os.path.join(tempdir, os.path.basename(out_file))
+
+        new_objects = _ObjectCollector()
+        with report.stage('transform'):
+            entry_node_mappings = plazatransformer.write_plazas(
+                processed_plazas, new_objects, new_objects, config['footway-tags'])
+
+        with report.stage('copy'):
+            _copy_plaza_objects(previous_node_file, previous_way_file, kept_keys, new_objects,
+                                plaza_node_file, plaza_way_file)
+        _add_kept_entry_nodes(entry_node_mappings, previous.entry_nodes, kept_keys)
+
+        merger.merge_plaza_files(plaza_node_file, plaza_way_file, entry_node_mappings, osm_file, merged_file,
+                                 config.get('merge-tool', 'pyosmium'), ways, report)
+        shutil.move(merged_file, out_file)
+
+    plazaindex.write_plaza_index(plaza_index_path, plazas, overflow_keys)
+
+
+def find_affected_plazas(plazas, plaza_index: plazaindex.PlazaIndex, changed_bounds, changed_area_ids,
+                         dependencies):
+    """
+    keys of the old and new plazas that have to be processed again. These are plazas that
+    - intersect with changed bounds or were changed themselves
+    - were added or removed, or used overflow IDs in the last run
+    - share nodes with another affected plaza (dependencies maps plazas to the plazas using their nodes)
+    """
+    old_plazas = plaza_index.get_plazas()
+    new_keys = {get_plaza_key(plaza) for plaza in plazas}
+    affected_keys = old_plazas.keys() ^ new_keys
+    affected_keys.update(key for key, overflow in old_plazas.items() if overflow)
+    affected_keys.update(key for key in new_keys if key[1] >= plazatransformer.MAX_POLYGONS_PER_AREA)
+    affected_keys.update(key for key in old_plazas.keys() | new_keys if key[0] in changed_area_ids)
+
+    new_plaza_index = rtree.index.Index()
+    for i, plaza in enumerate(plazas):
+        new_plaza_index.insert(i, plaza['geometry'].bounds)
+    for bounds in changed_bounds:
+        affected_keys.update(plaza_index.find_plazas(bounds))
+        affected_keys.update(get_plaza_key(plazas[i]) for i in new_plaza_index.intersection(bounds))
+
+    # plazas that use overflow nodes are always affected, overflow IDs are not stable
+    affected_keys.add(None)
+    affected_keys = _add_dependent_plazas(affected_keys, dependencies)
+    affected_keys.discard(None)
+    return affected_keys
+
+
+def track_overflow_plazas(plazas, overflow_keys: set):
+    """ yield the plazas and add the keys of the plazas that do not fit into their ID block to overflow_keys """
+    for plaza in plazas:
+        if plazatransformer.get_id_block_start(plaza) is None:
+            overflow_keys.add(get_plaza_key(plaza))
+        yield plaza
+
+
+def _add_dependent_plazas(affected_keys, dependencies):
+    affected_keys = set(affected_keys)
+    pending_keys = list(affected_keys)
+    while pending_keys:
+        for dependent_key in dependencies.get(pending_keys.pop(), ()):
+            if dependent_key not in affected_keys:
+                affected_keys.add(dependent_key)
+                pending_keys.append(dependent_key)
+    return affected_keys
+
+
+def _expand_bounds(bounds_list, margin):
+    return [(min_x - margin, min_y - margin, max_x + margin, max_y + margin)
+            for min_x, min_y, max_x, max_y in bounds_list]
+
+
+def _add_kept_entry_nodes(entry_node_mappings, previous_entry_nodes, kept_keys):
+    """ add the entry nodes of the kept plazas to the entry node mappings of the processed plazas """
+    for way_id, entry_nodes in previous_entry_nodes.items():
+        kept_entry_nodes = [node for node in entry_nodes
+                            if plazatransformer.get_id_block_plaza(node['id']) in kept_keys]
+        if kept_entry_nodes:
+            way_entry_nodes = entry_node_mappings.setdefault(way_id, [])
+            known_node_ids = {node['id'] for node in way_entry_nodes}
+            for node in kept_entry_nodes:
+                if node['id'] not in known_node_ids:
+                    known_node_ids.add(node['id'])
+                    way_entry_nodes.append(node)
+
+
+def _scan_previous_file(previous_file, changes, node_file, way_file):
+    """
+    collect the changed bounds, entry nodes and dependencies of the previous file
+    and write the objects of all plazas to node_file and way_file, in one pass
+    """
+    node_writer = SimpleWriter(node_file)
+    way_writer = SimpleWriter(way_file)
+    try:
+        previous = _PreviousFileHandler(changes, node_writer, way_writer)
+        previous.apply_file(previous_file, locations=True, idx='sparse_mem_array')
+    finally:
+        node_writer.close()
+        way_writer.close()
+    return previous
+
+
+def _copy_plaza_objects(previous_node_file, previous_way_file, kept_keys, new_objects, node_file, way_file):
+    """
+    write the objects of the kept plazas and the new objects sorted by id to the plaza files.
+    The previous files only contain plaza objects (see _scan_previous_file)
+    """
+    node_writer = SimpleWriter(node_file)
+    way_writer = SimpleWriter(way_file)
+    try:
+        copier = _PlazaObjectCopier(kept_keys, new_objects, node_writer, way_writer)
+        copier.apply_file(previous_node_file)
+        copier.apply_file(previous_way_file)
+        copier.finish()
+    finally:
+        node_writer.close()
+        way_writer.close()
+
+
+class _PreviousFileHandler(osmchanges.ChangedBoundsHandler):
+    """
+    collects the changed bounds, the entry nodes of the entry ways
+    and which plazas use nodes of other plazas in the previous processed file.
+    The nodes and ways of the plazas are written to the writers
+    """
+
+    def __init__(self, changes, node_writer, way_writer):
+        super().__init__(changes)
+        self.entry_nodes = {}
+        self.dependencies = {}
+        self.node_writer = node_writer
+        self.way_writer = way_writer
+
+    def node(self, node):
+        super().node(node)
+        if node.id > plazatransformer.OSM_ID_START:
+            self.node_writer.add_node(node)
+
+    def way(self, way):
+        if way.id < plazatransformer.OSM_ID_START:
+            super().way(way)
+            for node in way.nodes:
+                if node.ref > plazatransformer.OSM_ID_START:
+                    self.entry_nodes.setdefault(way.id, []).append({'id': node.ref, 'coords': (node.lon, node.lat)})
+            return
+
+        self.way_writer.add_way(way)
+        way_key = plazatransformer.get_id_block_plaza(way.id)
+        if way_key is None:
+            return
+        for node in way.nodes:
+            node_key = plazatransformer.get_id_block_plaza(node.ref)
+            if node_key != way_key:
+                self.dependencies.setdefault(node_key, set()).add(way_key)
+
+
+class _ObjectCollector:
+    """ writer that keeps the added nodes and ways in lists """
+
+    def __init__(self):
+        self.nodes = []
+        self.ways = []
+
+    def add_node(self, node):
+        self.nodes.append(node)
+
+    def add_way(self, way):
+        self.ways.append(way)
+
+
+class _PlazaObjectCopier(SimpleHandler):
+    """ copies the objects of the kept plazas, the new objects are added in between to keep the files sorted """
+
+    def __init__(self, kept_keys, new_objects: _ObjectCollector, node_writer, way_writer):
+        super().__init__()
+        self.kept_keys = kept_keys
+        self.new_nodes = sorted(new_objects.nodes, key=lambda node: node.id)
+        self.new_ways = sorted(new_objects.ways, key=lambda way: way.id)
+        self.node_writer = node_writer
+        self.way_writer = way_writer
+        self._next_node = 0
+        self._next_way = 0
+
+    def node(self, node):
+        if plazatransformer.get_id_block_plaza(node.id) in self.kept_keys:
+            self._add_new_nodes(node.id)
+            self.node_writer.add_node(node)
+
+    def way(self, way):
+        if plazatransformer.get_id_block_plaza(way.id) in self.kept_keys:
+            self._add_new_ways(way.id)
+            self.way_writer.add_way(way)
+
+    def finish(self):
+        """ add the new objects with larger ids than all copied objects """
+        self._add_new_nodes(None)
+        self._add_new_ways(None)
+
+    def _add_new_nodes(self, max_id):
+        while self._next_node < len(self.new_nodes) and \
+                (max_id is None or self.new_nodes[self._next_node].id < max_id):
+            self.node_writer.add_node(self.new_nodes[self._next_node])
+            self._next_node += 1
+
+    def _add_new_ways(self, max_id):
+        while self._next_way < len(self.new_ways) and \
+                (max_id is None or self.new_ways[self._next_way].id < max_id):
+            self.way_writer.add_way(self.new_ways[self._next_way])
+            self._next_way += 1
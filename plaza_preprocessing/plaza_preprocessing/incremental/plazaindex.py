@@ -0,0 +1,74 @@
+import logging
+import os
+import rtree
+"""
+Persisted spatial index with the bounds of the plazas of the last preprocessing run
+"""
+
+logger = logging.getLogger('plaza_preprocessing.incremental.plazaindex')
+
+INDEX_EXTENSIONS = ('.dat', '.idx')
+WORLD_BOUNDS = (-180.0, -90.0, 180.0, 90.0)
+
+
+def get_plaza_key(plaza):
+    """ plazas are identified by their area id and polygon index, which also define their ID block """
+    return plaza['area_id'], plaza['polygon_index']
+
+
+def index_exists(basename):
+    return all(os.path.exists(basename + extension) for extension in INDEX_EXTENSIONS)
+
+
+def write_plaza_index(basename, plazas, overflow_keys):
+    """
+    write the bounds of all plazas to a disk based rtree (basename.dat and basename.idx).
+    overflow_keys are the keys of the plazas that did not fit into their ID block.
+    The index is written to temporary files first, so an existing index stays intact on errors
+    """
+    temp_basename = basename + '-new'
+    _remove_index(temp_basename)
+    index = rtree.index.Index(temp_basename)
+    try:
+        for i, plaza in enumerate(plazas):
+            area_id, polygon_index = get_plaza_key(plaza)
+            overflow = (area_id, polygon_index) in overflow_keys
+            index.insert(i, plaza['geometry'].bounds, obj=(area_id, polygon_index, overflow))
+    finally:
+        index.close()
+    for extension in INDEX_EXTENSIONS:
+        os.replace(temp_basename + extension, basename + extension)
+    logger.info(f"Wrote index of {len(plazas)} plazas to {basename}")
+
+
+class PlazaIndex:
+    """ read access to an index written by write_plaza_index """
+
+    def __init__(self, basename):
+        if not index_exists(basename):
+            raise FileNotFoundError(f"Plaza index {basename} does not exist")
+        self._index = rtree.index.Index(basename)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def find_plazas(self, bounds):
+        """ keys of all plazas whose bounds intersect with bounds """
+        return {tuple(item.object[:2]) for item in self._index.intersection(bounds, objects=True)}
+
+    def get_plazas(self):
+        """ dict with the keys of all plazas and whether they used overflow IDs """
+        return {tuple(item.object[:2]): item.object[2]
+                for item in self._index.intersection(WORLD_BOUNDS, objects=True)}
+
+    def close(self):
+        self._index.close()
+
+
+def _remove_index(basename):
+    for extension in INDEX_EXTENSIONS:
+        if os.path.exists(basename + extension):
+            os.remove(basename + extension)
@@ -1,13 +1,14 @@
-from sys import maxsize
 from os import path
 import tempfile
 import logging
 from datetime import datetime
 from osmium import SimpleHandler, SimpleWriter
 from osmium.osm.mutable import Way
-from shapely.geometry import Point, LineString
+import numpy as np
 import plaza_preprocessing.merger.plazatransformer as plazatransformer
 import plaza_preprocessing.merger.osmosishelper as osmosishelper
+import plaza_preprocessing.merger.pyosmiumhelper as pyosmiumhelper
+from plaza_preprocessing.report import Report
 
 logger = logging.getLogger('plaza_preprocessing.merger')
 
@@ -29,27 +30,57 @@ class WayExtractor(SimpleHandler):
             }
 
 
-def merge_plaza_graphs(plazas, osm_file, merged_file, footway_tags):
+def merge_plaza_graphs(plazas, osm_file, merged_file, footway_tags, merge_tool='pyosmium', ways=None,
+                       report: Report = None):
     """
-    merge graph edges of plazas back into the original OSM file
+    merge graph edges of plazas back into the original OSM file.
+    plazas can be a generator, each plaza is written to a temporary file as soon as it is available.
+    merge_tool is either pyosmium or osmosis.
+    The entry ways are taken from ways (recorded by the importer) if given,
+    otherwise they are extracted from the original file.
+    The time of the transform, way extraction and merge stages is added to the report
     """
-    logger.info(f"Merging {len(plazas)} processed plazas back into {osm_file}")
+    report = report or Report()
+    logger.info(f"Merging processed plazas back into {osm_file}")
 
     with tempfile.TemporaryDirectory() as tempdir:
         plaza_way_file = path.join(tempdir, 'plaza_ways.pbf')
         plaza_node_file = path.join(tempdir, 'plaza_nodes.pbf')
-        modified_ways_file = path.join(tempdir, 'modified_ways.pbf')
 
-        entry_node_mappings = plazatransformer.transform_plazas(
-            plazas, plaza_node_file, plaza_way_file, footway_tags)
+        with report.stage('transform'):
+            entry_node_mappings = plazatransformer.transform_plazas(
+                plazas, plaza_node_file, plaza_way_file, footway_tags)
 
-        plaza_ways = _extract_plaza_ways(entry_node_mappings, osm_file)
-        _insert_entry_nodes(plaza_ways, entry_node_mappings)
+        merge_plaza_files(plaza_node_file, plaza_way_file, entry_node_mappings, osm_file, merged_file,
+                          merge_tool, ways, report)
 
-        _write_modified_ways(plaza_ways, modified_ways_file)
 
-        osmosishelper.merge_osm_files(
-            merged_file, osm_file, plaza_way_file, plaza_node_file, modified_ways_file)
+def merge_plaza_files(plaza_node_file, plaza_way_file, entry_node_mappings, osm_file, merged_file,
+                      merge_tool='pyosmium', ways=None, report: Report = None):
+    """
+    merge files with transformed plazas into the original OSM file
+    and insert the entry nodes (entry_node_mappings of the transformer) into the entry ways
+    """
+    report = report or Report()
+    with tempfile.TemporaryDirectory() as tempdir:
+        modified_ways_file = path.join(tempdir, 'modified_ways.pbf')
+
+        with report.stage('way extraction'):
+            if ways is not None:
+                plaza_ways = {way_id: ways.get_way(way_id) for way_id in entry_node_mappings if way_id in ways}
+            else:
+                plaza_ways = _extract_plaza_ways(entry_node_mappings, osm_file)
+            _insert_entry_nodes(plaza_ways, entry_node_mappings)
+
+        with report.stage('merge'):
+            if merge_tool == 'osmosis':
+                _write_modified_ways(plaza_ways, modified_ways_file)
+                osmosishelper.merge_osm_files(
+                    merged_file, osm_file, plaza_way_file, plaza_node_file, modified_ways_file)
+            else:
+                modified_ways = {way.id: way for way in _create_modified_ways(plaza_ways)}
+                pyosmiumhelper.merge_osm_files(
+                    merged_file, osm_file, plaza_node_file, plaza_way_file, modified_ways)
 
     logger.info(f"Merged OSM file written to {merged_file}")
 
@@ -59,85 +90,106 @@ def _insert_entry_nodes(plaza_ways, entry_node_mappings):
     for way_id, entry_nodes in entry_node_mappings.items():
         if way_id not in plaza_ways:
             raise RuntimeError(f"Way {way_id} was not found in original osm file")
-        way_nodes = plaza_ways.get(way_id).get('nodes')
+        way = plaza_ways.get(way_id)
         logger.debug(f"Inserting {len(entry_nodes)} entry point references into way {way_id}")
-        for entry_node in entry_nodes:
-            way_nodes = _insert_entry_node(entry_node, way_nodes)
+        way['nodes'] = _insert_way_entry_nodes(entry_nodes, way['nodes'])
 
 
-def _write_modified_ways(plaza_ways, filename):
+def _insert_way_entry_nodes(entry_nodes, way_nodes):
     """
-    write the modified ways to an OSM file
+    insert all entry nodes into way_nodes at once.
+    Entry nodes are sorted by the position they are inserted before and by their
+    distance along the segment, so that several entry nodes on the same segment keep their order
     """
-    logger.debug(f"Writing modified ways to {filename}")
-    ways = []
-    for way_id, way in plaza_ways.items():
-        node_refs = [node['id'] for node in way['nodes']]
-        osm_way = Way(nodes=node_refs)
-        osm_way.id = way_id
-        osm_way.tags = way['tags']
-        # increase version number to overwrite original way
-        osm_way.version = way['version'] + 1
-        osm_way.timestamp = _create_osm_timestamp()
-        ways.append(osm_way)
+    if not entry_nodes:
+        return way_nodes
+    positions, fractions = _find_insert_positions(entry_nodes, way_nodes)
+    order = np.lexsort((fractions, positions))
+
+    merged_nodes = []
+    next_entry = 0
+    for i, way_node in enumerate(way_nodes):
+        while next_entry < len(order) and positions[order[next_entry]] == i:
+            merged_nodes.append(entry_nodes[order[next_entry]])
+            next_entry += 1
+        merged_nodes.append(way_node)
+    merged_nodes.extend(entry_nodes[j] for j in order[next_entry:])
+    return merged_nodes
+
+
+def _find_insert_positions(entry_nodes, way_nodes):
+    """
+    return the index of the way node every entry node is inserted before
+    and the fraction along the segment ending at that node.
+    Entry nodes that are equal to a way node are inserted right before the first such node
+    """
+    entry_coords = np.array([node['coords'] for node in entry_nodes], dtype=float)
+    way_coords = np.array([node['coords'] for node in way_nodes], dtype=float).reshape(-1, 2)
 
-    writer = SimpleWriter(filename)
-    try:
-        for way in ways:
-            writer.add_way(way)
-    finally:
-        writer.close()
+    positions = np.full(len(entry_coords), len(way_coords), dtype=int)
+    fractions = np.ones(len(entry_coords))
+    if len(way_coords) > 1:
+        segment_indices, fractions = _project_onto_segments(entry_coords, way_coords)
+        positions = segment_indices + 1
 
+    exact_matches = (entry_coords[:, np.newaxis, :] == way_coords[np.newaxis, :, :]).all(axis=2)
+    is_exact = exact_matches.any(axis=1)
+    positions[is_exact] = exact_matches[is_exact].argmax(axis=1)
+    fractions[is_exact] = 1.0
+    return positions, fractions
 
-def _insert_entry_node(entry_node, way_nodes):
-    """ insert node reference in the correct position of way_nodes """
-    insert_position = _find_insert_position(entry_node, way_nodes)
-    way_nodes.insert(insert_position, entry_node)
-    return way_nodes
 
+def _project_onto_segments(points, line_coords):
+    """
+    project points onto the segments of a line.
+    Returns the index of the closest segment (the first one on ties)
+    and the fraction of the projected point along that segment
+    """
+    starts = line_coords[:-1]
+    vectors = line_coords[1:] - starts
+    squared_lengths = (vectors ** 2).sum(axis=1)
 
-def _find_insert_position(entry_node, way_nodes):
-    entry_point = Point(entry_node['coords'])
-    exact_match = _find_exact_insert_position(entry_point, way_nodes)
+    offsets = points[:, np.newaxis, :] - starts[np.newaxis, :, :]
+    dot_products = (offsets * vectors[np.newaxis, :, :]).sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fractions = np.where(squared_lengths > 0, dot_products / squared_lengths, 0.0)
+    fractions = np.clip(fractions, 0.0, 1.0)
 
-    return exact_match if exact_match is not None else (
-        _find_interpolated_insert_position(entry_point, way_nodes))
+    projected = starts[np.newaxis, :, :] + fractions[:, :, np.newaxis] * vectors[np.newaxis, :, :]
+    squared_distances = ((points[:, np.newaxis, :] - projected) ** 2).sum(axis=2)
+    segment_indices = squared_distances.argmin(axis=1)
+    return segment_indices, fractions[np.arange(len(points)), segment_indices]
 
 
-def _find_exact_insert_position(entry_point, way_nodes):
+def _write_modified_ways(plaza_ways, filename):
     """
-    try to find a point in the way_nodes that overlaps
-    the entry point exactly
+    write the modified ways to an OSM file
     """
-    for i, node in enumerate(way_nodes):
-        way_point = Point(node['coords'])
-        if way_point.equals(entry_point):
-            return i
-    return None
+    logger.debug(f"Writing modified ways to {filename}")
+    ways = _create_modified_ways(plaza_ways)
+
+    writer = SimpleWriter(filename)
+    try:
+        for way in ways:
+            writer.add_way(way)
+    finally:
+        writer.close()
 
 
-def _find_interpolated_insert_position(entry_point, way_nodes):
-    """
-    draws a line between pairs of way points and returns the
-    index of the end node of the line to which the entry point is
-    closest to
-    """
-    logger.debug(
-        f"Entry point {entry_point.coords} is not on way node, finding interpolated position")
-    min_node = {'pos': None, 'distance': maxsize}
-    for i in range(0, len(way_nodes) - 1):
-        start_node = way_nodes[i]
-        end_node = way_nodes[i + 1]
-        line = LineString(
-            [start_node['coords'], end_node['coords']])
-        distance = line.distance(entry_point)
-        if distance == 0:
-            return i + 1
-
-        if distance < min_node['distance']:
-            min_node['pos'] = i + 1
-            min_node['distance'] = distance
-    return min_node['pos']
+def _create_modified_ways(plaza_ways):
+    """ create osmium ways with the inserted entry nodes """
+    ways = []
+    timestamp = _create_osm_timestamp()
+    for way_id, way in plaza_ways.items():
+        node_refs = [node['id'] for node in way['nodes']]
+        osm_way = Way(nodes=node_refs)
+        osm_way.id = way_id
+        osm_way.tags = way['tags']
+        # increase version number to overwrite original way
+        osm_way.version = way['version'] + 1
+        osm_way.timestamp = timestamp
+        ways.append(osm_way)
+    return ways
 
 
 def _extract_plaza_ways(entry_node_mappings, osm_file):
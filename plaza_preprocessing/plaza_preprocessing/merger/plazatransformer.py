@@ -1,48 +1,114 @@
+import logging
 from datetime import datetime
 from osmium import SimpleWriter
 from osmium.osm.mutable import Way, Node
 
+logger = logging.getLogger('plaza_preprocessing.plazatransformer')
 
-OSM_ID_START = 10**10
+# well above the IDs of OSM (nodes are at about 1.2e10), generated IDs must sort after all original IDs
+OSM_ID_START = 2**40
+
+# Every plaza polygon gets its own block of node and way IDs:
+#   OSM_ID_START + (area_id * MAX_POLYGONS_PER_AREA + polygon_index) * ID_BLOCK_SIZE
+# Area IDs are unique across ways and relations, so blocks of different plazas never overlap
+# and the IDs of a plaza only depend on its own graph.
+# Collision policy: a plaza whose polygon index or number of nodes / ways does not fit into its block
+# (or that has no area id) gets a block from the overflow range above all regular blocks instead.
+# Overflow blocks are handed out in order and are not stable between runs.
+ID_BLOCK_SIZE = 2**20
+MAX_POLYGONS_PER_AREA = 2**6
+OVERFLOW_ID_START = 2**62
 
 
 def transform_plazas(plazas, node_file, way_file, footway_tags):
-    """ transforms plazas to OSM and write them to a file """
+    """
+    transforms plazas to OSM and write them to a file.
+    plazas can be any iterable, e.g. a generator of processed plazas. Every plaza is written
+    as soon as it is transformed, so only the plazas that need overflow IDs are kept until the end.
+    Plazas must be sorted by their ID blocks (see importer) to keep the files sorted by ID
+    """
     node_writer = SimpleWriter(node_file)
     way_writer = SimpleWriter(way_file)
-
-    entry_node_mappings = {}
-    osm_id_nodes = osm_id_ways = OSM_ID_START
-
     try:
-        for plaza in plazas:
-            if "graph_edges" not in plaza:
-                raise ValueError(f"No graph edges in {plaza['osm_id']}")
-            if "entry_points" not in plaza:
-                raise ValueError(f"No entry points in {plaza['osm_id']}")
+        return write_plazas(plazas, node_writer, way_writer, footway_tags)
+    finally:
+        node_writer.close()
+        way_writer.close()
 
-            transformer = PlazaTransformer(osm_id_nodes, osm_id_ways, footway_tags)
-            transformer.transform_plaza(plaza)
 
-            # merge entry node mappings
-            entry_node_mappings = {**entry_node_mappings, **transformer.entry_node_mappings}
+def write_plazas(plazas, node_writer, way_writer, footway_tags):
+    """ transform plazas like transform_plazas and add them to writers with add_node and add_way """
+    transformer = PlazaTransformer(OSM_ID_START, OSM_ID_START, footway_tags)
+    overflow_plazas = []
+    last_id_start = None
+    for plaza in plazas:
+        _validate_plaza(plaza)
+        id_start = get_id_block_start(plaza)
+        if id_start is None:
+            logger.warning(f"Plaza {plaza.get('osm_id')} does not fit into its ID block, using overflow IDs")
+            overflow_plazas.append(plaza)
+            continue
+        if last_id_start is not None and id_start < last_id_start:
+            raise ValueError(f"Plaza {plaza['osm_id']} is not sorted by its ID block")
+        last_id_start = id_start
+        _transform_plaza_in_block(transformer, plaza, id_start, node_writer, way_writer)
+
+    overflow_id = OVERFLOW_ID_START
+    for plaza in overflow_plazas:
+        _transform_plaza_in_block(transformer, plaza, overflow_id, node_writer, way_writer)
+        overflow_id += _count_needed_ids(plaza)
+    return transformer.entry_node_mappings
+
+
+def _validate_plaza(plaza):
+    if "graph_edges" not in plaza:
+        raise ValueError(f"No graph edges in {plaza['osm_id']}")
+    if "entry_points" not in plaza:
+        raise ValueError(f"No entry points in {plaza['osm_id']}")
+
+
+def _transform_plaza_in_block(transformer, plaza, id_start, node_writer, way_writer):
+    transformer.osm_id_nodes = transformer.osm_id_ways = id_start
+    transformer.transform_plaza(plaza)
+    transformer.flush(node_writer, way_writer)
+
+
+def get_id_block_start(plaza):
+    """ start of the ID block of a plaza or None if the plaza does not fit into a block """
+    if 'area_id' not in plaza or plaza['polygon_index'] >= MAX_POLYGONS_PER_AREA:
+        return None
+    if _count_needed_ids(plaza) > ID_BLOCK_SIZE:
+        return None
+    block_index = plaza['area_id'] * MAX_POLYGONS_PER_AREA + plaza['polygon_index']
+    return OSM_ID_START + block_index * ID_BLOCK_SIZE
+
+
+def get_id_block_plaza(osm_id):
+    """
+    area id and polygon index of the plaza whose ID block contains osm_id,
+    None for original IDs and overflow IDs
+    """
+    if not OSM_ID_START < osm_id <= OVERFLOW_ID_START:
+        return None
+    # IDs of a block start at its start + 1, see PlazaTransformer
+    block_index = (osm_id - OSM_ID_START - 1) // ID_BLOCK_SIZE
+    return divmod(block_index, MAX_POLYGONS_PER_AREA)
 
-            for node in transformer.nodes.values():
-                node_writer.add_node(node)
-            for way in transformer.ways:
-                way_writer.add_way(way)
 
-            osm_id_nodes += len(transformer.nodes)
-            osm_id_ways += len(transformer.ways)
-    finally:
-        node_writer.close()
-        way_writer.close()
-    return entry_node_mappings
+def _count_needed_ids(plaza):
+    """ upper bound for the number of node IDs, which is larger than the number of way IDs """
+    edge_coords = sum(len(edge.coords) for edge in plaza['graph_edges'])
+    entry_points = sum(len(entry_line['entry_points']) for entry_line in plaza['entry_lines'])
+    return edge_coords + entry_points
 
 
 class PlazaTransformer:
     """
-    Transforms plaza graph edges to an OSM Format
+    Transforms plaza graph edges to an OSM Format.
+    Nodes are shared between all transformed plazas, nodes and ways that were not yet
+    written are kept in nodes and ways until flush is called.
+    Every plaza uses up one node ID per coordinate, even if the node already exists
+    for another plaza, so that the IDs of a plaza do not depend on other plazas
     """
 
     def __init__(self, start_id_nodes, start_id_ways, footway_tags):
@@ -51,51 +117,71 @@ class PlazaTransformer:
         # use coordinates as keys and osmium objects as values
         self.nodes = {}
         self.ways = []
+        # node ids of all created nodes by coordinates
+        self.node_ids = {}
         # maps entry ways of plazas to entry node ids
         self.entry_node_mappings = {}
         self.footway_tags = [(key, value) for tag in footway_tags for key, value in tag.items()]
+        self.timestamp = _create_osm_timestamp()
 
     def transform_plaza(self, plaza):
         """ takes a plaza with edge geometries and constructs nodes and ways """
+        plaza_node_ids = {}
 
         for edge in plaza['graph_edges']:
-            self._create_way(edge)
+            self._create_way(edge, plaza_node_ids)
 
         for entry_line in plaza.get('entry_lines'):
-            self.entry_node_mappings[entry_line['way_id']] = [
-                {
-                    'id': self._get_node_id((p.x, p.y)),
-                    'coords': (p.x, p.y)
-                }
-                for p in entry_line['entry_points']]
-
-    def _create_way(self, edge):
+            entry_nodes = self.entry_node_mappings.setdefault(entry_line['way_id'], [])
+            known_node_ids = {node['id'] for node in entry_nodes}
+            for p in entry_line['entry_points']:
+                node_id = self._get_node_id((p.x, p.y), plaza_node_ids)
+                if node_id not in known_node_ids:
+                    known_node_ids.add(node_id)
+                    entry_nodes.append({'id': node_id, 'coords': (p.x, p.y)})
+
+    def flush(self, node_writer, way_writer):
+        """ write the new nodes and ways """
+        for node in self.nodes.values():
+            node_writer.add_node(node)
+        for way in self.ways:
+            way_writer.add_way(way)
+        self.nodes = {}
+        self.ways = []
+
+    def _create_way(self, edge, plaza_node_ids):
         """ create a way with corresponding nodes """
         node_refs = []
         for coords in edge.coords:
-            node_refs.append(self._get_node_id(coords))
+            node_refs.append(self._get_node_id(coords, plaza_node_ids))
         way_id = self._get_new_way_osm_id()
         way = Way(nodes=node_refs)
         way.tags = self.footway_tags
         way.id = way_id
         way.version = 1
-        way.timestamp = self._create_osm_timestamp()
+        way.timestamp = self.timestamp
         self.ways.append(way)
 
-    def _get_node_id(self, coords):
+    def _get_node_id(self, coords, plaza_node_ids):
         """
         get a node id for the coords, creates a new node if it doesn't exist yet
         """
-        if coords in self.nodes:
-            return self.nodes[coords].id
+        if coords in plaza_node_ids:
+            return plaza_node_ids[coords]
+
+        node_id = self._get_new_node_osm_id()
+        if coords in self.node_ids:
+            # node of another plaza, the new ID stays unused
+            node_id = self.node_ids[coords]
         else:
-            node_id = self._get_new_node_osm_id()
             node = Node(location=coords)
             node.id = node_id
             node.version = 1
-            node.timestamp = self._create_osm_timestamp()
+            node.timestamp = self.timestamp
             self.nodes[coords] = node
-            return node_id
+            self.node_ids[coords] = node_id
+        plaza_node_ids[coords] = node_id
+        return node_id
 
     def _get_new_node_osm_id(self):
         self.osm_id_nodes += 1
@@ -105,6 +191,7 @@ class PlazaTransformer:
         self.osm_id_ways += 1
         return self.osm_id_ways
 
-    def _create_osm_timestamp(self):
-        now = datetime.utcnow()
-        return now.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def _create_osm_timestamp():
+    now = datetime.utcnow()
+    return now.strftime('%Y-%m-%dT%H:%M:%SZ')
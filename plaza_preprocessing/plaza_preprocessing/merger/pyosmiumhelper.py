@@ -0,0 +1,106 @@
+import logging
+import os
+from osmium import SimpleHandler, SimpleWriter
+"""
+Merge files together with pyosmium in a single pass over the original file
+"""
+
+
+logger = logging.getLogger('plaza_preprocessing.pyosmiumhelper')
+
+
+def merge_osm_files(out_file, osm_file, plaza_node_file, plaza_way_file, modified_ways):
+    """
+    stream osm_file to out_file, replacing the ways in modified_ways (dict of way id to osmium way).
+    The nodes and ways of the plaza files have larger IDs than any original object
+    and are appended after the original nodes and ways to keep the output sorted
+    """
+    logger.debug(f"Merging {osm_file}, {plaza_node_file} and {plaza_way_file} to {out_file}")
+    if os.path.exists(out_file):
+        os.remove(out_file)
+
+    writer = SimpleWriter(out_file)
+    try:
+        merge_handler = _MergeHandler(writer, plaza_node_file, plaza_way_file, modified_ways)
+        merge_handler.apply_file(osm_file)
+        merge_handler.finish()
+    finally:
+        writer.close()
+
+    if merge_handler.replaced_way_ids != set(modified_ways):
+        missing_way_ids = set(modified_ways) - merge_handler.replaced_way_ids
+        raise RuntimeError(f"Ways {missing_way_ids} were not found in original osm file")
+
+
+class _MergeHandler(SimpleHandler):
+    """
+    copies all objects to the writer, the plaza files are copied when the next object type starts.
+    The plaza objects must have larger IDs than the original objects of the same type
+    """
+
+    def __init__(self, writer, plaza_node_file, plaza_way_file, modified_ways):
+        super().__init__()
+        self.writer = writer
+        self.plaza_node_file = plaza_node_file
+        self.plaza_way_file = plaza_way_file
+        self.modified_ways = modified_ways
+        self.replaced_way_ids = set()
+        self._nodes_appended = False
+        self._ways_appended = False
+        self._max_node_id = 0
+        self._max_way_id = 0
+
+    def node(self, node):
+        self._max_node_id = max(self._max_node_id, node.id)
+        self.writer.add_node(node)
+
+    def way(self, way):
+        self._append_plaza_nodes()
+        self._max_way_id = max(self._max_way_id, way.id)
+        modified_way = self.modified_ways.get(way.id)
+        if modified_way is not None:
+            self.replaced_way_ids.add(way.id)
+            self.writer.add_way(modified_way)
+        else:
+            self.writer.add_way(way)
+
+    def relation(self, relation):
+        self._append_plaza_ways()
+        self.writer.add_relation(relation)
+
+    def finish(self):
+        """ append the plaza objects that were not written yet """
+        self._append_plaza_ways()
+
+    def _append_plaza_nodes(self):
+        if not self._nodes_appended:
+            self._nodes_appended = True
+            _CopyHandler(self.writer, self._max_node_id).apply_file(self.plaza_node_file)
+
+    def _append_plaza_ways(self):
+        self._append_plaza_nodes()
+        if not self._ways_appended:
+            self._ways_appended = True
+            _CopyHandler(self.writer, self._max_way_id).apply_file(self.plaza_way_file)
+
+
+class _CopyHandler(SimpleHandler):
+    """ copies nodes and ways to the writer, their IDs must be larger than max_original_id """
+
+    def __init__(self, writer, max_original_id):
+        super().__init__()
+        self.writer = writer
+        self.max_original_id = max_original_id
+
+    def node(self, node):
+        self._check_id(node.id)
+        self.writer.add_node(node)
+
+    def way(self, way):
+        self._check_id(way.id)
+        self.writer.add_way(way)
+
+    def _check_id(self, osm_id):
+        if osm_id <= self.max_original_id:
+            raise RuntimeError(f"Generated ID {osm_id} is not larger than the largest original ID "
+                               f"{self.max_original_id}, the output would not be sorted")
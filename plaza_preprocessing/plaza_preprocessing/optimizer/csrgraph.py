@@ -0,0 +1,100 @@
+import heapq
+from typing import List, Dict, Iterable, Optional, Tuple
+import numpy as np
+from shapely.geometry import LineString
+from plaza_preprocessing.optimizer.grapharrays import GraphArrays
+
+
+class CSRGraph:
+    """
+    undirected graph with integer node ids.
+    The edges of every node are stored in compressed sparse row (CSR) format:
+    the neighbours of node i are indices[indptr[i]:indptr[i + 1]] with the corresponding weights
+    """
+
+    def __init__(self, coords: np.ndarray, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray):
+        self.coords = coords
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self._node_ids = {tuple(c): i for i, c in enumerate(coords.tolist())}
+        # python lists are a lot faster than numpy arrays for element-wise access in the search loop
+        self._indptr_list = indptr.tolist()
+        self._indices_list = indices.tolist()
+        self._weights_list = weights.tolist()
+
+    @classmethod
+    def from_lines(cls, graph_edges: List[LineString]) -> 'CSRGraph':
+        """ create a graph from lines, the weight of an edge is the length of its line """
+        return cls.from_graph_arrays(GraphArrays.from_lines(graph_edges))
+
+    @classmethod
+    def from_graph_arrays(cls, graph_arrays: GraphArrays) -> 'CSRGraph':
+        """ create a graph from the arrays of a graph processor, nodes without edges are left out """
+        node_ids = np.unique(graph_arrays.edges)
+        edges = np.searchsorted(node_ids, graph_arrays.edges)
+        return cls.from_edges(graph_arrays.coords[node_ids], edges, graph_arrays.weights)
+
+    @classmethod
+    def from_edges(cls, coords: np.ndarray, edges: np.ndarray, weights: np.ndarray) -> 'CSRGraph':
+        """ create a graph from node coordinates and pairs of node ids with their weights """
+        sources = np.concatenate([edges[:, 0], edges[:, 1]])
+        targets = np.concatenate([edges[:, 1], edges[:, 0]])
+        both_weights = np.concatenate([weights, weights])
+
+        order = np.argsort(sources, kind='mergesort')
+        indptr = np.zeros(len(coords) + 1, dtype=int)
+        np.cumsum(np.bincount(sources, minlength=len(coords)), out=indptr[1:])
+        return cls(coords, indptr, targets[order], both_weights[order])
+
+    @property
+    def number_of_nodes(self) -> int:
+        return len(self.coords)
+
+    @property
+    def number_of_edges(self) -> int:
+        return len(self.indices) // 2
+
+    def get_node_id(self, coords: Tuple[float, float]) -> Optional[int]:
+        """ return the node id of the coordinates, None if there is no such node """
+        return self._node_ids.get(coords)
+
+    def get_coords(self, node_id: int) -> Tuple[float, float]:
+        return tuple(self.coords[node_id])
+
+    def dijkstra(self, source: int, targets: Iterable[int]) -> Dict[int, List[int]]:
+        """
+        compute the shortest paths from source to all targets.
+        The search stops as soon as all targets are settled.
+        :return: paths as lists of node ids for every reachable target
+        """
+        indptr, indices, weights = self._indptr_list, self._indices_list, self._weights_list
+        remaining = set(targets)
+        remaining.discard(source)
+        distances = {source: 0.0}
+        predecessors = {source: None}
+        settled = set()
+        heap = [(0.0, source)]
+        while heap and remaining:
+            distance, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            remaining.discard(node)
+            for i in range(indptr[node], indptr[node + 1]):
+                neighbour = indices[i]
+                neighbour_distance = distance + weights[i]
+                if neighbour_distance < distances.get(neighbour, float('inf')):
+                    distances[neighbour] = neighbour_distance
+                    predecessors[neighbour] = node
+                    heapq.heappush(heap, (neighbour_distance, neighbour))
+
+        return {target: self._build_path(predecessors, target)
+                for target in targets if target in settled and target != source}
+
+    def _build_path(self, predecessors, target):
+        path = [target]
+        while predecessors[path[-1]] is not None:
+            path.append(predecessors[path[-1]])
+        path.reverse()
+        return path
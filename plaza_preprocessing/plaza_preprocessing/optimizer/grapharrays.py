@@ -0,0 +1,39 @@
+from typing import List
+import numpy as np
+from shapely.geometry import LineString
+
+
+class GraphArrays:
+    """
+    graph edges without geometries: node coordinates, pairs of node ids and the length of every edge.
+    Graph processors return this, so that no LineString has to be created for edges that are not part of a path
+    """
+
+    def __init__(self, coords: np.ndarray, edges: np.ndarray, weights: np.ndarray = None):
+        self.coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        self.edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+        self.weights = _calc_lengths(self.coords, self.edges) if weights is None else np.asarray(weights, dtype=float)
+
+    @classmethod
+    def from_lines(cls, graph_edges: List[LineString]) -> 'GraphArrays':
+        """ create the arrays from lines, the weight of an edge is the length of its line """
+        if not graph_edges:
+            return cls(np.empty((0, 2)), np.empty((0, 2), dtype=int), np.empty(0))
+        endpoints = np.array([line.coords[0] + line.coords[-1] for line in graph_edges], dtype=float)
+        coords, inverse = np.unique(endpoints.reshape(-1, 2), axis=0, return_inverse=True)
+        weights = np.array([line.length for line in graph_edges], dtype=float)
+        return cls(coords, inverse.reshape(-1, 2), weights)
+
+    def __len__(self):
+        return len(self.edges)
+
+    def to_lines(self) -> List[LineString]:
+        """ create a LineString for every edge """
+        coords = self.coords.tolist()
+        return [LineString([coords[start], coords[end]]) for start, end in self.edges.tolist()]
+
+
+def _calc_lengths(coords, edges):
+    """ euclidean length of every edge """
+    delta = coords[edges[:, 1]] - coords[edges[:, 0]]
+    return np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
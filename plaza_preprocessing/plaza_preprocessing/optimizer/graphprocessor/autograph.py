@@ -0,0 +1,118 @@
+import logging
+import time
+from math import log2
+from typing import List
+from shapely.geometry import Point, LineString, Polygon
+from plaza_preprocessing.optimizer import utils
+from plaza_preprocessing.optimizer.grapharrays import GraphArrays
+from plaza_preprocessing.optimizer.graphprocessor.graphprocessor import GraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import ReflexVisibilityGraphProcessor, \
+    get_reflex_coords
+from plaza_preprocessing.optimizer.graphprocessor.rotationalsweep import RotationalSweepGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.lazyvisibility import LazyVisibilityGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.navmeshgraph import NavMeshGraphProcessor
+
+logger = logging.getLogger('plaza_preprocessing.optimizer')
+
+# how much longer than the shortest possible paths the paths of a strategy are at most.
+# The navmesh value was measured on the plazas of the test files, the longest path was 4.4% longer.
+# The adaptive spider web is not considered: its paths were up to several times longer on the same plazas
+# and it can leave entry points near the boundary unconnected
+STRATEGY_DETOURS = {
+    'visibility-reflex': 1.0,
+    'visibility-sweep': 1.0,
+    'visibility-lazy': 1.0,
+    'navmesh': 1.05
+}
+
+# seconds of the cost model, fitted to the graph times of the plazas in the test files.
+# Every strategy has a fixed overhead and a time per unit of work.
+# The estimated and actual times are logged for every plaza to tune them
+_STRATEGY_OVERHEAD_S = {
+    'visibility-reflex': 5.8e-4,
+    'visibility-sweep': 4.2e-4,
+    'visibility-lazy': 5.8e-4,
+    'navmesh': 3.2e-4
+}
+_REFLEX_CHECK_S = 1.8e-7  # one pair of reflex vertices and entry points checked against one polygon vertex
+_SWEEP_STEP_S = 1.6e-6  # one vertex pair of the rotational sweep, times log2 of the vertex count
+_LAZY_CHECK_S = 8.4e-9  # line from a vertex expanded by the search of an entry point to a node, per polygon vertex
+_NAVMESH_STEP_S = 3.6e-5  # one vertex of the plaza in the portal graph search from an entry point
+
+
+class AutoGraphProcessor(GraphProcessor):
+    """
+    process every plaza with the strategy that has the lowest estimated cost.
+    Only strategies whose paths are at most max_detour times longer than the shortest paths are considered
+    """
+
+    def __init__(self, visibility_delta_m, max_detour):
+        processors = {
+            'visibility-reflex': ReflexVisibilityGraphProcessor(visibility_delta_m),
+            'visibility-sweep': RotationalSweepGraphProcessor(visibility_delta_m),
+            'visibility-lazy': LazyVisibilityGraphProcessor(visibility_delta_m),
+            'navmesh': NavMeshGraphProcessor(visibility_delta_m)
+        }
+        self.processors = {name: processor for name, processor in processors.items()
+                           if STRATEGY_DETOURS[name] <= max_detour}
+        if not self.processors:
+            raise ValueError(f"no graph strategy has paths within a detour of {max_detour}")
+        # the strategy of the plaza that is currently processed, optimize_lines uses the same one
+        self._strategy = None
+        self._stats = {}
+
+    def create_graph_edges(self, plaza_geometry: Polygon, entry_points: List[Point]) -> List[LineString]:
+        """ create the graph edges with the cheapest strategy for the plaza """
+        return self.create_graph(plaza_geometry, entry_points).to_lines()
+
+    def create_graph(self, plaza_geometry: Polygon, entry_points: List[Point]) -> GraphArrays:
+        """ create the graph with the cheapest strategy for the plaza and log the estimated and actual cost """
+        if not plaza_geometry:
+            raise ValueError("Plaza geometry not defined for auto graph processor")
+        if not entry_points:
+            raise ValueError("No entry points defined for graph processor")
+
+        costs = self.estimate_costs(plaza_geometry, entry_points)
+        self._strategy = min(costs, key=costs.get)
+        start_time = time.perf_counter()
+        graph_arrays = self.processors[self._strategy].create_graph(plaza_geometry, entry_points)
+        actual_time = time.perf_counter() - start_time
+
+        logger.info(f"Using {self._strategy} graph, estimated {costs[self._strategy]:.3f} s, took {actual_time:.3f} s")
+        logger.debug("Estimated graph costs: " + ", ".join(f"{name} {cost:.3f} s" for name, cost in costs.items()))
+        self._stats = {
+            **self.processors[self._strategy].get_stats(),
+            'graph_strategy': self._strategy,
+            'estimated_graph_time_s': costs[self._strategy],
+            'graph_time_s': actual_time
+        }
+        return graph_arrays
+
+    def optimize_lines(self, plaza_geometry: Polygon, lines: List[LineString], tolerance_m: float) -> List[LineString]:
+        """ optimize the lines with the strategy that created the graph """
+        return self.processors[self._strategy].optimize_lines(plaza_geometry, lines, tolerance_m)
+
+    def get_stats(self) -> dict:
+        return self._stats
+
+    def estimate_costs(self, plaza_geometry: Polygon, entry_points: List[Point]) -> dict:
+        """
+        estimate the time in seconds every strategy takes to create the graph of a plaza,
+        from the vertex, hole, reflex vertex and entry point count
+        """
+        vertices = len(utils.get_polygon_coords(plaza_geometry))
+        holes = len(plaza_geometry.interiors)
+        entries = len(entry_points)
+        reflex_vertices = len(get_reflex_coords(plaza_geometry))
+
+        nodes = vertices + entries
+        reflex_nodes = reflex_vertices + entries
+        # A* only has to expand vertices if a direct line is blocked, which needs holes or reflex vertices
+        expanded_nodes = min(nodes, reflex_vertices + holes)
+        work = {
+            'visibility-reflex': _REFLEX_CHECK_S * reflex_nodes * (reflex_nodes - 1) / 2 * vertices,
+            'visibility-sweep': _SWEEP_STEP_S * nodes * nodes * log2(max(nodes, 2)),
+            'visibility-lazy': _LAZY_CHECK_S * entries * expanded_nodes * nodes * vertices,
+            'navmesh': _NAVMESH_STEP_S * entries * nodes
+        }
+        return {name: _STRATEGY_OVERHEAD_S[name] + cost for name, cost in work.items() if name in self.processors}
@@ -1,6 +1,7 @@
 import abc
 from typing import List
 from shapely.geometry import Polygon, Point, LineString
+from plaza_preprocessing.optimizer.grapharrays import GraphArrays
 
 
 class GraphProcessor(metaclass=abc.ABCMeta):
@@ -12,6 +13,20 @@ class GraphProcessor(metaclass=abc.ABCMeta):
         """
         pass
 
+    def create_graph(self, plaza_geometry: Polygon, entry_points: List[Point]) -> GraphArrays:
+        """
+        create the graph edges as arrays of node coordinates and node id pairs.
+        Processors that find their edges between known vertices override this to skip creating LineStrings
+        """
+        return GraphArrays.from_lines(self.create_graph_edges(plaza_geometry, entry_points))
+
+    def get_stats(self) -> dict:
+        """
+        statistics about the last created graph, they are added to the plaza statistics of the report.
+        Processors report the number of possible edges they considered as candidate_edges
+        """
+        return {}
+
     def optimize_lines(self, plaza_geometry: Polygon, lines: List[LineString], tolerance_m: float) -> List[LineString]:
         """
         optimize or simplify a list of shortest paths
@@ -0,0 +1,115 @@
+import heapq
+from itertools import count
+import numpy as np
+from plaza_preprocessing.optimizer import utils
+from plaza_preprocessing.optimizer.grapharrays import GraphArrays
+from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import VisibilityGraphProcessor
+
+
+class LazyVisibilityGraphProcessor(VisibilityGraphProcessor):
+    """
+    process a plaza with A* searches over the implicit visibility graph.
+    The neighbours of a vertex are only checked for visibility when the vertex is expanded,
+    so most of the visibility graph is never built. Only the edges of the shortest paths are returned
+    """
+
+    def create_graph(self, plaza_geometry, entry_points):
+        """ find the shortest paths between all entry points and return their edges """
+        if not plaza_geometry:
+            raise ValueError("Plaza geometry not defined for lazy visibility graph processor")
+        if not entry_points:
+            raise ValueError("No entry points defined for graph processor")
+
+        entry_coords = sorted(set((p.x, p.y) for p in entry_points))
+        graph_coords = set(self._get_graph_coords(plaza_geometry)).difference(entry_coords)
+        # entry points come first, their index is the same as in entry_coords
+        all_coords = np.array(entry_coords + sorted(graph_coords))
+        visibility = _LazyVisibility(plaza_geometry, all_coords, self.visibility_delta_m)
+
+        # the straight line between two entry points is the shortest path if it is visible
+        start_ids, end_ids = np.triu_indices(len(entry_coords), k=1)
+        direct_visible = visibility.check_pairs(start_ids, end_ids)
+
+        path_edges = set()
+        for start_id, end_id, visible in zip(start_ids.tolist(), end_ids.tolist(), direct_visible):
+            if visible:
+                path_edges.add((start_id, end_id))
+                continue
+            path = _astar_path(visibility, start_id, end_id)
+            if path is None:
+                continue
+            path_edges.update((min(u, v), max(u, v)) for u, v in zip(path, path[1:]))
+
+        self._stats = {'candidate_edges': visibility.checked_pair_count()}
+        return GraphArrays(all_coords, sorted(path_edges))
+
+
+class _LazyVisibility:
+    """ visibility between the vertices of a plaza, checked on demand and memoized """
+
+    def __init__(self, plaza_geometry, coords, visibility_delta_m):
+        self.plaza_geometry = plaza_geometry
+        self.coords = coords
+        self.visibility_delta_m = visibility_delta_m
+        # visibility of the checked pairs, keyed by (smaller id, larger id)
+        self._visible = {}
+        self._neighbours = {}
+
+    def check_pairs(self, start_ids, end_ids):
+        """ check the visibility of the pairs of vertices that are not memoized yet, returns all results """
+        pairs = [(min(u, v), max(u, v)) for u, v in zip(np.asarray(start_ids).tolist(), np.asarray(end_ids).tolist())]
+        unknown = [pair for pair in set(pairs) if pair not in self._visible and pair[0] != pair[1]]
+        if unknown:
+            unknown_ids = np.array(unknown, dtype=int)
+            candidate_lines = np.stack([self.coords[unknown_ids[:, 0]], self.coords[unknown_ids[:, 1]]], axis=1)
+            visible = utils.lines_visible(self.plaza_geometry, candidate_lines, self.visibility_delta_m)
+            self._visible.update(zip(unknown, np.asarray(visible, dtype=bool).tolist()))
+        return np.array([self._visible.get(pair, False) for pair in pairs], dtype=bool)
+
+    def checked_pair_count(self):
+        return len(self._visible)
+
+    def neighbours(self, vertex_id):
+        """ ids of all vertices that are visible from the vertex """
+        if vertex_id not in self._neighbours:
+            other_ids = np.arange(len(self.coords))
+            visible = self.check_pairs(np.full(len(other_ids), vertex_id), other_ids)
+            self._neighbours[vertex_id] = other_ids[visible]
+        return self._neighbours[vertex_id]
+
+    def distances(self, vertex_id, other_ids):
+        """ euclidean distances between a vertex and other vertices """
+        delta = self.coords[other_ids] - self.coords[vertex_id]
+        return np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+
+
+def _astar_path(visibility: _LazyVisibility, start_id, end_id):
+    """ A* search with the direct distance as heuristic, returns the vertex ids of the path or None """
+    tie_breaker = count()
+    goal_distance = visibility.distances(end_id, [start_id])[0]
+    queue = [(goal_distance, next(tie_breaker), start_id, 0.0)]
+    distances = {start_id: 0.0}
+    predecessors = {start_id: None}
+    expanded = set()
+    while queue:
+        _, _, vertex_id, distance = heapq.heappop(queue)
+        if vertex_id in expanded:
+            continue
+        if vertex_id == end_id:
+            path = [vertex_id]
+            while predecessors[path[-1]] is not None:
+                path.append(predecessors[path[-1]])
+            return path[::-1]
+        expanded.add(vertex_id)
+
+        neighbour_ids = visibility.neighbours(vertex_id)
+        neighbour_distances = distance + visibility.distances(vertex_id, neighbour_ids)
+        heuristics = visibility.distances(end_id, neighbour_ids)
+        for neighbour_id, neighbour_distance, heuristic in zip(
+                neighbour_ids.tolist(), neighbour_distances.tolist(), heuristics.tolist()):
+            if neighbour_distance < distances.get(neighbour_id, float('inf')):
+                distances[neighbour_id] = neighbour_distance
+                predecessors[neighbour_id] = vertex_id
+                heapq.heappush(queue, (neighbour_distance + heuristic, next(tie_breaker), neighbour_id,
+                                       neighbour_distance))
+    return None
@@ -0,0 +1,318 @@
+import heapq
+from typing import List
+import numpy as np
+from shapely.geometry import Point, LineString, Polygon, MultiPoint
+from shapely.ops import triangulate
+from shapely.prepared import prep
+from plaza_preprocessing.optimizer import utils
+from plaza_preprocessing.optimizer.graphprocessor.graphprocessor import GraphProcessor
+
+# maximum number of times missing boundary segments are split before the triangulation is used as it is
+_MAX_DENSIFY_ITERATIONS = 10
+# boundary segments shorter than this (in degrees) are not split any further
+_MIN_SEGMENT_LENGTH = 1e-7
+# positions along a portal where the corridor search can cross it, as fractions of the portal
+_PORTAL_FRACTIONS = (0, 0.25, 0.5, 0.75, 1)
+
+
+class NavMeshGraphProcessor(GraphProcessor):
+    """
+    process a plaza with a navigation mesh: the plaza is triangulated,
+    the corridor of triangles between two entry points is searched in a graph of points on the portals
+    between the triangles and pulled taut with the funnel algorithm
+    """
+
+    def __init__(self, visibility_delta_m):
+        self.visibility_delta_m = visibility_delta_m
+        self._stats = {}
+
+    def create_graph_edges(self, plaza_geometry: Polygon, entry_points: List[Point]) -> List[LineString]:
+        """ create the funnel paths between all pairs of entry points """
+        if not plaza_geometry:
+            raise ValueError("Plaza geometry not defined for navmesh processor")
+        if not entry_points:
+            raise ValueError("No entry points defined for navmesh processor")
+
+        mesh = NavMesh(plaza_geometry, [(p.x, p.y) for p in entry_points], self.visibility_delta_m)
+        # the paths can only bend at the vertices of the triangles, their edges are the possible edges
+        self._stats = {'candidate_edges': mesh.get_edge_count()}
+        segments = set()
+        for path in mesh.find_paths():
+            for start, end in zip(path, path[1:]):
+                if start != end:
+                    segments.add(tuple(sorted((start, end))))
+        return [LineString(segment) for segment in sorted(segments)]
+
+    def get_stats(self) -> dict:
+        return self._stats
+
+
+class NavMesh:
+    """
+    triangulation of a plaza polygon. The boundary is densified until all boundary segments are edges
+    of the Delaunay triangulation (a conforming Delaunay triangulation), so every triangle is either
+    completely inside or completely outside of the plaza
+    """
+
+    def __init__(self, plaza_geometry: Polygon, entry_coords, visibility_delta_m):
+        self.entry_coords = list(dict.fromkeys(entry_coords))
+        delta = utils.meters_to_degrees(visibility_delta_m)
+        rings, free_coords = utils.insert_points_into_rings(plaza_geometry, self.entry_coords, delta)
+        triangles, missing_segments = _triangulate_conforming(rings, free_coords)
+        self.triangles = _filter_triangles(triangles, plaza_geometry, missing_segments, visibility_delta_m)
+        self._create_portal_graph()
+
+    def find_paths(self):
+        """ funnel paths between all pairs of entry points that are connected by the mesh """
+        paths = []
+        for i, start in enumerate(self.entry_coords):
+            if start not in self.entry_triangles:
+                continue
+            start_triangles = self.entry_triangles[start]
+            distances, predecessors = self._search_portals(
+                {node: _distance(start, self.node_coords[node])
+                 for index in start_triangles for node in self.triangle_nodes[index]})
+
+            for target in self.entry_coords[i + 1:]:
+                target_triangles = self.entry_triangles.get(target, [])
+                common_triangles = set(start_triangles).intersection(target_triangles)
+                if common_triangles:
+                    # triangles are convex, the straight line is the shortest path
+                    paths.append([start, target])
+                    continue
+                reachable_nodes = [(node, index) for index in target_triangles
+                                   for node in self.triangle_nodes[index] if node in distances]
+                if reachable_nodes:
+                    last_node, last_triangle = min(
+                        reachable_nodes,
+                        key=lambda item: distances[item[0]] + _distance(self.node_coords[item[0]], target))
+                    node_path = [last_node]
+                    while predecessors[node_path[-1]] is not None:
+                        node_path.append(predecessors[node_path[-1]])
+                    corridor = self._get_corridor(node_path[::-1], start_triangles, last_triangle)
+                    paths.append(funnel(self._get_portals([start] + corridor + [target])))
+        return paths
+
+    def get_edge_count(self):
+        """ number of distinct triangle edges of the mesh """
+        return len({frozenset((start, end))
+                    for triangle in self.triangles for start, end in zip(triangle, triangle[1:] + triangle[:1])})
+
+    def _create_portal_graph(self):
+        """
+        graph with nodes at the ends and the middle of every portal, the edge shared by two triangles.
+        The nodes on different portals of a triangle are connected by straight lines inside the triangle,
+        so the shortest path in the graph is a path through the plaza and its portals are the corridor.
+        The triangles of every entry point are kept in entry_triangles
+        """
+        self.centroids = [tuple(np.mean(triangle, axis=0)) for triangle in self.triangles]
+        self.entry_triangles = {}
+        triangles_by_edge = {}
+        entry_coords = set(self.entry_coords)
+        for index, triangle in enumerate(self.triangles):
+            for start, end in zip(triangle, triangle[1:] + triangle[:1]):
+                triangles_by_edge.setdefault(frozenset((start, end)), []).append(index)
+            for coords in triangle:
+                if coords in entry_coords:
+                    self.entry_triangles.setdefault(coords, []).append(index)
+
+        self.shared_edges = {}
+        self.node_coords = []
+        self.node_triangles = []  # the two triangles of the portal of every node
+        self.triangle_nodes = [[] for _ in self.triangles]
+        for edge, triangle_indices in triangles_by_edge.items():
+            if len(triangle_indices) == 2:
+                first, second = triangle_indices
+                self.shared_edges[(first, second)] = self.shared_edges[(second, first)] = tuple(edge)
+                start, end = sorted(edge)
+                portal_nodes = []
+                for fraction in _PORTAL_FRACTIONS:
+                    portal_nodes.append(len(self.node_coords))
+                    self.node_coords.append((start[0] + fraction * (end[0] - start[0]),
+                                             start[1] + fraction * (end[1] - start[1])))
+                    self.node_triangles.append((first, second))
+                self.triangle_nodes[first].append(portal_nodes)
+                self.triangle_nodes[second].append(portal_nodes)
+
+        self.portal_neighbours = [[] for _ in self.node_coords]
+        for index, portals in enumerate(self.triangle_nodes):
+            for i, portal_nodes in enumerate(portals):
+                for other_portal_nodes in portals[i + 1:]:
+                    for node in portal_nodes:
+                        for other in other_portal_nodes:
+                            distance = _distance(self.node_coords[node], self.node_coords[other])
+                            self.portal_neighbours[node].append((other, distance))
+                            self.portal_neighbours[other].append((node, distance))
+            self.triangle_nodes[index] = [node for portal_nodes in portals for node in portal_nodes]
+
+    def _search_portals(self, start_distances):
+        """
+        Dijkstra search in the portal graph from several start nodes with their initial distances.
+        An entry point is not a node of the graph, so paths can not pass through other entry points
+        """
+        distances = dict(start_distances)
+        predecessors = dict.fromkeys(start_distances)
+        settled = set()
+        queue = [(distance, node) for node, distance in start_distances.items()]
+        heapq.heapify(queue)
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if node in settled:
+                continue
+            settled.add(node)
+            for neighbour, weight in self.portal_neighbours[node]:
+                neighbour_distance = distance + weight
+                if neighbour_distance < distances.get(neighbour, float('inf')):
+                    distances[neighbour] = neighbour_distance
+                    predecessors[neighbour] = node
+                    heapq.heappush(queue, (neighbour_distance, neighbour))
+        return distances, predecessors
+
+    def _get_corridor(self, node_path, start_triangles, last_triangle):
+        """
+        triangles crossed by a path of portal nodes, from a start triangle to the last triangle.
+        Consecutive nodes are on portals of a common triangle
+        """
+        first_triangles = self.node_triangles[node_path[0]]
+        triangles = [next(index for index in first_triangles if index in start_triangles)]
+        for node, following in zip(node_path, node_path[1:]):
+            triangles.append(next(index for index in self.node_triangles[node]
+                                  if index in self.node_triangles[following]))
+        triangles.append(last_triangle)
+
+        # the path can touch a portal without crossing it, these triangles are removed
+        corridor = []
+        for index in triangles:
+            if corridor and corridor[-1] == index:
+                continue
+            if len(corridor) > 1 and corridor[-2] == index:
+                corridor.pop()
+                continue
+            corridor.append(index)
+        return corridor
+
+    def _get_portals(self, corridor):
+        """
+        portals of a corridor (entry point, triangles..., entry point) as (left, right) pairs,
+        seen in the direction of travel
+        """
+        start, *triangle_indices, end = corridor
+        portals = [(start, start)]
+        for current, following in zip(triangle_indices, triangle_indices[1:]):
+            first, second = self.shared_edges[(current, following)]
+            centroid = self.centroids[current]
+            midpoint = ((first[0] + second[0]) / 2, (first[1] + second[1]) / 2)
+            if _cross(centroid, midpoint, first) > 0:
+                portals.append((first, second))
+            else:
+                portals.append((second, first))
+        portals.append((end, end))
+        return portals
+
+
+def funnel(portals):
+    """
+    simple stupid funnel algorithm, returns the shortest path through a list of (left, right) portals,
+    the first and the last portal are the start and the end point.
+    See http://digestingduck.blogspot.com/2010/03/simple-stupid-funnel-algorithm.html
+    """
+    apex = portal_left = portal_right = portals[0][0]
+    apex_index = left_index = right_index = 0
+    path = [apex]
+    i = 1
+    while i < len(portals):
+        left, right = portals[i]
+
+        # narrow the funnel from the right side
+        if _cross(apex, portal_right, right) >= 0:
+            if apex == portal_right or _cross(apex, portal_left, right) < 0:
+                portal_right = right
+                right_index = i
+            else:
+                # right side crosses over the left side, the left point is a corner of the path
+                path.append(portal_left)
+                apex = portal_right = portal_left
+                apex_index = right_index = left_index
+                i = apex_index + 1
+                continue
+
+        # narrow the funnel from the left side
+        if _cross(apex, portal_left, left) <= 0:
+            if apex == portal_left or _cross(apex, portal_right, left) > 0:
+                portal_left = left
+                left_index = i
+            else:
+                path.append(portal_right)
+                apex = portal_left = portal_right
+                apex_index = left_index = right_index
+                i = apex_index + 1
+                continue
+        i += 1
+
+    end = portals[-1][0]
+    if path[-1] != end:
+        path.append(end)
+    return path
+
+
+def _triangulate_conforming(rings, free_coords):
+    """
+    Delaunay triangulation of the ring and free coordinates.
+    Boundary segments that are missing in the triangulation are split at their midpoint until all of them
+    are part of it. Returns the triangles as coordinate tuples and the boundary segments that are still missing
+    """
+    missing_segments = set()
+    for _ in range(_MAX_DENSIFY_ITERATIONS):
+        triangles = [tuple(triangle.exterior.coords)[:3]
+                     for triangle in triangulate(MultiPoint([c for ring in rings for c in ring] + free_coords))]
+        triangle_edges = {frozenset((start, end))
+                          for triangle in triangles for start, end in zip(triangle, triangle[1:] + triangle[:1])}
+        missing_segments = {segment for ring in rings for segment in _get_segments(ring)
+                            if frozenset(segment) not in triangle_edges}
+        if not missing_segments:
+            break
+        splittable_segments = {segment for segment in missing_segments if _distance(*segment) > _MIN_SEGMENT_LENGTH}
+        if not splittable_segments:
+            break
+        rings = [_split_segments(ring, splittable_segments) for ring in rings]
+    return triangles, missing_segments
+
+
+def _filter_triangles(triangles, plaza_geometry, missing_segments, visibility_delta_m):
+    """
+    keep the triangles inside the plaza. If boundary segments are missing in the triangulation,
+    triangles can cross the boundary and their edges have to be checked as well
+    """
+    prepared_geometry = prep(plaza_geometry)
+    inside_triangles = [triangle for triangle in triangles
+                        if prepared_geometry.contains(Point(np.mean(triangle, axis=0)))]
+    if not missing_segments or not inside_triangles:
+        return inside_triangles
+
+    triangle_edges = np.array([(start, end) for triangle in inside_triangles
+                               for start, end in zip(triangle, triangle[1:] + triangle[:1])])
+    visible = utils.lines_visible(plaza_geometry, triangle_edges, visibility_delta_m).reshape(-1, 3)
+    return [triangle for triangle, edges_visible in zip(inside_triangles, visible) if edges_visible.all()]
+
+
+def _get_segments(ring):
+    return zip(ring, ring[1:] + ring[:1])
+
+
+def _split_segments(ring, segments):
+    """ insert the midpoints of the given segments into the ring """
+    split_ring = []
+    for start, end in _get_segments(ring):
+        split_ring.append(start)
+        if (start, end) in segments:
+            split_ring.append(((start[0] + end[0]) / 2, (start[1] + end[1]) / 2))
+    return split_ring
+
+
+def _distance(a, b):
+    return ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5
+
+
+def _cross(origin, a, b):
+    """ z component of the cross product of origin->a and origin->b, positive if b is left of origin->a """
+    return (a[0] - origin[0]) * (b[1] - origin[1]) - (a[1] - origin[1]) * (b[0] - origin[0])
@@ -0,0 +1,418 @@
+import random
+from math import atan2, pi
+from plaza_preprocessing.optimizer import utils
+from plaza_preprocessing.optimizer.grapharrays import GraphArrays
+from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import VisibilityGraphProcessor
+
+# points closer than this (in meters) to a line count as on it, entry points are computed intersections
+_COLLINEAR_TOLERANCE = 1e-5
+
+
+class RotationalSweepGraphProcessor(VisibilityGraphProcessor):
+    """
+    process a plaza using a visibility graph that is built with Lee's rotational plane sweep.
+    The visible vertices of every vertex are found in O(n log n) instead of checking every pair against
+    all edges of the plaza, O(n^2 log n) for the whole graph. Vertices behind collinear vertices are checked
+    against all open edges, which is O(n) each. Entry points are inserted into the ring they lie on
+    """
+
+    def create_graph(self, plaza_geometry, entry_points):
+        """ create a visibility graph with all plaza and entry points """
+        if not plaza_geometry:
+            raise ValueError("Plaza geometry not defined for rotational sweep processor")
+        if not entry_points:
+            raise ValueError("No entry points defined for graph processor")
+
+        # entry points that are only near a ring are kept as free points, moving them onto the ring
+        # would change the plaza geometry around them
+        tolerance = utils.meters_to_degrees(_COLLINEAR_TOLERANCE)
+        rings, free_coords = utils.insert_points_into_rings(
+            plaza_geometry, [(p.x, p.y) for p in entry_points], tolerance)
+        sweep = VisibilitySweep(rings, free_coords)
+        # the sweep decides the visibility of every pair of vertices
+        vertices = len(sweep.points)
+        self._stats = {'candidate_edges': vertices * (vertices - 1) // 2}
+        return GraphArrays(sweep.coords, sorted(sweep.find_visible_pairs()))
+
+
+class VisibilitySweep:
+    """
+    Lee's rotational plane sweep over the vertices of polygon rings, see
+    "Computational Geometry: Algorithms and Applications" (de Berg et al.), chapter 15.
+    The first ring is the exterior, the others are holes. The walkable area is inside the exterior
+    and outside of the holes. Coordinates are converted to meters around the first vertex for the geometric predicates
+    """
+
+    def __init__(self, rings, free_coords):
+        # exterior counter-clockwise and holes clockwise: the walkable area is always on the left side
+        rings = [ring if (_signed_area(ring) > 0) == (i == 0) else ring[::-1] for i, ring in enumerate(rings)]
+        all_coords = [c for ring in rings for c in ring] + list(free_coords)
+        origin_x, origin_y = all_coords[0]
+        scale = 1 / utils.meters_to_degrees(1)
+
+        # rings can touch each other, vertices with the same coordinates are merged.
+        # Points are rounded to micrometers, so that points on a common horizontal or vertical line are exactly on it
+        self.coords = []
+        self.points = []
+        self.ring_neighbours = []  # previous and next vertex in every ring of a vertex
+        index_by_point = {}
+        point_indices = []
+        for x, y in all_coords:
+            point = (round((x - origin_x) * scale, 6), round((y - origin_y) * scale, 6))
+            if point not in index_by_point:
+                index_by_point[point] = len(self.points)
+                self.coords.append((x, y))
+                self.points.append(point)
+                self.ring_neighbours.append([])
+            point_indices.append(index_by_point[point])
+        ring_indices = []
+        offset = 0
+        for ring in rings:
+            indices = point_indices[offset:offset + len(ring)]
+            # merged vertices must not create edges of length zero
+            ring_indices.append([index for i, index in enumerate(indices) if index != indices[i - 1]])
+            offset += len(ring)
+
+        self.edges = []
+        self.point_edges = [[] for _ in self.points]
+        for indices in ring_indices:
+            for i, index in enumerate(indices):
+                next_index = indices[(i + 1) % len(indices)]
+                self.point_edges[index].append(len(self.edges))
+                self.point_edges[next_index].append(len(self.edges))
+                self.edges.append((index, next_index))
+                self.ring_neighbours[index].append((indices[i - 1], next_index))
+
+        xs, ys = zip(*self.points)
+        self._ray_length = 2 * (max(xs) - min(xs) + max(ys) - min(ys)) + 1
+        # orientation of vertices relative to the lines through the edges, they are needed again for every sweep
+        self._sides = {}
+
+    def find_visible_pairs(self):
+        """ set of (i, j) with i < j for all vertices that see each other without crossing an edge """
+        pairs = set()
+        for i in range(len(self.points)):
+            pairs.update((min(i, j), max(i, j)) for j in self.find_visible_vertices(i))
+        return pairs
+
+    def find_visible_vertices(self, p_index):
+        """ indices of the vertices that are visible from the vertex p_index """
+        points = self.points
+        edges = self.edges
+        p = points[p_index]
+
+        ray_end = (p[0] + self._ray_length, p[1])
+        sorted_indices = self._sort_by_angle(p, ray_end, [i for i in range(len(points)) if points[i] != p])
+
+        # edges that cross the initial ray, edges that touch it with an endpoint are added when it is reached
+        open_edges = _OpenEdges(self, p_index)
+        for edge_index, (a, b) in enumerate(edges):
+            (a_x, a_y), (b_x, b_y) = points[a], points[b]
+            if (a_y > p[1] + _COLLINEAR_TOLERANCE and b_y > p[1] + _COLLINEAR_TOLERANCE) or \
+                    (a_y < p[1] - _COLLINEAR_TOLERANCE and b_y < p[1] - _COLLINEAR_TOLERANCE) or \
+                    (a_x < p[0] and b_x < p[0]):
+                # the edge is clearly above, below or behind the initial ray
+                continue
+            if self._touches(edge_index, p_index):
+                continue
+            if _on_ray(p, ray_end, points[a]) or _on_ray(p, ray_end, points[b]):
+                continue
+            if _segments_intersect(p, ray_end, points[a], points[b]):
+                open_edges.insert(edge_index)
+
+        visible = []
+        previous = None
+        previous_visible = False
+        for w_index in sorted_indices:
+            w = points[w_index]
+
+            # edges that end at w on the clockwise side are not crossed by the ray any more
+            for edge_index in self.point_edges[w_index]:
+                if _ccw(p, w, points[self._other_point(edge_index, w_index)]) < 0:
+                    open_edges.delete(edge_index)
+
+            if previous is None or _ccw(p, points[previous], w) != 0 or not _on_segment(p, points[previous], w):
+                # w is not behind the previous vertex: only the nearest open edge can block it
+                is_visible = self._leaves_into_walkable_area(p_index, w) and \
+                    (not open_edges or not _segments_intersect(p, w, *self._edge_points(open_edges.first())))
+            elif not previous_visible:
+                is_visible = False
+            else:
+                # w is behind the previous vertex: the part from the previous vertex to w must be clear as well
+                is_visible = self._is_clear(previous, w_index, open_edges)
+            if is_visible:
+                visible.append(w_index)
+
+            # edges that start at w on the counterclockwise side are crossed by the ray from now on
+            for edge_index in self.point_edges[w_index]:
+                if not self._touches(edge_index, p_index) and \
+                        _ccw(p, w, points[self._other_point(edge_index, w_index)]) > 0:
+                    open_edges.insert(edge_index)
+
+            previous = w_index
+            previous_visible = is_visible
+        return visible
+
+    def _sort_by_angle(self, p, ray_end, indices):
+        """
+        sort the vertices counterclockwise around p, starting with the initial ray from p to ray_end.
+        Vertices on a common ray from p are sorted by their distance, the angles of such vertices
+        can differ by rounding errors, so they are grouped with the same tolerance as the other predicates
+        """
+        points = self.points
+
+        def sweep_key(index):
+            x, y = points[index]
+            # vertices just below the initial ray would get an angle of almost 2 pi
+            angle = 0.0 if _on_ray(p, ray_end, points[index]) else atan2(y - p[1], x - p[0]) % (2 * pi)
+            return angle, (x - p[0]) ** 2 + (y - p[1]) ** 2
+        sorted_indices = sorted(indices, key=sweep_key)
+
+        grouped_indices = []
+        group = []
+        for index in sorted_indices:
+            if group and not _on_common_ray(p, points[group[0]], points[index]):
+                grouped_indices.extend(sorted(group, key=lambda i: _distance(p, points[i])))
+                group = []
+            group.append(index)
+        grouped_indices.extend(sorted(group, key=lambda i: _distance(p, points[i])))
+        return grouped_indices
+
+    def _is_clear(self, start_index, end_index, open_edges):
+        """ check that the line between two collinear vertices stays in the walkable area and crosses no open edge """
+        start, end = self.points[start_index], self.points[end_index]
+        if not self._leaves_into_walkable_area(start_index, end):
+            return False
+        return not any(start_index not in self.edges[edge_index] and
+                       _segments_intersect(start, end, *self._edge_points(edge_index)) for edge_index in open_edges)
+
+    def _leaves_into_walkable_area(self, point_index, target):
+        """
+        check if the line from a vertex to the target starts into the walkable area
+        (or along the ring), i.e. between the two ring edges of the vertex on their left side
+        """
+        return all(self._leaves_between(point_index, previous_index, next_index, target)
+                   for previous_index, next_index in self.ring_neighbours[point_index])
+
+    def _leaves_between(self, point_index, previous_index, next_index, target):
+        point, previous, following = self.points[point_index], self.points[previous_index], self.points[next_index]
+        if _ccw(previous, point, following) >= 0:
+            # convex or straight corner: the walkable area is between the next and the previous vertex
+            return _ccw(point, following, target) >= 0 and _ccw(point, target, previous) >= 0
+        # reflex corner: only the area between the previous and the next vertex is blocked
+        return not (_ccw(point, previous, target) > 0 and _ccw(point, target, following) > 0)
+
+    def _touches(self, edge_index, point_index):
+        """ check if the vertex is an endpoint of the edge or lies on it, e.g. a hole touching the exterior """
+        if point_index in self.edges[edge_index]:
+            return True
+        start, end = self._edge_points(edge_index)
+        point = self.points[point_index]
+        return _ccw(start, end, point) == 0 and _on_segment(start, point, end)
+
+    def _is_in_front(self, point_index, edge_index, other_index):
+        """
+        check if the edge is closer to the point than the other edge along the rays from the point that cross both.
+        Edges do not cross each other: if one edge lies completely on one side of the line through the other one,
+        the side of the point decides
+        """
+        side = self._side_of(point_index, edge_index, other_index)
+        if side is not None:
+            # the other edge is on the far side of the edge, seen from the point
+            return not side
+        side = self._side_of(point_index, other_index, edge_index)
+        if side is not None:
+            return side
+        # collinear edges, or the point on the line through an edge: only touching rays cross both
+        point = self.points[point_index]
+        return min(_distance(point, q) for q in self._edge_points(edge_index)) < \
+            min(_distance(point, q) for q in self._edge_points(other_index))
+
+    def _side_of(self, point_index, edge_index, other_index):
+        """
+        True if the other edge is on the same side of the line through the edge as the point, False if it is on
+        the other side, None if the point is on the line or the other edge is on both sides or on the line
+        """
+        side_point = self._side(edge_index, point_index)
+        if side_point == 0:
+            return None
+        a, b = self.edges[other_index]
+        side_a = self._side(edge_index, a)
+        side_b = self._side(edge_index, b)
+        if side_a * side_b < 0 or side_a == side_b == 0:
+            return None
+        return (side_a or side_b) == side_point
+
+    def _side(self, edge_index, point_index):
+        """ orientation of a vertex relative to the line through an edge, see _ccw """
+        key = (edge_index, point_index)
+        side = self._sides.get(key)
+        if side is None:
+            side = self._sides[key] = _ccw(*self._edge_points(edge_index), self.points[point_index])
+        return side
+
+    def _edge_points(self, edge_index):
+        a, b = self.edges[edge_index]
+        return self.points[a], self.points[b]
+
+    def _other_point(self, edge_index, point_index):
+        a, b = self.edges[edge_index]
+        return b if a == point_index else a
+
+
+class _OpenEdges:
+    """
+    edges crossed by the current sweep ray, sorted by their distance from the sweep origin p.
+    The edges of the plaza do not cross each other, so their order does not change while they are crossed
+    by the ray and it can be decided with orientation tests only, see _is_in_front.
+    The edges are kept in a treap, so that inserting, deleting and finding the nearest edge take O(log n)
+    """
+
+    def __init__(self, sweep: VisibilitySweep, p_index):
+        self.sweep = sweep
+        self.p_index = p_index
+        self._root = None
+        self._edge_indices = set()
+        # the priorities only have to be random, a fixed seed keeps the sweep deterministic
+        self._random = random.Random(0)
+
+    def __bool__(self):
+        return self._root is not None
+
+    def __iter__(self):
+        """ edges ordered by their distance, from the nearest one """
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.edge_index
+            node = node.right
+
+    def first(self):
+        """ the edge nearest to the sweep origin """
+        node = self._root
+        while node.left is not None:
+            node = node.left
+        return node.edge_index
+
+    def insert(self, edge_index):
+        nearer, farther = self._split(self._root, edge_index)
+        node = _TreapNode(edge_index, self._random.random())
+        self._root = _merge(_merge(nearer, node), farther)
+        self._edge_indices.add(edge_index)
+
+    def delete(self, edge_index):
+        if edge_index not in self._edge_indices:
+            return
+        self._edge_indices.remove(edge_index)
+        nearer, farther = self._split(self._root, edge_index)
+        rest, last = _pop_last(nearer)
+        if last is not None and last.edge_index == edge_index:
+            self._root = _merge(rest, farther)
+            return
+        # the order of nearly degenerate edges can differ from the time they were inserted, rebuilt in O(n)
+        self._root = _merge(nearer, farther)
+        remaining = [index for index in self if index != edge_index]
+        self._root = None
+        for index in remaining:
+            self._root = _merge(self._root, _TreapNode(index, self._random.random()))
+
+    def _split(self, node, edge_index):
+        """ split a treap into the edges that are not farther than the edge and the edges that are farther """
+        if node is None:
+            return None, None
+        if self._is_closer(edge_index, node.edge_index):
+            left, node.left = self._split(node.left, edge_index)
+            return left, node
+        node.right, right = self._split(node.right, edge_index)
+        return node, right
+
+    def _is_closer(self, edge_index, other_index):
+        """ check if the edge is closer to p than the other edge """
+        if edge_index == other_index:
+            return False
+        return self.sweep._is_in_front(self.p_index, edge_index, other_index)
+
+
+class _TreapNode:
+    __slots__ = ('edge_index', 'priority', 'left', 'right')
+
+    def __init__(self, edge_index, priority):
+        self.edge_index = edge_index
+        self.priority = priority
+        self.left = None
+        self.right = None
+
+
+def _merge(left, right):
+    """ merge two treaps, all nodes of left come before the nodes of right """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        return left
+    right.left = _merge(left, right.left)
+    return right
+
+
+def _pop_last(node):
+    """ remove the last node of a treap, returns the remaining treap and the node """
+    if node is None:
+        return None, None
+    if node.right is None:
+        return node.left, node
+    node.right, last = _pop_last(node.right)
+    return node, last
+
+
+def _ccw(a, b, c):
+    """ 1 if a, b, c turn counterclockwise, -1 if they turn clockwise and 0 if they are collinear """
+    ab_x, ab_y = b[0] - a[0], b[1] - a[1]
+    ac_x, ac_y = c[0] - a[0], c[1] - a[1]
+    cross = ab_x * ac_y - ab_y * ac_x
+    # compare the distance of the points to the line through a and the farther point with the tolerance
+    ab_squared, ac_squared = ab_x * ab_x + ab_y * ab_y, ac_x * ac_x + ac_y * ac_y
+    if cross * cross <= _COLLINEAR_TOLERANCE ** 2 * (ab_squared if ab_squared > ac_squared else ac_squared):
+        return 0
+    return 1 if cross > 0 else -1
+
+
+def _on_segment(p, q, r):
+    """ check if q lies on the segment from p to r, given that the three points are collinear """
+    return min(p[0], r[0]) <= q[0] <= max(p[0], r[0]) and min(p[1], r[1]) <= q[1] <= max(p[1], r[1])
+
+
+def _on_ray(p, ray_end, a):
+    """ check if a lies on the initial ray from p to ray_end """
+    return _ccw(p, ray_end, a) == 0 and a[0] > p[0]
+
+
+def _on_common_ray(p, a, b):
+    """ check if a and b lie on the same ray from p """
+    return _ccw(p, a, b) == 0 and (a[0] - p[0]) * (b[0] - p[0]) + (a[1] - p[1]) * (b[1] - p[1]) > 0
+
+
+def _segments_intersect(p1, q1, p2, q2):
+    """ check if the segments p1-q1 and p2-q2 intersect or touch """
+    o1 = _ccw(p1, q1, p2)
+    o2 = _ccw(p1, q1, q2)
+    o3 = _ccw(p2, q2, p1)
+    o4 = _ccw(p2, q2, q1)
+    if o1 != o2 and o3 != o4:
+        return True
+    return (o1 == 0 and _on_segment(p1, p2, q1)) or (o2 == 0 and _on_segment(p1, q2, q1)) or \
+        (o3 == 0 and _on_segment(p2, p1, q2)) or (o4 == 0 and _on_segment(p2, q1, q2))
+
+
+def _signed_area(ring):
+    """ shoelace formula, positive for counter-clockwise rings """
+    return sum(x_1 * y_2 - x_2 * y_1 for (x_1, y_1), (x_2, y_2) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def _distance(a, b):
+    return ((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2) ** 0.5
@@ -1,6 +1,8 @@
-from math import ceil
+from math import ceil, log2
 from typing import List
-from shapely.geometry import Point, LineString, Polygon
+import numpy as np
+from shapely.geometry import Point, LineString, Polygon, MultiPoint, box
+from shapely.prepared import prep
 from plaza_preprocessing.optimizer import utils
 from plaza_preprocessing.optimizer.graphprocessor.graphprocessor import GraphProcessor
 
@@ -10,6 +12,7 @@ class SpiderWebGraphProcessor(GraphProcessor):
     def __init__(self, spacing_m, visibility_delta_m):
         self.spacing_m = spacing_m
         self.visibility_delta_m = visibility_delta_m
+        self._stats = {}
 
     def create_graph_edges(self, plaza_geometry: Polygon, entry_points: List[Point]) -> List[LineString]:
         """ create a spiderwebgraph and connect edges to entry points """
@@ -17,11 +20,14 @@ class SpiderWebGraphProcessor(GraphProcessor):
             raise ValueError("Plaza geometry not defined for spiderwebgraph processor")
         if not entry_points:
             raise ValueError("No entry points defined for spiderwebgraph processor")
-        graph_edges = self._calc_spiderwebgraph(plaza_geometry)
+        graph_edges = self._calc_spiderwebgraph(plaza_geometry, entry_points)
         if not graph_edges:  # no graph edges could be constructed
             return []
         return self._connect_entry_points_with_graph(entry_points, graph_edges)
 
+    def get_stats(self) -> dict:
+        return self._stats
+
     def optimize_lines(self, plaza_geometry: Polygon, lines: List[LineString], tolerance_m: float) -> List[LineString]:
         """
         simplify lines to reduce amount of line points.
@@ -35,7 +41,7 @@ class SpiderWebGraphProcessor(GraphProcessor):
         simplified_line = line.simplify(tolerance, preserve_topology=False)
         return simplified_line if utils.line_visible(plaza_geometry, simplified_line, self.visibility_delta_m) else line
 
-    def _calc_spiderwebgraph(self, plaza_geometry):
+    def _calc_spiderwebgraph(self, plaza_geometry, entry_points):
         """ calculate spider web graph edges"""
         spacing = utils.meters_to_degrees(self.spacing_m)
         x_left, y_bottom, x_right, y_top = plaza_geometry.bounds
@@ -44,58 +50,127 @@ class SpiderWebGraphProcessor(GraphProcessor):
         rows = int(ceil((y_top - y_bottom) / spacing))
         columns = int(ceil((x_right - x_left) / spacing))
 
-        graph_edges = []
-
-        for column in range(0, columns + 1):
-            for row in range(0, rows + 1):
-
-                x_1 = x_left + (column * spacing)
-                x_2 = x_left + ((column + 1) * spacing)
-                y_1 = y_bottom + (row * spacing)
-                y_2 = y_bottom + ((row + 1) * spacing)
-
-                top_left = (x_1, y_1)
-                top_right = (x_2, y_1)
-                bottom_left = (x_1, y_2)
-                bottom_right = (x_2, y_2)
-
-                # horizontal line
-                if column < columns:
-                    h_line = self._get_spiderweb_intersection_line(plaza_geometry, top_left, top_right)
-                    if h_line:
-                        graph_edges.append(h_line)
-
-                # vertical line
-                if row < rows:
-                    v_line = self._get_spiderweb_intersection_line(plaza_geometry, top_left, bottom_left)
-                    if v_line:
-                        graph_edges.append(v_line)
-
-                # diagonal line
-                if row < rows and column < columns:
-                    d1_line = self._get_spiderweb_intersection_line(plaza_geometry, top_left, bottom_right)
-                    if d1_line:
-                        graph_edges.append(d1_line)
-                    d2_line = self._get_spiderweb_intersection_line(plaza_geometry, bottom_left, top_right)
-                    if d2_line:
-                        graph_edges.append(d2_line)
-        return graph_edges
-
-    def _get_spiderweb_intersection_line(self, plaza_geometry, start, end):
-        """ returns a line that is completely inside the plaza, if possible """
-        line = LineString([start, end])
-        if not utils.line_visible(plaza_geometry, line, self.visibility_delta_m):
-            return None
-        return line
+        # the lines of every grid point in the order horizontal, vertical and both diagonals, column by column
+        column_indices, row_indices = np.meshgrid(np.arange(columns + 1), np.arange(rows + 1), indexing='ij')
+        x_1 = x_left + (column_indices * spacing)
+        x_2 = x_left + ((column_indices + 1) * spacing)
+        y_1 = y_bottom + (row_indices * spacing)
+        y_2 = y_bottom + ((row_indices + 1) * spacing)
+
+        top_left = np.stack((x_1, y_1), axis=-1)
+        top_right = np.stack((x_2, y_1), axis=-1)
+        bottom_left = np.stack((x_1, y_2), axis=-1)
+        bottom_right = np.stack((x_2, y_2), axis=-1)
+        lines = np.stack((
+            np.stack((top_left, top_right), axis=-2),
+            np.stack((top_left, bottom_left), axis=-2),
+            np.stack((top_left, bottom_right), axis=-2),
+            np.stack((bottom_left, top_right), axis=-2)), axis=2)
+
+        has_column = column_indices < columns
+        has_row = row_indices < rows
+        has_cell = has_column & has_row
+        line_mask = np.stack((has_column, has_row, has_cell, has_cell), axis=-1)
+        candidate_lines = lines[line_mask]
+        self._stats = {'candidate_edges': len(candidate_lines)}
+
+        if len(candidate_lines) == 0:
+            return []
+        # only keep lines that are completely inside the plaza
+        visible = utils.lines_visible(plaza_geometry, candidate_lines, self.visibility_delta_m)
+        return [LineString(line) for line in candidate_lines[visible]]
 
     def _connect_entry_points_with_graph(self, entry_points, graph_edges):
         connection_lines = []
-        for entry_point in entry_points:
-            neighbor_line = utils.find_nearest_geometry(entry_point, graph_edges)
-
-            target_point = min(
-                neighbor_line.coords, key=lambda c: Point(c).distance(entry_point))
+        nearest_indices = utils.find_nearest_geometries(entry_points, graph_edges)
+        for entry_point, nearest_index in zip(entry_points, nearest_indices):
+            line_coords = np.array(graph_edges[nearest_index].coords)
+            delta = line_coords - (entry_point.x, entry_point.y)
+            distances = np.sqrt(delta[:, 0] * delta[:, 0] + delta[:, 1] * delta[:, 1])
+            target_point = tuple(line_coords[np.argmin(distances)].tolist())
             connection_line = (LineString([(entry_point.x, entry_point.y), target_point]))
             connection_lines.append(connection_line)
         graph_edges.extend(connection_lines)
         return graph_edges
+
+
+class AdaptiveSpiderWebGraphProcessor(SpiderWebGraphProcessor):
+    """
+    Process a plaza with an adaptive spider web graph: the grid is a quadtree that is only subdivided
+    down to the grid size near obstacles, holes and entry points. Open areas are covered by cells of up to
+    the maximum grid size, their lines are inside the plaza and need no visibility check
+    """
+    def __init__(self, spacing_m, max_spacing_m, visibility_delta_m):
+        super().__init__(spacing_m, visibility_delta_m)
+        self.max_spacing_m = max_spacing_m
+
+    def _calc_spiderwebgraph(self, plaza_geometry, entry_points):
+        """ calculate the graph edges of the quadtree cells """
+        spacing = utils.meters_to_degrees(self.spacing_m)
+        x_left, y_bottom, x_right, y_top = plaza_geometry.bounds
+        cell_count = max(ceil((x_right - x_left) / spacing), ceil((y_top - y_bottom) / spacing), 1)
+        # cells are kept on an integer lattice with the grid size as unit
+        root_size = 2 ** ceil(log2(cell_count))
+        max_size = 2 ** int(log2(max(self.max_spacing_m / self.spacing_m, 1)))
+
+        def to_box(cell):
+            x, y, size = cell
+            return box(x_left + x * spacing, y_bottom + y * spacing,
+                       x_left + (x + size) * spacing, y_bottom + (y + size) * spacing)
+
+        prepared_plaza = prep(plaza_geometry)
+        refinement_geometry = plaza_geometry.boundary
+        if entry_points:
+            refinement_geometry = refinement_geometry.union(MultiPoint(entry_points))
+        prepared_refinement = prep(refinement_geometry)
+
+        inside_cells = []
+        boundary_cells = []
+        pending_cells = [(0, 0, root_size)]
+        while pending_cells:
+            cell = pending_cells.pop()
+            x, y, size = cell
+            if not prepared_plaza.intersects(to_box(cell)):
+                continue
+            # cells next to the refinement geometry are subdivided as well for a gradual change in size
+            near_boundary = prepared_refinement.intersects(to_box((x - 1, y - 1, size + 2)))
+            if size > 1 and (size > max_size or near_boundary):
+                half = size // 2
+                pending_cells.extend((x + dx, y + dy, half) for dx in (0, half) for dy in (0, half))
+            elif near_boundary and not prepared_plaza.contains(to_box(cell)):
+                boundary_cells.append(cell)
+            else:
+                inside_cells.append(cell)
+
+        corners = {(x + dx, y + dy) for x, y, size in inside_cells + boundary_cells
+                   for dx in (0, size) for dy in (0, size)}
+
+        def to_coords(lines):
+            return np.array([[(x_left + x * spacing, y_bottom + y * spacing) for x, y in line] for line in lines])
+
+        inside_lines = {line for cell in inside_cells for line in _get_cell_lines(cell, corners)}
+        graph_edges = [LineString(line) for line in to_coords(sorted(inside_lines))]
+        boundary_lines = sorted({line for cell in boundary_cells for line in _get_cell_lines(cell, corners)}
+                                - inside_lines)
+        self._stats = {'candidate_edges': len(inside_lines) + len(boundary_lines)}
+        if boundary_lines:
+            # only keep lines that are completely inside the plaza
+            candidate_lines = to_coords(boundary_lines)
+            visible = utils.lines_visible(plaza_geometry, candidate_lines, self.visibility_delta_m)
+            graph_edges.extend(LineString(line) for line in candidate_lines[visible])
+        return graph_edges
+
+
+def _get_cell_lines(cell, corners):
+    """
+    lines of a quadtree cell: both diagonals and the sides, which are split at the corners
+    of smaller neighbouring cells to connect them
+    """
+    x, y, size = cell
+    lines = [((x, y), (x + size, y + size)), ((x, y + size), (x + size, y))]
+    sides = [[(x + i, y) for i in range(size + 1)], [(x + i, y + size) for i in range(size + 1)],
+             [(x, y + i) for i in range(size + 1)], [(x + size, y + i) for i in range(size + 1)]]
+    for side in sides:
+        side_points = [side[0]] + [point for point in side[1:-1] if point in corners] + [side[-1]]
+        lines.extend(zip(side_points, side_points[1:]))
+    return lines
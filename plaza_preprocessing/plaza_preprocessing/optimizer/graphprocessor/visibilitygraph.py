@@ -1,5 +1,7 @@
-from shapely.geometry import LineString
+import numpy as np
+from shapely.geometry.polygon import orient
 from plaza_preprocessing.optimizer import utils
+from plaza_preprocessing.optimizer.grapharrays import GraphArrays
 from plaza_preprocessing.optimizer.graphprocessor.graphprocessor import GraphProcessor
 
 
@@ -8,24 +10,65 @@ class VisibilityGraphProcessor(GraphProcessor):
 
     def __init__(self, visibility_delta_m):
         self.visibility_delta_m = visibility_delta_m
+        self._stats = {}
 
     def create_graph_edges(self, plaza_geometry, entry_points):
+        """ create a visibility graph with all plaza and entry points """
+        return self.create_graph(plaza_geometry, entry_points).to_lines()
+
+    def create_graph(self, plaza_geometry, entry_points):
         """ create a visibility graph with all plaza and entry points """
         if not plaza_geometry:
             raise ValueError("Plaza geometry not defined for visibility graph processor")
         if not entry_points:
             raise ValueError("No entry points defined for graph processor")
 
-        plaza_coords = utils.get_polygon_coords(plaza_geometry)
         entry_coords = [(p.x, p.y) for p in entry_points]
-        all_coords = set().union(plaza_coords, entry_coords)
-        indexed_coords = {i: coords for i, coords in enumerate(all_coords)}
-
-        graph_edges = []
-        for start_id, start_coords in indexed_coords.items():
-            for end_id, end_coords in indexed_coords.items():
-                if start_id > end_id:
-                    line = LineString([start_coords, end_coords])
-                    if utils.line_visible(plaza_geometry, line, self.visibility_delta_m):
-                        graph_edges.append(line)
-        return graph_edges
+        all_coords = np.array(list(set().union(self._get_graph_coords(plaza_geometry), entry_coords)))
+
+        start_ids, end_ids = np.triu_indices(len(all_coords), k=1)
+        candidate_lines = np.stack([all_coords[end_ids], all_coords[start_ids]], axis=1)
+        visible = utils.lines_visible(plaza_geometry, candidate_lines, self.visibility_delta_m)
+        self._stats = {'candidate_edges': len(candidate_lines)}
+        return GraphArrays(all_coords, np.stack([end_ids[visible], start_ids[visible]], axis=1))
+
+    def get_stats(self):
+        return self._stats
+
+    def _get_graph_coords(self, plaza_geometry):
+        """ return the coordinates of the plaza that are used as nodes of the graph """
+        return utils.get_polygon_coords(plaza_geometry)
+
+
+class ReflexVisibilityGraphProcessor(VisibilityGraphProcessor):
+    """
+    process a plaza using a visibility graph of reflex vertices only.
+    Shortest paths around obstacles only bend at reflex vertices,
+    so all other vertices of the plaza can be left out of the graph
+    """
+
+    def _get_graph_coords(self, plaza_geometry):
+        """ return the reflex vertices of the exterior and the holes of the plaza """
+        return get_reflex_coords(plaza_geometry)
+
+
+def get_reflex_coords(plaza_geometry):
+    """ return the reflex vertices of the exterior and the holes of a plaza, where the walkable area turns right """
+    # exterior counter-clockwise and holes clockwise: the walkable area is always on the left side
+    oriented_geometry = orient(plaza_geometry, sign=1.0)
+    rings = [oriented_geometry.exterior] + list(oriented_geometry.interiors)
+    reflex_coords = []
+    for ring in rings:
+        reflex_coords.extend(_get_right_turn_coords(ring))
+    return reflex_coords
+
+
+def _get_right_turn_coords(ring):
+    """ return the coordinates of a ring where it turns to the right """
+    coords = np.asarray(ring.coords, dtype=float)[:-1]
+    previous_coords = np.roll(coords, 1, axis=0)
+    next_coords = np.roll(coords, -1, axis=0)
+    incoming = coords - previous_coords
+    outgoing = next_coords - coords
+    turns = incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0]
+    return [tuple(c) for c in coords[turns < 0]]
@@ -1,32 +1,49 @@
 import logging
+import multiprocessing
+import time
 from typing import List
 import rtree
 from shapely.geometry import Point, MultiPolygon, Polygon, LineString, box
 from plaza_preprocessing.optimizer import utils
 from plaza_preprocessing.optimizer import shortest_paths
+from plaza_preprocessing.optimizer import pathnetwork
+from plaza_preprocessing.optimizer import plazacache
 from plaza_preprocessing.optimizer.graphprocessor.graphprocessor import GraphProcessor
 from plaza_preprocessing.importer.osmholder import OSMHolder
-from plaza_preprocessing import configuration
+from plaza_preprocessing.report import Report
 from shapely.geometry import CAP_STYLE, JOIN_STYLE
+from shapely.ops import unary_union
 
 logger = logging.getLogger('plaza_preprocessing.optimizer')
 
+# preprocessor shared with forked worker processes, see PlazaPreprocessor._process_plazas_parallel
+_worker_preprocessor = None
 
-def preprocess_plazas(osm_holder: OSMHolder, process_strategy: GraphProcessor, shortest_path_strategy, config: dict):
-    """ preprocess all plazas from osm_importer """
+
+def preprocess_plazas(osm_holder: OSMHolder, process_strategy: GraphProcessor, shortest_path_strategy, config: dict,
+                      report: Report = None):
+    """
+    preprocess all plazas from osm_importer.
+    Processed plazas are yielded one by one in the order of the holder, discarded plazas are skipped.
+    Stage timings and the statistics of every plaza are added to the report
+    """
+    report = report or Report()
     logger.info(f"Start processing {len(osm_holder.plazas)} plazas")
     plaza_processor = PlazaPreprocessor(
-        osm_holder, process_strategy, shortest_path_strategy, config)
-    processed_plazas = plaza_processor.process_plazas()
+        osm_holder, process_strategy, shortest_path_strategy, config, report)
+
+    processed_count = 0
+    for processed_plaza in report.timed_iter('optimize', plaza_processor.process_plazas()):
+        processed_count += 1
+        yield processed_plaza
 
-    logger.info(f"Finished processing {len(processed_plazas)} plazas (rest were discarded)")
-    return processed_plazas
+    logger.info(f"Finished processing {processed_count} plazas (rest were discarded)")
 
 
 class PlazaPreprocessor:
 
     def __init__(self, osm_holder: OSMHolder, graph_processor: GraphProcessor,
-                 shortest_path_strategy, config):
+                 shortest_path_strategy, config, report: Report = None):
         self.plazas = osm_holder.plazas
         self.lines = osm_holder.lines
         self.buildings = osm_holder.buildings
@@ -34,30 +51,104 @@ class PlazaPreprocessor:
         self.graph_processor = graph_processor
         self.shortest_path_strategy = shortest_path_strategy
         self.config = config
+        self.report = report or Report()
 
-        self._create_spatial_indices()
+        with self.report.stage('index'):
+            self._create_spatial_indices()
 
     def process_plazas(self):
-        """ process all plazas in the osm holder"""
-        processed_plazas = []
-        for plaza in self.plazas:
-            logger.info(f"Processing plaza {plaza['osm_id']}")
-            processed_plaza = self._process_plaza(plaza)
+        """ process all plazas in the osm holder, yields the processed plazas """
+        cache_path = self.config.get('cache-path')
+        if cache_path:
+            with plazacache.PlazaCache(cache_path, self.config.get('cache-max-size', 1024)) as cache:
+                yield from self._collect_stats(self._process_plazas_cached(cache))
+        else:
+            yield from self._collect_stats(self._process_plazas(range(len(self.plazas))))
+
+    def _collect_stats(self, results):
+        """ add the stats of every plaza to the report and yield the plazas that were not discarded """
+        for processed_plaza, plaza_stats in results:
+            self.report.add_plaza(plaza_stats)
             if processed_plaza is not None:
-                processed_plazas.append(processed_plaza)
+                yield processed_plaza
 
-        return processed_plazas
+    def _process_plazas(self, plaza_indices):
+        """
+        process the plazas with the given indices, in worker processes if configured.
+        Yields the processed plaza (None if it was discarded) and its stats
+        """
+        workers = self.config.get('workers', 1)
+        if workers > 1 and len(plaza_indices) > 1:
+            return self._process_plazas_parallel(plaza_indices, workers)
+        return (self._process_plaza_logged(self.plazas[i]) for i in plaza_indices)
+
+    def _process_plazas_cached(self, cache: plazacache.PlazaCache):
+        """
+        look up every plaza in the cache and only process the plazas that were not found.
+        Lookups and writes happen in this process, the workers only see the cache misses
+        """
+        keys = [self._calc_cache_key(plaza) for plaza in self.plazas]
+        # only the keys are looked up here, the cached results are loaded one at a time while yielding
+        cached_keys = cache.find_cached_keys(keys)
+        missing_indices = [i for i, key in enumerate(keys) if key not in cached_keys]
+        logger.info(f"Plaza cache: {len(keys) - len(missing_indices)} hits, {len(missing_indices)} misses")
+
+        missing_results = self._process_plazas(missing_indices)
+        for plaza, key in zip(self.plazas, keys):
+            if key not in cached_keys:
+                processed_plaza, plaza_stats = next(missing_results)
+                cache.put(key, processed_plaza)
+                yield processed_plaza, plaza_stats
+            else:
+                cached_fields = cache.get(key)
+                plaza_stats = {'osm_id': plaza['osm_id'], 'polygon_index': plaza['polygon_index'], 'status': 'cached'}
+                yield ({**plaza, **cached_fields} if cached_fields else None), plaza_stats
+
+    def _calc_cache_key(self, plaza) -> str:
+        """ hash the plaza with everything that is used to process it """
+        plaza_geometry = plaza['geometry']
+        return plazacache.create_key(
+            plaza_geometry, self._find_intersecting_lines(plaza_geometry),
+            self._find_intersecting_buildings(plaza_geometry), self._get_points_inside_plaza(plaza_geometry),
+            self.config)
+
+    def _process_plazas_parallel(self, plaza_indices, workers):
+        """
+        process plazas in a pool of forked worker processes.
+        The workers inherit the spatial indices from the parent process,
+        results are yielded in the same order as the plazas
+        """
+        global _worker_preprocessor
+        logger.info(f"Processing plazas with {workers} worker processes")
+        _worker_preprocessor = self
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                yield from pool.imap(_process_plaza_in_worker, plaza_indices, chunksize=1)
+        finally:
+            _worker_preprocessor = None
+
+    def _process_plaza_logged(self, plaza):
+        """ process a plaza and return it together with its stats """
+        logger.info(f"Processing plaza {plaza['osm_id']}")
+        plaza_stats = {'osm_id': plaza['osm_id'], 'polygon_index': plaza['polygon_index']}
+        visibility_checks = utils.get_visibility_check_count()
+        start_time = time.perf_counter()
+        processed_plaza = self._process_plaza(plaza, plaza_stats)
+        plaza_stats['time_s'] = time.perf_counter() - start_time
+        plaza_stats['line_visible_calls'] = utils.get_visibility_check_count() - visibility_checks
+        plaza_stats['status'] = 'discarded' if processed_plaza is None else 'processed'
+        return processed_plaza, plaza_stats
 
     def _create_spatial_indices(self):
         """ create spatial indices for lines, buildings and points"""
         logger.info("Creating spatial index for geometries")
-        line_geometries = [line['geometry'] for line in self.lines]
-        self.line_index = self._create_spatial_index(line_geometries)
-        self.building_index = self._create_spatial_index(self.buildings)
-        self.point_index = self._create_spatial_index(self.points)
+        self.line_index = self._create_spatial_index(self.lines.bounds)
+        self.building_index = self._create_spatial_index(self.buildings.bounds)
+        self.point_index = self._create_spatial_index(self.points.bounds)
 
-    def _process_plaza(self, plaza):
-        """ process a single plaza """
+    def _process_plaza(self, plaza, plaza_stats=None):
+        """ process a single plaza, statistics about the plaza are added to plaza_stats """
+        plaza_stats = {} if plaza_stats is None else plaza_stats
 
         intersecting_lines = self._find_intersecting_lines(plaza['geometry'])
 
@@ -67,10 +158,13 @@ class PlazaPreprocessor:
         if not plaza_geom_without_obstacles:
             logger.debug(f"Discarding Plaza {plaza['osm_id']}: completely obstructed by obstacles")
             return None
+        plaza_stats['vertices'] = len(utils.get_polygon_coords(plaza_geom_without_obstacles))
+        plaza_stats['holes'] = len(plaza_geom_without_obstacles.interiors)
 
         entry_points = self._calc_entry_points(
             plaza_geom_without_obstacles, intersecting_lines,
             lookup_buffer_m=self.config['entry-point-lookup-buffer'])
+        plaza_stats['entry_points'] = len(entry_points)
 
         if len(entry_points) < 2:
             logger.debug(f"Discarding Plaza {plaza['osm_id']} - it has fewer than 2 entry points")
@@ -78,28 +172,43 @@ class PlazaPreprocessor:
 
         entry_lines = self._map_entry_lines(intersecting_lines, entry_points)
 
-        graph_edges = self._get_graph_edges(entry_points, plaza['geometry'], plaza_geom_without_obstacles)
+        graph_edges = self._get_graph_edges(
+            entry_points, plaza['geometry'], plaza_geom_without_obstacles, plaza_stats)
+        plaza_stats['output_edges'] = len(graph_edges)
 
         if not graph_edges:
             logger.debug(f"Discarding Plaza {plaza['osm_id']}: no graph could be constructed")
             return None
 
-        plaza['geometry'] = plaza_geom_without_obstacles
-        plaza['entry_points'] = entry_points
-        plaza['entry_lines'] = entry_lines
-        plaza['graph_edges'] = graph_edges
-
-        return plaza
+        # return a new dict, the plaza of the holder does not keep the processed geometries alive
+        return {
+            **plaza,
+            'geometry': plaza_geom_without_obstacles,
+            'entry_points': entry_points,
+            'entry_lines': entry_lines,
+            'graph_edges': graph_edges
+        }
 
     def _get_graph_edges(self, entry_points: List[Point], plaza_geom: Polygon,
-                         plaza_geom_without_obstacles: Polygon) -> List[LineString]:
+                         plaza_geom_without_obstacles: Polygon, plaza_stats: dict) -> List[LineString]:
         """ create graph with shortest paths between entry points """
-        graph_edges = self.graph_processor.create_graph_edges(plaza_geom_without_obstacles, entry_points)
+        graph_arrays = self.graph_processor.create_graph(plaza_geom_without_obstacles, entry_points)
+        plaza_stats.update(self.graph_processor.get_stats())
 
-        graph = shortest_paths.create_graph(graph_edges)
+        graph = shortest_paths.create_graph_for_strategy(graph_arrays, self.shortest_path_strategy)
+        plaza_stats['graph_nodes'], plaza_stats['graph_edges'] = shortest_paths.get_graph_size(graph)
+        start_time = time.perf_counter()
         shortest_path_lines = self.shortest_path_strategy(graph, entry_points)
+        plaza_stats['shortest_path_time_s'] = time.perf_counter() - start_time
         optimized_lines = self.graph_processor.optimize_lines(
             plaza_geom, shortest_path_lines, self.config['obstacle-buffer'])
+        plaza_stats['shortest_path_edges'] = len(optimized_lines)
+
+        if self.config.get('merge-shortest-paths', False):
+            merged_lines = pathnetwork.merge_shortest_paths(optimized_lines, entry_points)
+            plaza_stats['merged_edges'] = len(merged_lines)
+            logger.debug(f"Merged {len(optimized_lines)} shortest paths into {len(merged_lines)} edges")
+            return merged_lines
         return optimized_lines
 
     def _calc_entry_points(self, plaza_geometry, intersecting_lines, lookup_buffer_m):
@@ -154,21 +263,16 @@ class PlazaPreprocessor:
         """ cuts out holes for obstacles on the plaza geometry """
         intersecting_buildings = self._find_intersecting_buildings(plaza['geometry'])
 
-        geometry_without_buildings = plaza['geometry']
-        for building in intersecting_buildings:
-            geometry_without_buildings = geometry_without_buildings.difference(building)
-
         points_on_plaza = self._get_points_inside_plaza(plaza['geometry'])
-        point_obstacles = list(
-            map(lambda p: self._create_point_obstacle(p, buffer_m), points_on_plaza))
+        point_obstacles = map(lambda p: self._create_point_obstacle(p, buffer_m), points_on_plaza)
 
         barrier_obstacles = self._create_barrier_obstacles(intersecting_lines, self.config['obstacle-buffer'] / 2)
 
-        geometry_without_obstacles = geometry_without_buildings
-        for point_obstacle in point_obstacles:
-            geometry_without_obstacles = geometry_without_obstacles.difference(point_obstacle)
-        for barrier_obstacle in barrier_obstacles:
-            geometry_without_obstacles = geometry_without_obstacles.difference(barrier_obstacle)
+        # subtract all obstacles at once, every difference rebuilds the whole plaza polygon
+        obstacles = [*intersecting_buildings, *point_obstacles, *barrier_obstacles]
+        geometry_without_obstacles = plaza['geometry']
+        if obstacles:
+            geometry_without_obstacles = geometry_without_obstacles.difference(unary_union(obstacles))
 
         if isinstance(geometry_without_obstacles, MultiPolygon):
             logger.debug(
@@ -195,18 +299,18 @@ class PlazaPreprocessor:
             self.point_index, plaza_geometry.bounds, self.points)
         return list(filter(plaza_geometry.intersects, potential_matches))
 
-    def _create_spatial_index(self, geometries):
-        """ create rtree index for fast intersection checking """
-        logger.debug(f"creating spatial index for {len(geometries)} geometries")
+    def _create_spatial_index(self, bounds):
+        """ create rtree index for fast intersection checking from an array of bounding boxes """
+        logger.debug(f"creating spatial index for {len(bounds)} geometries")
         idx = rtree.index.Index()
-        for i, geometry in enumerate(geometries):
-            idx.insert(i, geometry.bounds)
+        for i, geometry_bounds in enumerate(bounds.tolist()):
+            idx.insert(i, geometry_bounds)
         return idx
 
     def _search_index(self, index, bounds, geometries):
         """
         search rtree index and return geometries that potentially
-        intersect with the bounds
+        intersect with the bounds, geometries are only created for these indices
         """
         potential_matches_indices = index.intersection(bounds)
         return map(lambda i: geometries[i], potential_matches_indices)
@@ -222,9 +326,13 @@ class PlazaPreprocessor:
 
     def _create_barrier_obstacles(self, intersecting_lines, buffer_m):
         """ returns geometries for line obstacles, e.g. barriers"""
-        tag_filter = self.config['tag-filter']['barrier']
         buffer_distance = utils.meters_to_degrees(buffer_m)
-        barrier_obstacles = filter(lambda line: configuration.filter_tags(line['tags'], tag_filter), intersecting_lines)
+        barrier_obstacles = filter(lambda line: line['is_barrier'], intersecting_lines)
         buffered_obstacles = map(
             lambda l: l['geometry'].buffer(buffer_distance, cap_style=CAP_STYLE.flat), barrier_obstacles)
         return buffered_obstacles
+
+
+def _process_plaza_in_worker(plaza_index):
+    """ process a plaza of the preprocessor inherited from the parent process """
+    return _worker_preprocessor._process_plaza_logged(_worker_preprocessor.plazas[plaza_index])
@@ -0,0 +1,94 @@
+import logging
+from typing import List, Tuple, Dict, Set
+from shapely.geometry import LineString, Point
+
+logger = logging.getLogger('plaza_preprocessing.optimizer')
+
+# intermediate nodes closer than this (in degrees) to the line between their neighbours are dropped
+_COLLINEAR_TOLERANCE = 1e-10
+
+
+def merge_shortest_paths(lines: List[LineString], entry_points: List[Point]) -> List[LineString]:
+    """
+    merge shortest paths into a network of deduplicated edges.
+    Segments shared by several paths are only contained once, the network is split into lines
+    at entry points and junctions and chains in between are merged into a single line
+    """
+    adjacency = _create_adjacency(lines)
+    entry_coords = {(p.x, p.y) for p in entry_points}
+    split_nodes = [node for node, neighbours in adjacency.items()
+                   if node in entry_coords or len(neighbours) != 2]
+
+    visited = set()
+    merged_lines = []
+    for start_node in split_nodes:
+        for neighbour in adjacency[start_node]:
+            if _segment_key(start_node, neighbour) not in visited:
+                chain = _follow_chain(start_node, neighbour, adjacency, entry_coords, visited)
+                merged_lines.append(LineString(_remove_collinear_nodes(chain)))
+
+    # closed loops without any junction
+    for node in adjacency:
+        for neighbour in adjacency[node]:
+            if _segment_key(node, neighbour) not in visited:
+                chain = _follow_chain(node, neighbour, adjacency, {node}, visited)
+                merged_lines.append(LineString(chain))
+
+    return merged_lines
+
+
+def _create_adjacency(lines: List[LineString]) -> Dict[Tuple[float, float], List[Tuple[float, float]]]:
+    """ collect the neighbours of every node of the lines, without duplicate segments """
+    adjacency = {}
+    segments = set()
+    for line in lines:
+        coords = list(line.coords)
+        for start, end in zip(coords, coords[1:]):
+            key = _segment_key(start, end)
+            if start == end or key in segments:
+                continue
+            segments.add(key)
+            adjacency.setdefault(start, []).append(end)
+            adjacency.setdefault(end, []).append(start)
+    return adjacency
+
+
+def _follow_chain(start_node, next_node, adjacency, stop_nodes: Set, visited: Set) -> List[Tuple[float, float]]:
+    """ follow a chain of nodes with two neighbours until a stop node or a junction is reached """
+    chain = [start_node]
+    previous_node, node = start_node, next_node
+    visited.add(_segment_key(previous_node, node))
+    while node not in stop_nodes and len(adjacency[node]) == 2:
+        chain.append(node)
+        following_node = adjacency[node][0] if adjacency[node][0] != previous_node else adjacency[node][1]
+        visited.add(_segment_key(node, following_node))
+        previous_node, node = node, following_node
+    chain.append(node)
+    return chain
+
+
+def _remove_collinear_nodes(chain: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """ drop nodes of a chain that lie on the straight line between their neighbours """
+    simplified = [chain[0]]
+    for node, next_node in zip(chain[1:-1], chain[2:]):
+        if not _is_collinear(simplified[-1], node, next_node):
+            simplified.append(node)
+    simplified.append(chain[-1])
+    return simplified
+
+
+def _is_collinear(start, middle, end) -> bool:
+    x_1, y_1 = start
+    x_2, y_2 = middle
+    x_3, y_3 = end
+    length = ((x_3 - x_1) ** 2 + (y_3 - y_1) ** 2) ** 0.5
+    if length == 0:
+        return False
+    distance = abs((x_2 - x_1) * (y_3 - y_1) - (y_2 - y_1) * (x_3 - x_1)) / length
+    # the middle node has to lie between the neighbours, not behind one of them
+    in_between = (x_2 - x_1) * (x_3 - x_2) + (y_2 - y_1) * (y_3 - y_2) > 0
+    return distance <= _COLLINEAR_TOLERANCE and in_between
+
+
+def _segment_key(start, end):
+    return (start, end) if start < end else (end, start)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+import time
+from typing import List, Optional, Set
+
+logger = logging.getLogger('plaza_preprocessing.optimizer.plazacache')
+
+# bump whenever the processing changes in a way that makes stored results invalid
+CACHE_VERSION = 2
+
+# config values that influence the result of processing a single plaza
+CACHED_CONFIG_KEYS = ('graph-strategy', 'spiderweb-grid-size', 'spiderweb-max-grid-size', 'auto-max-detour',
+                      'obstacle-buffer', 'shortest-path-algorithm', 'merge-shortest-paths',
+                      'entry-point-lookup-buffer')
+
+# keys per query when looking up which keys are cached, below the SQLite limit for query parameters
+_KEYS_PER_QUERY = 500
+
+# fields of a processed plaza that are stored in the cache
+PROCESSED_FIELDS = ('geometry', 'entry_points', 'entry_lines', 'graph_edges')
+
+
+def create_key(plaza_geometry, intersecting_lines: List[dict], buildings: list, points: list, config: dict) -> str:
+    """ content hash of everything that is used to process a plaza """
+    plaza_hash = hashlib.sha256()
+    relevant_config = {key: config.get(key) for key in CACHED_CONFIG_KEYS}
+    relevant_config['version'] = CACHE_VERSION
+    plaza_hash.update(json.dumps(relevant_config, sort_keys=True, default=str).encode())
+
+    plaza_hash.update(plaza_geometry.wkb)
+    for line in sorted(intersecting_lines, key=lambda l: l['id']):
+        plaza_hash.update(str(line['id']).encode())
+        plaza_hash.update(b'barrier' if line['is_barrier'] else b'line')
+        plaza_hash.update(line['geometry'].wkb)
+    # buildings and points come from a spatial index in no particular order
+    for geometry_wkb in sorted(geometry.wkb for geometry in buildings):
+        plaza_hash.update(geometry_wkb)
+    plaza_hash.update(b'points')
+    for geometry_wkb in sorted(geometry.wkb for geometry in points):
+        plaza_hash.update(geometry_wkb)
+    return plaza_hash.hexdigest()
+
+
+class PlazaCache:
+    """
+    SQLite cache for processed plazas.
+    Results are looked up by a content hash (see create_key), the least recently used entries are evicted
+    when the stored results exceed the maximum size
+    """
+
+    def __init__(self, path: str, max_size_mb: float):
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS plazas '
+            '(key TEXT PRIMARY KEY, result BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS plazas_last_used ON plazas (last_used)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def find_cached_keys(self, keys: List[str]) -> Set[str]:
+        """ return the keys that are in the cache, without loading their results """
+        cached_keys = set()
+        for start in range(0, len(keys), _KEYS_PER_QUERY):
+            batch = keys[start:start + _KEYS_PER_QUERY]
+            rows = self._connection.execute(
+                f"SELECT key FROM plazas WHERE key IN ({', '.join('?' * len(batch))})", batch).fetchall()
+            cached_keys.update(row[0] for row in rows)
+        return cached_keys
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        return the processed fields of a plaza or None if the key is not cached.
+        Plazas that were discarded are stored as an empty dict
+        """
+        row = self._connection.execute('SELECT result FROM plazas WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._connection.execute('UPDATE plazas SET last_used = ? WHERE key = ?', (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key: str, processed_plaza: Optional[dict]):
+        """ store a processed plaza, None for discarded plazas """
+        result = {}
+        if processed_plaza is not None:
+            result = {field: processed_plaza[field] for field in PROCESSED_FIELDS}
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self._connection.execute(
+            'INSERT OR REPLACE INTO plazas (key, result, size, last_used) VALUES (?, ?, ?, ?)',
+            (key, data, len(data), time.time()))
+
+    def evict(self):
+        """ remove the least recently used entries until the cache fits into its maximum size """
+        total_size = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM plazas').fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        evicted_keys = []
+        rows = self._connection.execute('SELECT key, size FROM plazas ORDER BY last_used').fetchall()
+        for key, size in rows:
+            if total_size <= self.max_size:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+        self._connection.executemany('DELETE FROM plazas WHERE key = ?', evicted_keys)
+        logger.debug(f"Evicted {len(evicted_keys)} plazas from the cache")
+
+    def close(self):
+        self.evict()
+        self._connection.commit()
+        self._connection.close()
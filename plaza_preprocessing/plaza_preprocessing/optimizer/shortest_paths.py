@@ -2,7 +2,10 @@ import logging
 import time
 import networkx as nx
 from shapely.geometry import LineString, Point
-from typing import List, Tuple, Set, Dict
+from typing import List, Tuple, Set, Dict, Union
+import numpy as np
+from plaza_preprocessing.optimizer.csrgraph import CSRGraph
+from plaza_preprocessing.optimizer.grapharrays import GraphArrays
 
 logger = logging.getLogger('plaza_preprocessing.optimizer')
 
@@ -15,6 +18,35 @@ def create_graph(graph_edges: List[LineString]) -> nx.Graph:
     return graph
 
 
+def create_graph_from_arrays(graph_arrays: GraphArrays) -> nx.Graph:
+    """ create a networkx graph from the arrays of a graph processor, nodes without edges are left out """
+    graph = nx.Graph()
+    coords = [tuple(c) for c in graph_arrays.coords.tolist()]
+    graph.add_nodes_from(coords[node_id] for node_id in np.unique(graph_arrays.edges).tolist())
+    graph.add_weighted_edges_from(
+        (coords[start], coords[end], weight)
+        for (start, end), weight in zip(graph_arrays.edges.tolist(), graph_arrays.weights.tolist()))
+    return graph
+
+
+def create_graph_for_strategy(graph_edges: Union[GraphArrays, List[LineString]], shortest_path_strategy):
+    """ create the graph representation the shortest path strategy works on """
+    if shortest_path_strategy is compute_csr_dijkstra_shortest_paths:
+        if isinstance(graph_edges, GraphArrays):
+            return CSRGraph.from_graph_arrays(graph_edges)
+        return CSRGraph.from_lines(graph_edges)
+    if isinstance(graph_edges, GraphArrays):
+        return create_graph_from_arrays(graph_edges)
+    return create_graph(graph_edges)
+
+
+def get_graph_size(graph) -> Tuple[int, int]:
+    """ number of nodes and edges of a graph created by create_graph_for_strategy """
+    if isinstance(graph, CSRGraph):
+        return graph.number_of_nodes, graph.number_of_edges
+    return graph.number_of_nodes(), graph.number_of_edges()
+
+
 def compute_dijkstra_shortest_paths(graph: nx.Graph, entry_points: List[Point]) -> List[LineString]:
     """
     compute a list of shortest paths as LineStrings between all pairs of entry points
@@ -53,6 +85,34 @@ def compute_astar_shortest_paths(graph: nx.Graph, entry_points: List[Point]) ->
     return lines
 
 
+def compute_csr_dijkstra_shortest_paths(graph: CSRGraph, entry_points: List[Point]) -> List[LineString]:
+    """
+    compute a list of shortest paths as LineStrings between all pairs of entry points
+    with one dijkstra search per entry point on a CSR graph.
+    Every search stops as soon as the other entry points are settled
+    """
+    entry_coords = list(map(lambda point: (point.x, point.y), entry_points))
+    lines = []
+    start_time = time.perf_counter()
+    for start_node in entry_coords:
+        start_id = graph.get_node_id(start_node)
+        if start_id is None:
+            logger.warning(f"entry point {start_node} is not reachable on the graph, discarding paths")
+            continue
+        end_nodes = [end_node for end_node in entry_coords if start_node < end_node]
+        end_ids = [graph.get_node_id(end_node) for end_node in end_nodes]
+        paths = graph.dijkstra(start_id, [end_id for end_id in end_ids if end_id is not None])
+        for end_node, end_id in zip(end_nodes, end_ids):
+            if end_id not in paths:
+                logger.debug(f"entry point {end_node} is not reachable from {start_node}, discarding path")
+                continue
+            lines.append(LineString([graph.get_coords(node_id) for node_id in paths[end_id]]))
+    end_time = time.perf_counter()
+    elapsed_time_ms = (end_time - start_time) * 1000
+    logger.debug(f"computed csr dijkstra shortest paths in {elapsed_time_ms:.2f} milliseconds")
+    return lines
+
+
 def _extract_lines_between_entry_points(shortest_paths: Dict, entry_coords: List[Tuple]) -> List[LineString]:
     """ create shortest lines between every pair of entry points"""
     lines = []
@@ -98,10 +158,4 @@ def _collect_edges(graph_edges: List[LineString]) -> List[Tuple[float, float, Di
 
 def _calculate_weight_of_line(line: LineString) -> float:
     """ calculate the weight of a line as the distance between the points """
-    weight = 0
-    point = Point(line.coords[0])
-    for coords in line.coords[1:]:
-        next_point = Point(coords)
-        weight += point.distance(next_point)
-        point = next_point
-    return weight
+    return line.length
@@ -1,9 +1,19 @@
 import logging
 import time
+import numpy as np
+import rtree
 from shapely.geometry import Point, MultiPoint, LineString, MultiLineString, GeometryCollection
 
 logger = logging.getLogger('plaza_preprocessing.optimizer')
 
+# upper bound for the number of line / polygon edge pairs that are checked at once in lines_visible
+_MAX_PAIRS_PER_CHUNK = 2 ** 20
+# points closer than this (in degrees) to the polygon boundary are considered to be on it
+_BOUNDARY_EPSILON = 1e-10
+
+# number of lines checked by line_visible and lines_visible in this process, used for the report
+_visibility_check_count = 0
+
 
 def unpack_geometry_coordinates(geometry):
     """ return a set with every point in LineString and Point geometries """
@@ -41,8 +51,27 @@ def find_nearest_geometry(obj, geometries):
     return min(geometries, key=lambda g: g.distance(obj))
 
 
+def find_nearest_geometries(points, geometries):
+    """
+    index of the nearest geometry for every point, the same geometry find_nearest_geometry would return.
+    Only the geometries whose bounding box is close enough to the point are compared
+    """
+    index = rtree.index.Index((i, geometry.bounds, None) for i, geometry in enumerate(geometries))
+    nearest_indices = []
+    for point in points:
+        # the geometry with the nearest bounding box is an upper bound for the distance to the nearest one
+        upper_bound_index = next(index.nearest((point.x, point.y, point.x, point.y), 1))
+        max_distance = geometries[upper_bound_index].distance(point)
+        candidates = sorted(index.intersection((point.x - max_distance, point.y - max_distance,
+                                                point.x + max_distance, point.y + max_distance)))
+        nearest_indices.append(min(candidates, key=lambda i: geometries[i].distance(point)))
+    return nearest_indices
+
+
 def line_visible(plaza_geometry, line, delta_m):
     """ check if the line is "visible", i.e. unobstructed through the plaza"""
+    global _visibility_check_count
+    _visibility_check_count += 1
     intersection_line = plaza_geometry.intersection(line)
 
     # a line is visible if the intersection has the same length as the line itself, within a given delta
@@ -50,6 +79,170 @@ def line_visible(plaza_geometry, line, delta_m):
     return abs(line.length - intersection_line.length) <= delta
 
 
+def lines_visible(plaza_geometry, lines, delta_m):
+    """
+    batched version of line_visible: check all lines against the edges of the plaza at once
+
+    :param plaza_geometry: Polygon the lines have to be inside of
+    :param lines: array-like of shape (n, 2, 2) with the start and end coordinates of every line
+    :param delta_m: tolerance in meters the lines may lie outside of the plaza
+    :return: boolean array, True for every visible line
+    """
+    global _visibility_check_count
+    lines = np.asarray(lines, dtype=float).reshape(-1, 2, 2)
+    _visibility_check_count += len(lines)
+    visible = np.zeros(len(lines), dtype=bool)
+    if len(lines) == 0:
+        return visible
+
+    edges = _get_polygon_edges(plaza_geometry)
+    delta = meters_to_degrees(delta_m)
+    chunk_size = max(1, _MAX_PAIRS_PER_CHUNK // len(edges))
+    for start in range(0, len(lines), chunk_size):
+        chunk = lines[start:start + chunk_size]
+        visible[start:start + chunk_size] = _calc_length_outside(chunk, edges) <= delta
+    return visible
+
+
+def insert_points_into_rings(plaza_geometry, coords, tolerance):
+    """
+    insert the points into the ring they lie on (within the tolerance).
+    Returns the coordinates of all rings and the points that do not lie on a ring
+    """
+    ring_geometries = [plaza_geometry.exterior] + list(plaza_geometry.interiors)
+    ring_points = [[] for _ in ring_geometries]
+    free_coords = []
+    for point_coords in coords:
+        point = Point(point_coords)
+        distances = [ring.distance(point) for ring in ring_geometries]
+        ring_index = int(np.argmin(distances))
+        if distances[ring_index] <= tolerance:
+            ring_points[ring_index].append((ring_geometries[ring_index].project(point), point_coords))
+        else:
+            free_coords.append(point_coords)
+
+    rings = []
+    for ring, points in zip(ring_geometries, ring_points):
+        ring_coords = list(ring.coords)[:-1]
+        distances = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(ring.coords, axis=0).T))])[:-1]
+        vertices = [(distance, 0, c) for distance, c in zip(distances, ring_coords)]
+        vertices.extend((distance, 1, c) for distance, c in points)
+        rings.append(list(dict.fromkeys(c for _, _, c in sorted(vertices))))
+    return rings, free_coords
+
+
+def get_visibility_check_count():
+    """ number of lines that were checked for visibility so far """
+    return _visibility_check_count
+
+
+def _get_polygon_edges(polygon):
+    """ return the edges of all rings of the polygon as an array of shape (n, 2, 2) """
+    rings = [polygon.exterior] + list(polygon.interiors)
+    edges = []
+    for ring in rings:
+        coords = np.asarray(ring.coords, dtype=float)
+        edges.append(np.stack([coords[:-1], coords[1:]], axis=1))
+    return np.concatenate(edges)
+
+
+def _calc_length_outside(lines, edges):
+    """
+    calculate the length of every line that lies outside of the polygon formed by the edges.
+    Lines are split where they cross an edge and every part is checked with its midpoint
+    """
+    starts = lines[:, 0]
+    directions = lines[:, 1] - lines[:, 0]
+    edge_starts = edges[:, 0]
+    edge_directions = edges[:, 1] - edges[:, 0]
+
+    # intersection parameters of line (t) and edge (u), see https://stackoverflow.com/a/565282
+    denominator = _cross(directions[:, None, :], edge_directions[None, :, :])
+    start_offsets = edge_starts[None, :, :] - starts[:, None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = _cross(start_offsets, edge_directions[None, :, :]) / denominator
+        u = _cross(start_offsets, directions[:, None, :]) / denominator
+    crossing = (denominator != 0) & (t > 0) & (t < 1) & (u >= 0) & (u <= 1)
+
+    # polygon vertices on the line are split points as well, the crossing test is not reliable for them
+    squared_lengths = np.sum(directions ** 2, axis=1)[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vertex_t = np.sum(start_offsets * directions[:, None, :], axis=2) / squared_lengths
+    vertex_offsets = start_offsets - directions[:, None, :] * vertex_t[:, :, None]
+    on_line = (vertex_t > 0) & (vertex_t < 1) & \
+        (np.hypot(vertex_offsets[:, :, 0], vertex_offsets[:, :, 1]) <= _BOUNDARY_EPSILON)
+
+    # split parameters for every line, sorted with unused slots (NaN) at the end
+    split_params = np.concatenate([
+        np.zeros((len(lines), 1)),
+        np.where(crossing, t, np.nan),
+        np.where(on_line, vertex_t, np.nan),
+        np.ones((len(lines), 1))], axis=1)
+    split_params.sort(axis=1)
+    param_starts = split_params[:, :-1]
+    param_ends = split_params[:, 1:]
+    with np.errstate(invalid='ignore'):
+        is_part = param_ends > param_starts
+    line_indices, part_indices = np.nonzero(is_part)
+    part_starts = param_starts[line_indices, part_indices]
+    part_ends = param_ends[line_indices, part_indices]
+
+    midpoint_params = (part_starts + part_ends) / 2
+    midpoints = starts[line_indices] + directions[line_indices] * midpoint_params[:, None]
+    outside = ~_points_inside(midpoints, edges)
+
+    line_lengths = np.hypot(directions[:, 0], directions[:, 1])
+    outside_lengths = (part_ends - part_starts)[outside] * line_lengths[line_indices[outside]]
+    return np.bincount(line_indices[outside], weights=outside_lengths, minlength=len(lines))
+
+
+def _points_inside(points, edges):
+    """ check which points are inside or on the boundary of the polygon formed by the edges """
+    inside = np.empty(len(points), dtype=bool)
+    chunk_size = max(1, _MAX_PAIRS_PER_CHUNK // len(edges))
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        chunk_inside = _points_inside_ring_crossing(chunk, edges)
+        # points on the boundary count as inside, like with a shapely intersection
+        on_boundary_candidates = np.nonzero(~chunk_inside)[0]
+        if len(on_boundary_candidates) > 0:
+            distances = _distances_to_edges(chunk[on_boundary_candidates], edges)
+            chunk_inside[on_boundary_candidates] = distances.min(axis=1) <= _BOUNDARY_EPSILON
+        inside[start:start + chunk_size] = chunk_inside
+    return inside
+
+
+def _points_inside_ring_crossing(points, edges):
+    """ even-odd ray casting test, works for polygons with holes """
+    x = points[:, 0][:, None]
+    y = points[:, 1][:, None]
+    x_1, y_1 = edges[:, 0, 0][None, :], edges[:, 0, 1][None, :]
+    x_2, y_2 = edges[:, 1, 0][None, :], edges[:, 1, 1][None, :]
+    spans_y = (y_1 > y) != (y_2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_crossing = x_1 + (y - y_1) * (x_2 - x_1) / (y_2 - y_1)
+    crossings = spans_y & (x < x_crossing)
+    return np.count_nonzero(crossings, axis=1) % 2 == 1
+
+
+def _distances_to_edges(points, edges):
+    """ distances of every point to every edge as an array of shape (points, edges) """
+    edge_starts = edges[:, 0][None, :, :]
+    edge_directions = (edges[:, 1] - edges[:, 0])[None, :, :]
+    offsets = points[:, None, :] - edge_starts
+    squared_lengths = np.sum(edge_directions ** 2, axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        projections = np.sum(offsets * edge_directions, axis=2) / squared_lengths
+    projections = np.clip(np.nan_to_num(projections), 0, 1)
+    nearest = edge_starts + edge_directions * projections[:, :, None]
+    return np.hypot(points[:, None, 0] - nearest[:, :, 0], points[:, None, 1] - nearest[:, :, 1])
+
+
+def _cross(a, b):
+    """ z component of the cross product of 2D vectors """
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
 def timing(f):
     """ decorator function to measure runtime of a function """
     def wrap(*args):
@@ -0,0 +1,106 @@
+import json
+import logging
+import resource
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('plaza_preprocessing.report')
+
+
+class Report:
+    """
+    collects wall time and peak memory of the preprocessing stages and statistics of every plaza.
+    Stages can be nested (e.g. optimize runs inside transform while the plazas are streamed),
+    the wall time of a stage does not include the time of the stages nested in it.
+    The peak memory of a stage is the highest RSS while it was running, including its nested stages.
+    It is measured by resetting the RSS high-water mark of the process at the start of every stage,
+    where this is not possible (not on Linux) it is the peak of the process up to the end of the stage
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.plazas = []
+        self._running_stages = []
+        self._peak_rss_mb = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        """ measure the time and peak memory of a stage, a stage can be entered several times """
+        self._update_peak_rss()
+        self._running_stages.append({'name': name, 'nested_time': 0.0, 'peak_rss_mb': 0.0})
+        if _reset_peak_rss():
+            self._update_peak_rss()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_time = time.perf_counter() - start_time
+            self._update_peak_rss()
+            running_stage = self._running_stages.pop()
+            if self._running_stages:
+                self._running_stages[-1]['nested_time'] += elapsed_time
+            stage = self.stages.setdefault(name, {'wall_time_s': 0.0, 'peak_rss_mb': 0.0})
+            stage['wall_time_s'] += elapsed_time - running_stage['nested_time']
+            stage['peak_rss_mb'] = max(stage['peak_rss_mb'], running_stage['peak_rss_mb'])
+
+    def _update_peak_rss(self):
+        """ add the high-water mark since the last reset to the peaks of the process and the running stages """
+        peak_rss = get_current_peak_rss_mb()
+        self._peak_rss_mb = max(self._peak_rss_mb, peak_rss)
+        for running_stage in self._running_stages:
+            running_stage['peak_rss_mb'] = max(running_stage['peak_rss_mb'], peak_rss)
+
+    def timed_iter(self, name, iterable):
+        """ iterate over iterable, the time spent in producing the items is counted as stage """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_plaza(self, plaza_stats: dict):
+        self.plazas.append(plaza_stats)
+
+    def to_dict(self) -> dict:
+        """ report as dict, plazas are sorted by their processing time with the slowest plaza first """
+        return {
+            'stages': self.stages,
+            'peak_rss_mb': max(self._peak_rss_mb, get_peak_rss_mb(), get_current_peak_rss_mb()),
+            'peak_rss_workers_mb': get_peak_rss_mb(resource.RUSAGE_CHILDREN),
+            'plazas': sorted(self.plazas, key=lambda stats: stats.get('time_s', 0.0), reverse=True)
+        }
+
+    def write(self, filename):
+        with open(filename, 'w') as report_file:
+            json.dump(self.to_dict(), report_file, indent=2)
+        logger.info(f"Report written to {filename}")
+
+
+def get_peak_rss_mb(who=resource.RUSAGE_SELF) -> float:
+    """ peak resident set size since the start of the process (maxrss is in kilobytes on linux) """
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def get_current_peak_rss_mb() -> float:
+    """ peak resident set size since the last reset, the peak of the process if it cannot be reset """
+    try:
+        with open('/proc/self/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return get_peak_rss_mb()
+
+
+def _reset_peak_rss() -> bool:
+    """ reset the RSS high-water mark to the current RSS, returns False if that is not supported """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
@@ -1,6 +1,7 @@
 import json
 import os
 import shlex
+import shutil
 from datetime import datetime, timedelta
 
 import schedule
@@ -11,16 +12,24 @@ PBF_DOWNLOAD_URL = os.environ.get('PBF_DOWNLOAD_URL', 'https://planet.osm.ch/swi
 UPDATE_SERVER_URL = os.environ.get('UPDATE_SERVER_URL', 'https://planet.osm.ch/replication/hour/')
 PBF_PATH = os.environ.get('PBF_PATH', '/pbf/switzerland-padded.osm.pbf')
 PBF_PROCESSED_PATH = os.environ.get('PBF_PROCESSED_PATH', '/pbf/switzerland-processed.osm.pbf')
+PLAZA_CACHE_PATH = os.environ.get('PLAZA_CACHE_PATH', '/pbf/plaza_cache.sqlite')
+PLAZA_INDEX_PATH = os.environ.get('PLAZA_INDEX_PATH', '/pbf/plaza_index')
+CHANGES_PATH = os.environ.get('CHANGES_PATH', '/pbf/changes.osc.gz')
+SEQUENCE_PATH = os.environ.get('SEQUENCE_PATH', '/pbf/sequence.txt')
 RUN_EVERY_X_MINUTES = int(os.environ.get('RUN_EVERY_X_MINUTES', 60 * 24 * 7))  # default: every week
 
 _LAST_RUN_FILE_PATH = os.environ.get('LAST_RUN_FILE_PATH', '/pbf/last_run.txt')
 
-def _run_command(command):
+def _run_command(command, success_codes=(0,)):
+    """ run a command and print its output, raises CalledProcessError if it exits with another code """
     with subprocess.Popen(
         shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1,
     ) as p:
         for line in p.stdout:
             print(line, end='')
+        returncode = p.wait()
+    if returncode not in success_codes:
+        raise subprocess.CalledProcessError(returncode, command)
 
 
 def _get_last_run():
@@ -31,15 +40,99 @@ def _get_last_run():
     return datetime.min
 
 
+def _can_run_incremental():
+    return all(os.path.exists(path) for path in
+               (PBF_PATH, PBF_PROCESSED_PATH, PLAZA_INDEX_PATH + '.dat', PLAZA_INDEX_PATH + '.idx'))
+
+
+def _update_pbf_with_changes():
+    """
+    download the changes since the last run to CHANGES_PATH and apply them to a copy of PBF_PATH.
+    Returns the path of the updated copy, None if there are no changes
+    """
+    if os.path.exists(CHANGES_PATH):
+        os.remove(CHANGES_PATH)
+    sequence_option = f"-f {SEQUENCE_PATH}" if os.path.exists(SEQUENCE_PATH) else f"-O {PBF_PATH} -f {SEQUENCE_PATH}"
+    # exit code 3: no new changes on the server
+    _run_command(f"pyosmium-get-changes -v --server {UPDATE_SERVER_URL} {sequence_option} -o {CHANGES_PATH}",
+                 success_codes=(0, 3))
+    if not os.path.exists(CHANGES_PATH):
+        return None
+    updated_pbf_path = PBF_PATH + '.new'
+    _run_command(f"osmosis --read-xml-change {CHANGES_PATH} --read-pbf {PBF_PATH} "
+                 f"--apply-change --write-pbf {updated_pbf_path}")
+    return updated_pbf_path
+
+
+def _preprocess_incremental(updated_pbf_path):
+    """ preprocess the changed plazas, PBF_PATH and PBF_PROCESSED_PATH are only replaced if everything succeeded """
+    processed_path = PBF_PROCESSED_PATH + '.new'
+    _run_command(f"/usr/local/bin/plaza_preprocessing --cache {PLAZA_CACHE_PATH} --plaza-index {PLAZA_INDEX_PATH} "
+                 f"--changes {CHANGES_PATH} --previous {PBF_PROCESSED_PATH} {updated_pbf_path} {processed_path}")
+    os.replace(processed_path, PBF_PROCESSED_PATH)
+    os.replace(updated_pbf_path, PBF_PATH)
+
+
+def _run_incremental():
+    """
+    apply the changes since the last run and preprocess the changed plazas.
+    If anything fails, the sequence file is restored so that the next run downloads the same changes again
+    """
+    sequence_backup_path = SEQUENCE_PATH + '.bak'
+    if os.path.exists(SEQUENCE_PATH):
+        shutil.copyfile(SEQUENCE_PATH, sequence_backup_path)
+    try:
+        updated_pbf_path = _update_pbf_with_changes()
+        if updated_pbf_path is None:
+            print("No changes found")
+            return
+        print("Update Finished")
+        print("Preprocessing changed plazas...")
+        _preprocess_incremental(updated_pbf_path)
+    except Exception:
+        if os.path.exists(sequence_backup_path):
+            os.replace(sequence_backup_path, SEQUENCE_PATH)
+        elif os.path.exists(SEQUENCE_PATH):
+            os.remove(SEQUENCE_PATH)
+        raise
+    finally:
+        for path in (sequence_backup_path, PBF_PATH + '.new', PBF_PROCESSED_PATH + '.new'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
 def job():
+    try:
+        _run_job()
+    except subprocess.CalledProcessError as e:
+        # last_run is not written, the next schedule tries again
+        print(f"Update failed: {e}")
+
+
+def _run_job():
     last_run = _get_last_run()
     if datetime.now() < (last_run + timedelta(minutes=RUN_EVERY_X_MINUTES)):
         print("Last update not old enough, skipping.")
         return
+    if _can_run_incremental():
+        print(30 * '#')
+        print("Processed PBF and plaza index exist. Starting Incremental Update.")
+        _run_incremental()
+        _write_last_run()
+        print("Preprocessing Done")
+        print(30 * '#')
+        return
+
+    # the plaza index is written again by the full run, without it a failed full run is repeated instead of
+    # continuing incrementally from a processed PBF that is older than the source
+    for index_path in (PLAZA_INDEX_PATH + '.dat', PLAZA_INDEX_PATH + '.idx'):
+        if os.path.exists(index_path):
+            os.remove(index_path)
     if os.path.exists(PBF_PATH):
         print(30 * '#')
         print("PBF exists. Starting Update Process.")
-        _run_command(f"pyosmium-up-to-date -v --server {UPDATE_SERVER_URL} {PBF_PATH}")
+        # exit code 3: updated, but more changes are available on the server
+        _run_command(f"pyosmium-up-to-date -v --server {UPDATE_SERVER_URL} {PBF_PATH}", success_codes=(0, 3))
         print("Update Finished")
         print(30 * '#')
     else:
@@ -48,16 +141,23 @@ def job():
         _run_command(f"wget -O {PBF_PATH} {PBF_DOWNLOAD_URL}")
         print("Download Done")
         print(30 * '#')
+    if os.path.exists(SEQUENCE_PATH):
+        os.remove(SEQUENCE_PATH)
 
     print(30 * '#')
     print("Preprocessing...")
-    _run_command(f"/usr/local/bin/plaza_preprocessing {PBF_PATH} {PBF_PROCESSED_PATH}")
-    with open(_LAST_RUN_FILE_PATH, 'w') as last_run:
-        last_run.write(json.dumps(datetime.timestamp(datetime.now())))
+    _run_command(f"/usr/local/bin/plaza_preprocessing --cache {PLAZA_CACHE_PATH} --plaza-index {PLAZA_INDEX_PATH} "
+                 f"{PBF_PATH} {PBF_PROCESSED_PATH}")
+    _write_last_run()
     print("Preprocessing Done")
     print(30 * '#')
 
 
+def _write_last_run():
+    with open(_LAST_RUN_FILE_PATH, 'w') as last_run:
+        last_run.write(json.dumps(datetime.timestamp(datetime.now())))
+
+
 def run():
     job()  # init
     schedule.every(RUN_EVERY_X_MINUTES).minutes.do(job)
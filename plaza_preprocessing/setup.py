@@ -14,8 +14,8 @@ setup(
     author_email='robin@robinsuter.ch',
     url='https://github.com/PlazaRoute/plazaroute',
     license="MIT License",
-    packages=find_packages(exclude=('tests', 'docs', 'scheduled')),
-    install_requires=['osmium', 'Shapely', 'geojson', 'networkx', 'Rtree', 'jsonschema', 'ruamel.yaml'],
+    packages=find_packages(exclude=('tests', 'docs', 'scheduled', 'benchmarks')),
+    install_requires=['osmium', 'Shapely', 'geojson', 'networkx', 'Rtree', 'jsonschema', 'ruamel.yaml', 'numpy'],
     entry_points={
         'console_scripts': [
             'plaza_preprocessing=plaza_preprocessing.__main__:plaza_preprocessing'
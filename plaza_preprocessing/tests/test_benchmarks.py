@@ -0,0 +1,63 @@
+import os
+import pytest
+from plaza_preprocessing import configuration
+from plaza_preprocessing.importer import importer
+from plaza_preprocessing.optimizer import optimizer, shortest_paths
+from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import VisibilityGraphProcessor
+from benchmarks import synthetic, suite
+from benchmarks import __main__ as benchmarks_main
+
+
+@pytest.fixture
+def config():
+    config_path = 'testconfig.yml'
+    yield configuration.load_config(config_path)
+    os.remove(config_path)
+
+
+def test_synthetic_plaza(config):
+    filename = 'synthetic.osm'
+    try:
+        synthetic.write_synthetic_plaza(filename, vertices=32, holes=5, entries=6)
+        holder = importer.import_osm(filename, config['tag-filter'])
+    finally:
+        os.remove(filename)
+    assert len(holder.plazas) == 1
+    assert len(holder.plazas[0]['geometry'].exterior.coords) == 33
+
+    processed_plazas = list(optimizer.preprocess_plazas(
+        holder, VisibilityGraphProcessor(visibility_delta_m=0.1), shortest_paths.compute_astar_shortest_paths, config))
+    assert len(processed_plazas) == 1
+    assert len(processed_plazas[0]['geometry'].interiors) == 5
+    assert len(processed_plazas[0]['entry_points']) == 6
+
+
+def test_synthetic_parameters():
+    parameters = suite.get_synthetic_parameters({'vertices': [16, 64], 'holes': [4]})
+    assert parameters == [{**suite.SYNTHETIC_BASE, 'vertices': 16}, suite.SYNTHETIC_BASE]
+
+
+def test_smoke_matrix_is_default():
+    args = benchmarks_main.parse_args(['run', 'results.json', '--algorithms', 'dijkstra'])
+    assert not args.full
+    assert benchmarks_main._select(args.files, args.full, suite.BENCHMARK_FILES, suite.SMOKE_FILES) == \
+        suite.SMOKE_FILES
+    assert benchmarks_main._select(args.algorithms, args.full, suite.SHORTEST_PATH_ALGORITHMS,
+                                   suite.SMOKE_SHORTEST_PATH_ALGORITHMS) == ['dijkstra']
+
+    full_args = benchmarks_main.parse_args(['run', 'results.json', '--full'])
+    assert benchmarks_main._select(full_args.strategies, full_args.full, suite.GRAPH_STRATEGIES,
+                                   suite.SMOKE_GRAPH_STRATEGIES) == suite.GRAPH_STRATEGIES
+
+
+def test_compare_results():
+    baseline = {'cases': {'a': _create_case(1.0, 0.5), 'b': _create_case(1.0, 0.5)}}
+    current = {'cases': {'a': _create_case(1.1, 0.5), 'b': _create_case(1.5, 0.9), 'c': _create_case(9, 9)}}
+
+    regressions = suite.compare_results(baseline, current, threshold=0.2, min_difference_s=0.05)
+
+    assert [(r['case'], r['timing']) for r in regressions] == [('b', 'total'), ('b', 'optimize')]
+
+
+def _create_case(total_time, optimize_time):
+    return {'total_time_s': total_time, 'stages': {'optimize': {'wall_time_s': optimize_time}}}
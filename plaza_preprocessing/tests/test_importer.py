@@ -1,7 +1,10 @@
 import os
 import pytest
+import numpy as np
 import testfilemanager
 from plaza_preprocessing import configuration
+from plaza_preprocessing.importer import importer
+from shapely.geometry import box
 
 
 @pytest.fixture
@@ -54,5 +57,32 @@ def test_relation_with_unclosed_ways(config):
     assert len(holder.plazas) == 1
 
 
+def test_two_pass_import(config):
+    """ only objects near plazas are imported """
+    filename = testfilemanager.get_testfile_name('kreuzplatz')
+    holder = importer.import_osm(filename, config['tag-filter'])
+    two_pass_holder = importer.import_osm(filename, config['tag-filter'], two_pass=True)
+
+    assert [p['osm_id'] for p in two_pass_holder.plazas] == [p['osm_id'] for p in holder.plazas]
+    assert 0 < len(two_pass_holder.buildings) < len(holder.buildings)
+    assert 0 < len(two_pass_holder.lines) < len(holder.lines)
+    plaza_bounds = [box(*p['geometry'].bounds) for p in holder.plazas]
+    near_line_ids = [line_id for line_id, bounds in zip(holder.lines.ids, holder.lines.bounds)
+                     if any(b.intersects(box(*bounds)) for b in plaza_bounds)]
+    assert list(two_pass_holder.lines.ids) == near_line_ids
+
+
+def test_line_columns(config):
+    holder = testfilemanager.import_testfile('fischmarktplatz', config)
+    assert holder.lines.ids.dtype == np.int64
+    assert holder.lines.bounds.shape == (len(holder.lines), 4)
+    line = holder.lines[0]
+    assert line['id'] == holder.lines.ids[0]
+    assert line['geometry'].bounds == tuple(holder.lines.bounds[0])
+    barriers = [holder.lines[i] for i in range(len(holder.lines)) if holder.lines[i]['is_barrier']]
+    assert barriers
+    assert all(holder.points[i].geom_type == 'Point' for i in range(len(holder.points)))
+
+
 def get_plazas_by_id(plazas, osm_id):
     return list(filter(lambda p: p['osm_id'] == osm_id, plazas))
@@ -0,0 +1,127 @@
+import os
+import tempfile
+from collections import Counter
+import pytest
+import osmium
+from osmium.osm.mutable import Node
+from shapely.geometry import box
+import testfilemanager
+from plaza_preprocessing import __main__, configuration
+from plaza_preprocessing.report import Report
+from plaza_preprocessing.merger import plazatransformer
+from plaza_preprocessing.incremental import incremental, plazaindex
+
+
+@pytest.fixture
+def config():
+    config_path = 'testconfig.yml'
+    yield configuration.load_config(config_path)
+    os.remove(config_path)
+
+
+@pytest.mark.parametrize('node_id, affected_plazas, record_ways', [
+    (34952093, 2, False),  # node of an entry way, the bounds of the first plaza lie within the second
+    (34952093, 2, True),  # entry ways recorded during the import instead of being read by the merger
+    (1630934664, 0, False)  # node of a building far away from both plazas
+])
+def test_incremental_run_matches_full_run(config, node_id, affected_plazas, record_ways):
+    config['record-entry-ways'] = record_ways
+    testfile = testfilemanager.get_testfile_name('zentrum_witikon')
+    with tempfile.TemporaryDirectory() as tempdir:
+        plaza_index = os.path.join(tempdir, 'plazaindex')
+        previous_file = os.path.join(tempdir, 'previous.osm.pbf')
+        changed_file = os.path.join(tempdir, 'changed.osm')
+        change_file = os.path.join(tempdir, 'changes.osc')
+        __main__.preprocess_osm(testfile, previous_file, config, plaza_index_path=plaza_index)
+        _move_node(testfile, changed_file, change_file, node_id)
+
+        report = Report()
+        incremental_file = os.path.join(tempdir, 'incremental.osm.pbf')
+        __main__.preprocess_osm_changes(
+            changed_file, incremental_file, config, [change_file], previous_file, plaza_index, report)
+        full_file = os.path.join(tempdir, 'full.osm.pbf')
+        __main__.preprocess_osm(changed_file, full_file, config)
+
+        assert len(report.plazas) == affected_plazas
+        assert _read_geometries(incremental_file) == _read_geometries(full_file)
+        with plazaindex.PlazaIndex(plaza_index) as index:
+            assert set(index.get_plazas()) == {(8211029, 0), (8211029, 1)}
+
+
+def test_find_affected_plazas():
+    plazas = [_create_plaza(10, 0, (0, 0, 1, 1)), _create_plaza(12, 0, (5, 5, 6, 6)), _create_plaza(14, 0, (8, 8, 9, 9))]
+    with tempfile.TemporaryDirectory() as tempdir:
+        basename = os.path.join(tempdir, 'plazaindex')
+        plazaindex.write_plaza_index(basename, plazas[:2] + [_create_plaza(16, 0, (20, 20, 21, 21))], set())
+        with plazaindex.PlazaIndex(basename) as index:
+            # (12, 0) uses nodes of (10, 0)
+            affected = incremental.find_affected_plazas(
+                plazas, index, [(0.5, 0.5, 0.6, 0.6)], set(), {(10, 0): {(12, 0)}})
+
+    # (14, 0) was added and (16, 0) was removed
+    assert affected == {(10, 0), (12, 0), (14, 0), (16, 0)}
+
+
+def test_id_block_plaza():
+    plaza = {'area_id': 5, 'polygon_index': 2, 'graph_edges': [], 'entry_lines': []}
+    id_start = plazatransformer.get_id_block_start(plaza)
+    assert plazatransformer.get_id_block_plaza(id_start + 1) == (5, 2)
+    assert plazatransformer.get_id_block_plaza(id_start + plazatransformer.ID_BLOCK_SIZE) == (5, 2)
+    assert plazatransformer.get_id_block_plaza(id_start + plazatransformer.ID_BLOCK_SIZE + 1) == (5, 3)
+    assert plazatransformer.get_id_block_plaza(1234) is None
+
+
+def _create_plaza(area_id, polygon_index, bounds):
+    return {'area_id': area_id, 'polygon_index': polygon_index, 'geometry': box(*bounds)}
+
+
+def _move_node(osm_file, changed_file, change_file, node_id):
+    """ write osm_file with a moved node to changed_file and the change to change_file """
+    file_writer = osmium.SimpleWriter(changed_file)
+    change_writer = osmium.SimpleWriter(change_file)
+    try:
+        _NodeMover(node_id, file_writer, change_writer).apply_file(osm_file)
+    finally:
+        file_writer.close()
+        change_writer.close()
+
+
+class _NodeMover(osmium.SimpleHandler):
+    def __init__(self, node_id, file_writer, change_writer):
+        super().__init__()
+        self.node_id = node_id
+        self.file_writer = file_writer
+        self.change_writer = change_writer
+
+    def node(self, node):
+        if node.id == self.node_id:
+            location = (node.location.lon + 0.0002, node.location.lat + 0.0001)
+            node = Node(base=node, location=location, version=node.version + 1)
+            self.change_writer.add_node(node)
+        self.file_writer.add_node(node)
+
+    def way(self, way):
+        self.file_writer.add_way(way)
+
+    def relation(self, relation):
+        self.file_writer.add_relation(relation)
+
+
+def _read_geometries(osm_file):
+    """ coordinates of the original ways and of all plaza ways (their ids depend on the processing order) """
+    reader = _GeometryReader()
+    reader.apply_file(osm_file, locations=True)
+    original_ways = {way_id: coords for way_id, coords in reader.ways.items()
+                     if way_id < plazatransformer.OSM_ID_START}
+    plaza_ways = Counter(coords for way_id, coords in reader.ways.items()
+                         if way_id > plazatransformer.OSM_ID_START)
+    return original_ways, plaza_ways
+
+
+class _GeometryReader(osmium.SimpleHandler):
+    def __init__(self):
+        super().__init__()
+        self.ways = {}
+
+    def way(self, way):
+        self.ways[way.id] = tuple((round(node.lon, 7), round(node.lat, 7)) for node in way.nodes)
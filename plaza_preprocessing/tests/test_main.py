@@ -3,6 +3,7 @@ import os
 import testfilemanager
 from os import path, remove
 from plaza_preprocessing import __main__, configuration
+from plaza_preprocessing.report import Report
 
 
 @pytest.fixture
@@ -20,3 +21,55 @@ def test_main(config):
         assert path.exists(out_file)
     finally:
         remove(out_file)
+
+
+def test_parse_workers():
+    testfile = testfilemanager.get_testfile_name('kreuzplatz')
+    assert __main__.parse_args([testfile, 'out.osm', '--workers', '4']).workers == 4
+    assert __main__.parse_args([testfile, 'out.osm']).workers is None
+
+
+def test_parse_cache():
+    testfile = testfilemanager.get_testfile_name('kreuzplatz')
+    assert __main__.parse_args([testfile, 'out.osm', '--cache', 'plazas.sqlite']).cache == 'plazas.sqlite'
+
+
+def test_report_stage_peak_rss():
+    """ every stage reports its own memory peak, not the peak of the process so far """
+    report = Report()
+    with report.stage('large'):
+        data = b'x' * (100 * 1024 * 1024)
+        del data
+    with report.stage('small'):
+        pass
+    stages = report.to_dict()['stages']
+    assert stages['large']['peak_rss_mb'] - stages['small']['peak_rss_mb'] > 50
+
+
+def test_report(config):
+    testfile = testfilemanager.get_testfile_name('kreuzplatz')
+    out_file = 'kreuzplatz-merged.osm'
+    config['merge-shortest-paths'] = True
+    report = Report()
+    try:
+        __main__.preprocess_osm(testfile, out_file, config, report)
+    finally:
+        remove(out_file)
+
+    report_dict = report.to_dict()
+    assert set(report_dict['stages']) == {'import', 'index', 'optimize', 'transform', 'way extraction', 'merge'}
+    assert all(stage['wall_time_s'] >= 0 for stage in report_dict['stages'].values())
+    assert report_dict['peak_rss_mb'] > 0
+    plaza_stats = report_dict['plazas'][0]
+    assert plaza_stats['status'] == 'processed'
+    assert plaza_stats['entry_points'] >= 2
+    assert plaza_stats['candidate_edges'] >= plaza_stats['graph_edges'] > 0
+    assert plaza_stats['line_visible_calls'] >= plaza_stats['candidate_edges']
+    assert plaza_stats['output_edges'] > 0
+    assert plaza_stats['merged_edges'] == plaza_stats['output_edges']
+    assert plaza_stats['shortest_path_edges'] >= plaza_stats['merged_edges']
+
+
+def test_parse_report():
+    testfile = testfilemanager.get_testfile_name('kreuzplatz')
+    assert __main__.parse_args([testfile, 'out.osm', '--report', 'report.json']).report == 'report.json'
@@ -1,11 +1,13 @@
 import os.path
 import pytest
+import osmium
 from shapely.geometry import LineString, Point
 import testfilemanager
 import utils
-from plaza_preprocessing.optimizer import shortest_paths
+from plaza_preprocessing.optimizer import shortest_paths, optimizer
 from plaza_preprocessing import configuration
 import plaza_preprocessing.merger.merger as merger
+from plaza_preprocessing.importer import importer
 import plaza_preprocessing.merger.plazatransformer as plazatransformer
 from plaza_preprocessing.optimizer.graphprocessor.spiderwebgraph import SpiderWebGraphProcessor
 from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import VisibilityGraphProcessor
@@ -44,6 +46,73 @@ def test_transform_plaza():
     assert len(plaza_transformer.entry_node_mappings[99]) == 1
 
 
+def test_transform_adjacent_plazas():
+    plaza_transformer = plazatransformer.PlazaTransformer(0, 0, {})
+    plaza_transformer.transform_plaza(create_test_plaza())
+    plaza_transformer.flush(ListWriter(), ListWriter())
+    adjacent_plaza = {
+        'graph_edges': [LineString([(3, 4), (5, 5)])],
+        'entry_points': [Point(3, 4), Point(5, 5)],
+        'entry_lines': [
+            {
+                'way_id': 98,
+                'entry_points': [Point(3, 4), Point(5, 5)]
+            }
+        ]
+    }
+    plaza_transformer.transform_plaza(adjacent_plaza)
+
+    # only the node at (5, 5) is new, the entry point (3, 4) is shared
+    assert list(plaza_transformer.nodes) == [(5, 5)]
+    assert [node['coords'] for node in plaza_transformer.entry_node_mappings[98]] == [(3, 4), (5, 5)]
+    assert len(plaza_transformer.entry_node_mappings[99]) == 1
+
+
+def test_id_blocks_do_not_depend_on_other_plazas(config):
+    holder = testfilemanager.import_testfile('zentrum_witikon', config)
+    preprocessor = optimizer.PlazaPreprocessor(
+        holder, VisibilityGraphProcessor(visibility_delta_m=0.1), shortest_paths.compute_dijkstra_shortest_paths,
+        config)
+    plazas = [plaza for plaza in map(preprocessor._process_plaza, holder.plazas) if plaza]
+    assert len(plazas) == 2
+    assert [plaza['polygon_index'] for plaza in plazas] == [0, 1]
+
+    node_file = 'test_nodes.osm'
+    way_file = 'test_ways.osm'
+    way_ids = []
+    try:
+        for transformed_plazas in [plazas, plazas[1:]]:
+            plazatransformer.transform_plazas(iter(transformed_plazas), node_file, way_file, config['footway-tags'])
+            ways = ObjectCounter()
+            ways.apply_file(way_file)
+            way_ids.append(ways.ids['w'])
+            os.remove(node_file)
+            os.remove(way_file)
+
+        with pytest.raises(ValueError):
+            plazatransformer.transform_plazas(plazas[::-1], node_file, way_file, config['footway-tags'])
+    finally:
+        for filename in [node_file, way_file]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    block_start = plazatransformer.get_id_block_start(plazas[1])
+    assert way_ids[0] == sorted(way_ids[0])
+    assert way_ids[1] == [way_id for way_id in way_ids[0] if way_id > block_start]
+    assert block_start > plazatransformer.get_id_block_start(plazas[0]) + plazatransformer.ID_BLOCK_SIZE - 1
+
+
+class ListWriter:
+    def __init__(self):
+        self.objects = []
+
+    def add_node(self, node):
+        self.objects.append(node)
+
+    def add_way(self, way):
+        self.objects.append(way)
+
+
 def test_transform_real_plaza(process_strategy, shortest_path_strategy, config):
     plaza = utils.process_plaza('helvetiaplatz', 4533221, process_strategy, shortest_path_strategy, config)
     assert plaza
@@ -116,29 +185,93 @@ def test_merge_simple_plaza(process_strategy, shortest_path_strategy, config):
         os.remove(merged_filename)
 
 
+def test_merge_with_pyosmium(config):
+    process_strategy = VisibilityGraphProcessor(visibility_delta_m=0.1)
+    plaza = utils.process_plaza(
+        'kreuzplatz', 5541230, process_strategy, shortest_paths.compute_dijkstra_shortest_paths, config)
+    assert plaza
+
+    merged_filename = 'testfile-merged.osm'
+    testfile = testfilemanager.get_testfile_name('kreuzplatz')
+    try:
+        merger.merge_plaza_graphs([plaza], testfile, merged_filename, config['footway-tags'], merge_tool='pyosmium')
+        original = ObjectCounter()
+        original.apply_file(testfile)
+        merged = ObjectCounter()
+        merged.apply_file(merged_filename)
+    finally:
+        os.remove(merged_filename)
+
+    assert merged.object_types == sorted(merged.object_types, key=['n', 'w', 'r'].index)
+    for object_ids in merged.ids.values():
+        assert object_ids == sorted(object_ids)
+    plaza_way_ids = [way_id for way_id in merged.ids['w'] if way_id > plazatransformer.OSM_ID_START]
+    assert len(plaza_way_ids) == len(plaza['graph_edges'])
+    assert len(merged.ids['w']) == len(original.ids['w']) + len(plaza_way_ids)
+    assert len(merged.ids['r']) == len(original.ids['r'])
+    for entry_line in plaza['entry_lines']:
+        assert merged.way_versions[entry_line['way_id']] == original.way_versions[entry_line['way_id']] + 1
+
+
+def test_recorded_ways_match_extracted_ways(config):
+    testfile = testfilemanager.get_testfile_name('zuerich_hb')
+    holder = importer.import_osm(testfile, config['tag-filter'], record_ways=True)
+    line_ids = holder.lines.ids.tolist()
+
+    extracted_ways = merger._extract_plaza_ways(dict.fromkeys(line_ids), testfile)
+    assert len(extracted_ways) == len(line_ids) == len(holder.ways)
+    for way_id in line_ids:
+        assert holder.ways.get_way(way_id) == extracted_ways[way_id]
+    assert -1 not in holder.ways
+
+
+class ObjectCounter(osmium.SimpleHandler):
+    """ collects the ids in file order """
+    def __init__(self):
+        super().__init__()
+        self.ids = {'n': [], 'w': [], 'r': []}
+        self.object_types = []
+        self.way_versions = {}
+
+    def node(self, node):
+        self._add('n', node.id)
+
+    def way(self, way):
+        self._add('w', way.id)
+        self.way_versions[way.id] = way.version
+
+    def relation(self, relation):
+        self._add('r', relation.id)
+
+    def _add(self, object_type, object_id):
+        if not self.object_types or self.object_types[-1] != object_type:
+            self.object_types.append(object_type)
+        self.ids[object_type].append(object_id)
+
+
 def test_find_exact_insert_position():
-    entry_point = Point(2, 2)
+    entry_nodes = [{'id': 5, 'coords': (2, 2)}]
     way_nodes = [
         {'id': 1, 'coords': (0, 0)},
         {'id': 2, 'coords': (2, 0)},
         {'id': 3, 'coords': (2, 2)},
         {'id': 4, 'coords': (0, 2)},
     ]
-    pos = merger._find_exact_insert_position(entry_point, way_nodes)
-    assert pos == 2
+    positions, _ = merger._find_insert_positions(entry_nodes, way_nodes)
+    assert positions.tolist() == [2]
 
 
 def test_find_interpolated_insert_position():
-    entry_point = Point(2.5, 1)
+    entry_nodes = [{'id': 5, 'coords': (2.5, 1)}]
     way_nodes = [
         {'id': 1, 'coords': (0, 0)},
         {'id': 2, 'coords': (2, 0)},
         {'id': 3, 'coords': (3, 2)},
         {'id': 4, 'coords': (1, 2)},
     ]
-    pos = merger._find_interpolated_insert_position(
-        entry_point, way_nodes)
-    assert pos == 2
+    positions, fractions = merger._find_insert_positions(entry_nodes, way_nodes)
+    assert positions.tolist() == [2]
+    assert fractions.tolist() == [0.5]
 
 
 def test_insert_entry_nodes():
@@ -180,6 +313,31 @@ def test_insert_entry_nodes():
     assert entry_ways == entry_ways_expected
 
 
+def test_insert_entry_nodes_on_same_segment():
+    entry_ways = {
+        42: {
+            'version': 1,
+            'nodes': [
+                {'id': 1, 'coords': (0, 0)},
+                {'id': 2, 'coords': (4, 0)},
+                {'id': 3, 'coords': (4, 4)},
+            ]
+        }
+    }
+    entry_node_mappings = {
+        42: [
+            {'id': -99, 'coords': (3, 0)},
+            {'id': -98, 'coords': (4, 3)},
+            {'id': -97, 'coords': (1, 0)},
+            {'id': -96, 'coords': (4, 0)},
+            {'id': -95, 'coords': (2, 0)},
+            {'id': -94, 'coords': (4, 1)},
+        ]
+    }
+    merger._insert_entry_nodes(entry_ways, entry_node_mappings)
+    assert [node['id'] for node in entry_ways[42]['nodes']] == [1, -97, -95, -99, -96, 2, -94, -98, 3]
+
+
 def create_test_plaza():
     edges = [
         LineString([(0, 0), (1, 1)]),
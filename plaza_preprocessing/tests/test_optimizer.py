@@ -3,18 +3,32 @@ import testfilemanager
 import utils
 import os
 import plaza_preprocessing.optimizer.optimizer as optimizer
-from plaza_preprocessing.optimizer import shortest_paths
+from plaza_preprocessing.optimizer import shortest_paths, plazacache
 from plaza_preprocessing import configuration
-from plaza_preprocessing.optimizer.graphprocessor.spiderwebgraph import SpiderWebGraphProcessor
-from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import VisibilityGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.spiderwebgraph import SpiderWebGraphProcessor, \
+    AdaptiveSpiderWebGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.navmeshgraph import NavMeshGraphProcessor, NavMesh
+from plaza_preprocessing.optimizer.graphprocessor.rotationalsweep import RotationalSweepGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.lazyvisibility import LazyVisibilityGraphProcessor
+from plaza_preprocessing.optimizer.graphprocessor.autograph import AutoGraphProcessor, STRATEGY_DETOURS
+from plaza_preprocessing.optimizer.graphprocessor.visibilitygraph import VisibilityGraphProcessor, \
+    ReflexVisibilityGraphProcessor
+import networkx as nx
+from plaza_preprocessing.optimizer.utils import meters_to_degrees, get_visibility_check_count
+from shapely import affinity
+from shapely.geometry import Polygon, Point, LineString
 
 
-@pytest.fixture(params=['visibility', 'spiderweb'])
+@pytest.fixture(params=['visibility', 'spiderweb', 'spiderweb-adaptive', 'navmesh'])
 def process_strategy(request):
     if request.param == 'visibility':
         return VisibilityGraphProcessor(visibility_delta_m=0.1)
     elif request.param == 'spiderweb':
         return SpiderWebGraphProcessor(spacing_m=5, visibility_delta_m=0.1)
+    elif request.param == 'spiderweb-adaptive':
+        return AdaptiveSpiderWebGraphProcessor(spacing_m=5, max_spacing_m=40, visibility_delta_m=0.1)
+    elif request.param == 'navmesh':
+        return NavMeshGraphProcessor(visibility_delta_m=0.1)
 
 
 @pytest.fixture(params=['astar', 'dijkstra'])
@@ -50,8 +64,8 @@ def test_complicated_plaza(process_strategy, shortest_path_strategy, config):
 
 def test_multiple_plazas(process_strategy, shortest_path_strategy, config):
     holder = testfilemanager.import_testfile('helvetiaplatz', config)
-    processed_plazas = optimizer.preprocess_plazas(
-        holder, process_strategy, shortest_path_strategy, config)
+    processed_plazas = list(optimizer.preprocess_plazas(
+        holder, process_strategy, shortest_path_strategy, config))
 
     assert len(processed_plazas) == 7
     all_edges = [edge.coords for plaza in processed_plazas for edge in plaza["graph_edges"]]
@@ -117,3 +131,295 @@ def test_entry_points_with_cutout_polygon(process_strategy, shortest_path_strate
     result_plaza = utils.process_plaza('zuerich_hb', 6605179, process_strategy, shortest_path_strategy, config)
     assert result_plaza
     assert len(result_plaza['entry_points']) == 9
+
+
+def test_parallel_processing(config):
+    """ plazas processed by worker processes should equal the sequential result in the same order """
+    holder = testfilemanager.import_testfile('zuerich_hb', config)
+    process_strategy = VisibilityGraphProcessor(visibility_delta_m=0.1)
+    sequential_plazas = list(optimizer.preprocess_plazas(
+        holder, process_strategy, shortest_paths.compute_dijkstra_shortest_paths, config))
+
+    holder = testfilemanager.import_testfile('zuerich_hb', config)
+    config['workers'] = 2
+    parallel_plazas = list(optimizer.preprocess_plazas(
+        holder, process_strategy, shortest_paths.compute_dijkstra_shortest_paths, config))
+
+    assert [p['osm_id'] for p in parallel_plazas] == [p['osm_id'] for p in sequential_plazas]
+    assert [[e.coords[:] for e in p['graph_edges']] for p in parallel_plazas] == \
+        [[e.coords[:] for e in p['graph_edges']] for p in sequential_plazas]
+
+
+def test_reflex_vertices():
+    """ only the inner corner of the L and the corners of the hole are reflex """
+    l_shape = Polygon([(0, 0), (2, 0), (2, 1), (1, 1), (1, 2), (0, 2)],
+                      [[(0.2, 0.2), (0.4, 0.2), (0.4, 0.4), (0.2, 0.4)]])
+    processor = ReflexVisibilityGraphProcessor(visibility_delta_m=0.1)
+    reflex_coords = processor._get_graph_coords(l_shape)
+    assert sorted(reflex_coords) == [(0.2, 0.2), (0.2, 0.4), (0.4, 0.2), (0.4, 0.4), (1, 1)]
+
+
+def test_reflex_visibility_same_paths(config):
+    """ the reflex visibility graph should result in paths as short as the full visibility graph """
+    full_plaza = utils.process_plaza('sechselaeutenplatz', 4094446, VisibilityGraphProcessor(visibility_delta_m=0.001),
+                                     shortest_paths.compute_dijkstra_shortest_paths, config)
+    reflex_plaza = utils.process_plaza('sechselaeutenplatz', 4094446,
+                                       ReflexVisibilityGraphProcessor(visibility_delta_m=0.001),
+                                       shortest_paths.compute_dijkstra_shortest_paths, config)
+    assert full_plaza and reflex_plaza
+    full_lengths = sorted(line.length for line in full_plaza['graph_edges'])
+    reflex_lengths = sorted(line.length for line in reflex_plaza['graph_edges'])
+    assert reflex_lengths == pytest.approx(full_lengths)
+
+
+def test_adaptive_spiderweb_fewer_edges():
+    """ open areas should be covered by large cells, all edges stay inside the plaza """
+    size = meters_to_degrees(200)
+    hole = meters_to_degrees(20)
+    plaza = Polygon([(0, 0), (size, 0), (size, size), (0, size)],
+                    [[(size / 2, size / 2), (size / 2 + hole, size / 2), (size / 2, size / 2 + hole)]])
+    entry_points = [Point(0, size / 3), Point(size, size / 4)]
+
+    uniform_edges = SpiderWebGraphProcessor(spacing_m=2, visibility_delta_m=0.1)._calc_spiderwebgraph(
+        plaza, entry_points)
+    adaptive_edges = AdaptiveSpiderWebGraphProcessor(spacing_m=2, max_spacing_m=32, visibility_delta_m=0.1)\
+        ._calc_spiderwebgraph(plaza, entry_points)
+
+    assert 0 < len(adaptive_edges) < len(uniform_edges) / 4
+    assert all(plaza.buffer(1e-9).contains(line) for line in adaptive_edges)
+
+
+def test_adaptive_spiderweb_connected_cells():
+    """ sides of large cells are split where smaller cells touch them, so the graph is connected """
+    size = meters_to_degrees(64)
+    plaza = Polygon([(0, 0), (size, 0), (size, size), (0, size)])
+    entry_points = [Point(0, 0), Point(size, size)]
+    processor = AdaptiveSpiderWebGraphProcessor(spacing_m=1, max_spacing_m=16, visibility_delta_m=0.1)
+    graph_edges = processor.create_graph_edges(plaza, entry_points)
+
+    graph = shortest_paths.create_graph(graph_edges)
+    assert nx.is_connected(graph)
+
+
+def test_rotational_sweep_same_edges():
+    """ the sweep should find the same visible pairs as checking every pair, including collinear vertices """
+    plaza = Polygon([(0, 0), (4, 0), (4, 2), (2, 2), (2, 4), (0, 4)],
+                    [[(0.5, 0.5), (1.5, 0.5), (1.5, 1.5), (0.5, 1.5)], [(2.5, 0.5), (3, 1.5), (3.5, 0.5)]])
+    plaza = affinity.scale(plaza, 1e-4, 1e-4, origin=(0, 0))
+    entry_points = [Point(4e-4, 1e-4), Point(1e-4, 4e-4), Point(0, 2e-4)]
+
+    sweep_edges = RotationalSweepGraphProcessor(visibility_delta_m=0.001).create_graph_edges(plaza, entry_points)
+    pair_edges = VisibilityGraphProcessor(visibility_delta_m=0.001).create_graph_edges(plaza, entry_points)
+
+    assert {frozenset(line.coords) for line in sweep_edges} == {frozenset(line.coords) for line in pair_edges}
+
+
+class ComparingSweepProcessor(RotationalSweepGraphProcessor):
+    """ rotational sweep that records where its edges differ from checking every pair """
+
+    def __init__(self, visibility_delta_m):
+        super().__init__(visibility_delta_m)
+        self.differences = []
+
+    def create_graph(self, plaza_geometry, entry_points):
+        sweep_graph = super().create_graph(plaza_geometry, entry_points)
+        pair_edges = VisibilityGraphProcessor(visibility_delta_m=1e-6).create_graph_edges(plaza_geometry, entry_points)
+        sweep_pairs = {frozenset(line.coords) for line in sweep_graph.to_lines()}
+        pair_pairs = {frozenset(line.coords) for line in pair_edges}
+        vertices = [Point(coords) for coords in plaza_geometry.exterior.coords] + \
+            [Point(coords) for interior in plaza_geometry.interiors for coords in interior.coords]
+        for pair in sweep_pairs ^ pair_pairs:
+            line = LineString(list(pair))
+            # lines that graze a plaza vertex are visible or not depending on rounding errors
+            if not any(0 < line.distance(vertex) < meters_to_degrees(1e-4) for vertex in vertices):
+                self.differences.append(line)
+        return sweep_graph
+
+
+@pytest.mark.parametrize('testfile', ['bahnhofplatz_bern', 'bundeshaus_bern', 'sechselaeutenplatz', 'zuerich_hb'])
+def test_rotational_sweep_same_edges_as_pairs(testfile, config):
+    """ the sweep should find the same visible pairs as checking every pair on the bundled plazas """
+    holder = testfilemanager.import_testfile(testfile, config)
+    processor = ComparingSweepProcessor(visibility_delta_m=0.1)
+    plaza_preprocessor = optimizer.PlazaPreprocessor(holder, processor, shortest_paths.compute_dijkstra_shortest_paths,
+                                                     config)
+    for plaza in holder.plazas:
+        plaza_preprocessor._process_plaza(plaza)
+    assert processor.differences == []
+
+
+def test_rotational_sweep_same_paths(config):
+    """ the rotational sweep should result in the same paths as the visibility graph """
+    visibility_plaza = utils.process_plaza('sechselaeutenplatz', 4094446, VisibilityGraphProcessor(visibility_delta_m=0.1),
+                                           shortest_paths.compute_dijkstra_shortest_paths, config)
+    sweep_plaza = utils.process_plaza('sechselaeutenplatz', 4094446, RotationalSweepGraphProcessor(visibility_delta_m=0.1),
+                                      shortest_paths.compute_dijkstra_shortest_paths, config)
+    assert visibility_plaza and sweep_plaza
+    visibility_length = sum(line.length for line in visibility_plaza['graph_edges'])
+    sweep_length = sum(line.length for line in sweep_plaza['graph_edges'])
+    assert sweep_length == pytest.approx(visibility_length, rel=1e-3)
+
+
+def test_lazy_visibility_same_paths(config):
+    """ A* over the implicit visibility graph should find paths as short as the full visibility graph """
+    visibility_plaza = utils.process_plaza('sechselaeutenplatz', 4094446, VisibilityGraphProcessor(visibility_delta_m=0.1),
+                                           shortest_paths.compute_dijkstra_shortest_paths, config)
+    lazy_plaza = utils.process_plaza('sechselaeutenplatz', 4094446, LazyVisibilityGraphProcessor(visibility_delta_m=0.1),
+                                     shortest_paths.compute_dijkstra_shortest_paths, config)
+    assert visibility_plaza and lazy_plaza
+    visibility_length = sum(line.length for line in visibility_plaza['graph_edges'])
+    lazy_length = sum(line.length for line in lazy_plaza['graph_edges'])
+    assert lazy_length == pytest.approx(visibility_length, rel=1e-3)
+
+
+def test_candidate_edges_stats(process_strategy):
+    """ every processor reports how many possible edges it considered for the last graph """
+    plaza = Polygon([(0, 0), (4, 0), (4, 4), (0, 4)], [[(1, 1), (3, 1), (3, 3), (1, 3)]])
+    plaza = affinity.scale(plaza, 1e-4, 1e-4, origin=(0, 0))
+    entry_points = [Point(0, 2e-4), Point(4e-4, 2e-4)]
+
+    graph_edges = process_strategy.create_graph_edges(plaza, entry_points)
+    assert process_strategy.get_stats()['candidate_edges'] >= len(graph_edges) > 0
+
+
+def test_lazy_visibility_direct_line():
+    """ visible entry points are connected directly, without expanding any vertex """
+    plaza = Polygon([(0, 0), (4, 0), (4, 4), (0, 4)], [[(1, 1), (3, 1), (3, 3), (1, 3)]])
+    plaza = affinity.scale(plaza, 1e-4, 1e-4, origin=(0, 0))
+    entry_points = [Point(0, 1e-4), Point(1e-4, 0)]
+
+    checks = get_visibility_check_count()
+    processor = LazyVisibilityGraphProcessor(visibility_delta_m=0.001)
+    graph_edges = processor.create_graph_edges(plaza, entry_points)
+    assert get_visibility_check_count() - checks == 1
+    assert processor.get_stats() == {'candidate_edges': 1}
+    assert [line.coords[:] for line in graph_edges] == [[(0, 1e-4), (1e-4, 0)]]
+
+
+def test_lazy_visibility_around_hole():
+    """ the path between opposite entry points bends at the corners of the hole """
+    plaza = Polygon([(0, 0), (4, 0), (4, 4), (0, 4)], [[(1, 1), (3, 1), (3, 3), (1, 3)]])
+    plaza = affinity.scale(plaza, 1e-4, 1e-4, origin=(0, 0))
+    entry_points = [Point(0, 2e-4), Point(4e-4, 2e-4)]
+
+    graph_edges = LazyVisibilityGraphProcessor(visibility_delta_m=0.001).create_graph_edges(plaza, entry_points)
+    path_length = sum(line.length for line in graph_edges)
+    assert path_length == pytest.approx(2 * 2 ** 0.5 * 1e-4 + 2e-4)
+
+
+def test_auto_strategy_open_plaza():
+    """ entry points that see each other are cheapest to connect with a visibility graph, without any detour """
+    plaza = Polygon([(0, 0), (4, 0), (4, 4), (0, 4)])
+    plaza = affinity.scale(plaza, 1e-4, 1e-4, origin=(0, 0))
+    entry_points = [Point(0, 1e-4), Point(4e-4, 3e-4)]
+    processor = AutoGraphProcessor(visibility_delta_m=0.1, max_detour=1.1)
+
+    graph_edges = processor.create_graph_edges(plaza, entry_points)
+    assert processor.get_stats()['graph_strategy'] in ('visibility-reflex', 'visibility-lazy')
+    assert [line.coords[:] for line in graph_edges] == [[(0, 1e-4), (4e-4, 3e-4)]]
+
+
+def test_auto_strategy_detour_bound():
+    """ approximate strategies are only considered if their detour is within the bound """
+    exact_processor = AutoGraphProcessor(visibility_delta_m=0.1, max_detour=1.0)
+    assert set(exact_processor.processors) == {'visibility-reflex', 'visibility-sweep', 'visibility-lazy'}
+    approximate_processor = AutoGraphProcessor(visibility_delta_m=0.1, max_detour=1.1)
+    assert 'navmesh' in approximate_processor.processors
+    assert 'spiderweb-adaptive' not in approximate_processor.processors
+
+
+def test_auto_strategy_stats(config):
+    processor = AutoGraphProcessor(visibility_delta_m=0.1, max_detour=1.1)
+    plaza_stats = {}
+    holder = testfilemanager.import_testfile('bahnhofplatz_bern', config)
+    plaza = utils.get_plaza_by_id(holder.plazas, 5117701)
+    plaza_processor = optimizer.PlazaPreprocessor(
+        holder, processor, shortest_paths.compute_dijkstra_shortest_paths, config)
+    result_plaza = plaza_processor._process_plaza(plaza, plaza_stats)
+
+    assert result_plaza
+    assert plaza_stats['graph_strategy'] in processor.processors
+    assert plaza_stats['estimated_graph_time_s'] > 0
+    assert plaza_stats['graph_time_s'] > 0
+
+
+@pytest.mark.parametrize('testfile', ['bahnhofplatz_bern', 'sechselaeutenplatz'])
+def test_auto_strategy_path_detours(testfile, config):
+    """ the paths of the chosen strategies should be at most max_detour longer than the reflex visibility paths """
+    processor = AutoGraphProcessor(visibility_delta_m=0.1, max_detour=1.1)
+    for plaza_geometry, entry_points in utils.get_graph_inputs(testfile, config):
+        shortest_lengths = utils.get_path_lengths(
+            ReflexVisibilityGraphProcessor(visibility_delta_m=0.1).create_graph_edges(plaza_geometry, entry_points),
+            entry_points)
+        auto_lengths = utils.get_path_lengths(processor.create_graph_edges(plaza_geometry, entry_points), entry_points)
+        assert auto_lengths.keys() == shortest_lengths.keys()
+        # the visibility graphs accept lines up to the visibility delta outside of the plaza
+        assert all(auto_lengths[pair] <= length * 1.1 + meters_to_degrees(0.1)
+                   for pair, length in shortest_lengths.items())
+
+
+def test_cached_processing(config):
+    cache_path = 'testcache.sqlite'
+    config['cache-path'] = cache_path
+    process_strategy = VisibilityGraphProcessor(visibility_delta_m=0.1)
+    try:
+        holder = testfilemanager.import_testfile('kreuzplatz', config)
+        processed_plazas = list(optimizer.preprocess_plazas(
+            holder, process_strategy, shortest_paths.compute_dijkstra_shortest_paths, config))
+
+        holder = testfilemanager.import_testfile('kreuzplatz', config)
+        preprocessor = optimizer.PlazaPreprocessor(
+            holder, process_strategy, shortest_paths.compute_dijkstra_shortest_paths, config)
+        with plazacache.PlazaCache(cache_path, max_size_mb=1024) as cache:
+            cached_plazas = [plaza for plaza, _ in preprocessor._process_plazas_cached(cache) if plaza]
+            assert (cache.hits, cache.misses) == (len(preprocessor.plazas), 0)
+    finally:
+        os.remove(cache_path)
+
+    assert [plaza['osm_id'] for plaza in cached_plazas] == [plaza['osm_id'] for plaza in processed_plazas]
+    for cached_plaza, processed_plaza in zip(cached_plazas, processed_plazas):
+        assert cached_plaza['geometry'].equals(processed_plaza['geometry'])
+        assert [line.coords[:] for line in cached_plaza['graph_edges']] == \
+            [line.coords[:] for line in processed_plaza['graph_edges']]
+
+
+def test_navmesh_funnel_path():
+    """ the path around the inner corner of the L should only bend at the corner """
+    l_shape = Polygon([(0, 0), (2, 0), (2, 1), (1, 1), (1, 2), (0, 2)])
+    mesh = NavMesh(l_shape, [(2, 0.5), (0.5, 2)], visibility_delta_m=0.1)
+    assert mesh.find_paths() == [[(2, 0.5), (1, 1), (0.5, 2)]]
+
+
+def test_navmesh_conforming_triangulation():
+    """ the long boundary segments of the narrow corridor are split until no triangle leaves the polygon """
+    corridor = Polygon([(0, 0), (10, 0), (10, 0.1), (0, 0.1)])
+    mesh = NavMesh(corridor, [(0, 0.05), (10, 0.05)], visibility_delta_m=0.1)
+    assert sum(Polygon(triangle).area for triangle in mesh.triangles) == pytest.approx(corridor.area)
+    assert mesh.find_paths() == [[(0, 0.05), (10, 0.05)]]
+
+
+def test_navmesh_near_optimal_paths(config):
+    """ the funnel paths should be at most a few percent longer than the visibility graph paths """
+    visibility_plaza = utils.process_plaza('sechselaeutenplatz', 4094446, VisibilityGraphProcessor(visibility_delta_m=0.1),
+                                           shortest_paths.compute_dijkstra_shortest_paths, config)
+    navmesh_plaza = utils.process_plaza('sechselaeutenplatz', 4094446, NavMeshGraphProcessor(visibility_delta_m=0.1),
+                                        shortest_paths.compute_dijkstra_shortest_paths, config)
+    assert visibility_plaza and navmesh_plaza
+    visibility_length = sum(line.length for line in visibility_plaza['graph_edges'])
+    navmesh_length = sum(line.length for line in navmesh_plaza['graph_edges'])
+    assert visibility_length <= navmesh_length <= visibility_length * 1.05
+
+
+@pytest.mark.parametrize('testfile', ['bahnhofstrasse', 'bundeshaus_bern'])
+def test_navmesh_path_detours(testfile, config):
+    """ every funnel path should be at most the assumed detour longer than the shortest path """
+    for plaza_geometry, entry_points in utils.get_graph_inputs(testfile, config):
+        shortest_lengths = utils.get_path_lengths(
+            RotationalSweepGraphProcessor(visibility_delta_m=0.1).create_graph_edges(plaza_geometry, entry_points),
+            entry_points)
+        navmesh_lengths = utils.get_path_lengths(
+            NavMeshGraphProcessor(visibility_delta_m=0.1).create_graph_edges(plaza_geometry, entry_points),
+            entry_points)
+        assert navmesh_lengths.keys() == shortest_lengths.keys()
+        assert all(navmesh_lengths[pair] <= length * STRATEGY_DETOURS['navmesh'] + 1e-12
+                   for pair, length in shortest_lengths.items())
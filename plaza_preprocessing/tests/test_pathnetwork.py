@@ -0,0 +1,56 @@
+from shapely.geometry import LineString, Point
+from plaza_preprocessing.optimizer import pathnetwork, shortest_paths
+
+
+def test_shared_segments_are_merged():
+    entry_points = [Point(0, 0), Point(2, 1), Point(2, -1)]
+    lines = [
+        LineString([(0, 0), (1, 0), (2, 1)]),
+        LineString([(0, 0), (1, 0), (2, -1)]),
+        LineString([(2, 1), (1, 0), (2, -1)]),
+    ]
+    merged = pathnetwork.merge_shortest_paths(lines, entry_points)
+    assert sorted(list(line.coords) for line in merged) == [
+        [(0, 0), (1, 0)], [(1, 0), (2, -1)], [(1, 0), (2, 1)]]
+
+
+def test_chains_are_merged():
+    entry_points = [Point(0, 0), Point(3, 1)]
+    lines = [
+        LineString([(0, 0), (1, 0), (2, 0), (3, 1)]),
+        LineString([(3, 1), (2, 0), (1, 0), (0, 0)]),
+    ]
+    merged = pathnetwork.merge_shortest_paths(lines, entry_points)
+    # the collinear node (1, 0) is dropped
+    assert [list(line.coords) for line in merged] == [[(0, 0), (2, 0), (3, 1)]]
+
+
+def test_chains_are_split_at_entry_points():
+    entry_points = [Point(0, 0), Point(1, 0), Point(2, 0)]
+    lines = [LineString([(0, 0), (1, 0), (2, 0)])]
+    merged = pathnetwork.merge_shortest_paths(lines, entry_points)
+    assert sorted(list(line.coords) for line in merged) == [[(0, 0), (1, 0)], [(1, 0), (2, 0)]]
+
+
+def test_merged_network_keeps_shortest_paths():
+    entry_points = [Point(0, 0), Point(4, 0), Point(2, 2), Point(2, -2)]
+    lines = [
+        LineString([(0, 0), (1, 0), (2, 0), (3, 0), (4, 0)]),
+        LineString([(0, 0), (1, 0), (2, 2)]),
+        LineString([(0, 0), (1, 0), (2, -2)]),
+        LineString([(4, 0), (3, 0), (2, 2)]),
+        LineString([(4, 0), (3, 0), (2, -2)]),
+        LineString([(2, 2), (2, 0), (2, -2)]),
+    ]
+    merged = pathnetwork.merge_shortest_paths(lines, entry_points)
+
+    graph = shortest_paths.create_graph(sum((_split_line(line) for line in merged), []))
+    merged_paths = shortest_paths.compute_dijkstra_shortest_paths(graph, entry_points)
+    original_graph = shortest_paths.create_graph(sum((_split_line(line) for line in lines), []))
+    original_paths = shortest_paths.compute_dijkstra_shortest_paths(original_graph, entry_points)
+    assert [line.length for line in merged_paths] == [line.length for line in original_paths]
+
+
+def _split_line(line):
+    coords = list(line.coords)
+    return [LineString([start, end]) for start, end in zip(coords, coords[1:])]
@@ -0,0 +1,71 @@
+import pytest
+import os
+from shapely.geometry import Point, Polygon, LineString
+from plaza_preprocessing import configuration
+from plaza_preprocessing.optimizer import plazacache
+
+
+@pytest.fixture
+def config():
+    config_path = 'testconfig.yml'
+    yield configuration.load_config(config_path)
+    os.remove(config_path)
+
+
+@pytest.fixture
+def cache_path():
+    cache_path = 'testcache.sqlite'
+    yield cache_path
+    os.remove(cache_path)
+
+
+def test_key_changes_with_input(config):
+    plaza = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])
+    lines = [{'id': 1, 'is_barrier': False, 'geometry': LineString([(-1, 0.5), (2, 0.5)])}]
+    key = plazacache.create_key(plaza, lines, [], [], config)
+
+    assert key == plazacache.create_key(plaza, lines, [], [], config)
+    assert key != plazacache.create_key(plaza, lines, [], [Point(0.5, 0.5)], config)
+    assert key != plazacache.create_key(plaza, [], [], [], config)
+    config['obstacle-buffer'] = 3
+    assert key != plazacache.create_key(plaza, lines, [], [], config)
+
+
+def test_cache_roundtrip(cache_path):
+    processed_plaza = {
+        'osm_id': 1,
+        'geometry': Polygon([(0, 0), (1, 0), (1, 1), (0, 1)]),
+        'entry_points': [Point(0, 0), Point(1, 1)],
+        'entry_lines': [{'way_id': 2, 'entry_points': [Point(0, 0)]}],
+        'graph_edges': [LineString([(0, 0), (1, 1)])]
+    }
+    with plazacache.PlazaCache(cache_path, max_size_mb=1) as cache:
+        cache.put('processed', processed_plaza)
+        cache.put('discarded', None)
+
+    with plazacache.PlazaCache(cache_path, max_size_mb=1) as cache:
+        keys = ['missing', 'processed', 'discarded'] + [str(i) for i in range(1000)]
+        assert cache.find_cached_keys(keys) == {'processed', 'discarded'}
+        cached_fields = cache.get('processed')
+        assert cached_fields['graph_edges'][0].equals(processed_plaza['graph_edges'][0])
+        assert cached_fields['entry_lines'][0]['way_id'] == 2
+        assert 'osm_id' not in cached_fields
+        assert cache.get('discarded') == {}
+        assert cache.get('missing') is None
+        assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_least_recently_used_are_evicted(cache_path):
+    processed_plaza = {
+        'geometry': Polygon([(0, 0), (1, 0), (1, 1), (0, 1)]),
+        'entry_points': [],
+        'entry_lines': [],
+        'graph_edges': [LineString([(0, i), (1, i)]) for i in range(1000)]
+    }
+    with plazacache.PlazaCache(cache_path, max_size_mb=0.1) as cache:
+        for key in ['first', 'second', 'third']:
+            cache.put(key, processed_plaza)
+        cache.get('first')
+        cache.evict()
+        assert cache.get('first') is not None
+        assert cache.get('second') is None
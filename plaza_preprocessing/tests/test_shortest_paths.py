@@ -1,5 +1,7 @@
 from shapely.geometry import LineString, Point
 from plaza_preprocessing.optimizer import shortest_paths
+from plaza_preprocessing.optimizer.csrgraph import CSRGraph
+from plaza_preprocessing.optimizer.grapharrays import GraphArrays
 
 
 def test_create_graph_simple_edges():
@@ -40,3 +42,69 @@ def test_compute_astar_shortest_paths():
     graph = shortest_paths.create_graph(graph_edges)
     lines = shortest_paths.compute_dijkstra_shortest_paths(graph, entry_points)
     assert expected_lines == [list(line.coords) for line in lines]
+
+
+def test_compute_csr_dijkstra_shortest_paths():
+    graph_edges = [LineString([(0, 0), (0, 1)]), LineString([(0, 1), (1, 1)]),
+                   LineString([(1, 1), (1, 0)]), LineString([(0, 0), (1, 0)]),
+                   LineString([(0, 0), (1, 1)]), LineString([(1, 1), (2, 1)])]
+
+    entry_points = [Point((0, 0)), Point((2, 1)), Point((1, 0))]
+    expected_lines = [[(0, 0), (1, 1), (2, 1)], [(0, 0), (1, 0)], [(1, 0), (1, 1), (2, 1)]]
+
+    graph = shortest_paths.create_graph_for_strategy(graph_edges, shortest_paths.compute_csr_dijkstra_shortest_paths)
+    lines = shortest_paths.compute_csr_dijkstra_shortest_paths(graph, entry_points)
+    assert expected_lines == [list(line.coords) for line in lines]
+
+
+def test_create_csr_graph():
+    graph_edges = [LineString([(0, 0), (0, 1)]), LineString([(0, 1), (1, 1)]),
+                   LineString([(1, 1), (1, 0)]), LineString([(0, 0), (1, 1)])]
+
+    graph = CSRGraph.from_lines(graph_edges)
+
+    assert graph.number_of_nodes == 4
+    assert graph.number_of_edges == 4
+    node_id = graph.get_node_id((1.0, 1.0))
+    neighbours = graph.indices[graph.indptr[node_id]:graph.indptr[node_id + 1]]
+    assert sorted(graph.get_coords(n) for n in neighbours) == [(0, 0), (0, 1), (1, 0)]
+    assert graph.get_node_id((5.0, 5.0)) is None
+
+
+def test_graph_size():
+    graph_edges = [LineString([(0, 0), (0, 1)]), LineString([(0, 1), (1, 1)])]
+    for strategy in [shortest_paths.compute_dijkstra_shortest_paths, shortest_paths.compute_csr_dijkstra_shortest_paths]:
+        graph = shortest_paths.create_graph_for_strategy(graph_edges, strategy)
+        assert shortest_paths.get_graph_size(graph) == (3, 2)
+
+
+def test_graph_arrays_same_paths():
+    coords = [(0, 0), (0, 1), (1, 1), (1, 0), (2, 1), (5, 5)]
+    edges = [(0, 1), (1, 2), (2, 3), (0, 3), (0, 2), (2, 4)]
+    graph_arrays = GraphArrays(coords, edges)
+    graph_edges = graph_arrays.to_lines()
+    assert list(graph_arrays.weights) == [line.length for line in graph_edges]
+
+    entry_points = [Point((0, 0)), Point((2, 1)), Point((1, 0))]
+    for strategy in [shortest_paths.compute_dijkstra_shortest_paths, shortest_paths.compute_astar_shortest_paths,
+                     shortest_paths.compute_csr_dijkstra_shortest_paths]:
+        array_graph = shortest_paths.create_graph_for_strategy(graph_arrays, strategy)
+        line_graph = shortest_paths.create_graph_for_strategy(graph_edges, strategy)
+        assert [line.coords[:] for line in strategy(array_graph, entry_points)] == \
+            [line.coords[:] for line in strategy(line_graph, entry_points)]
+
+
+def test_graph_arrays_from_lines():
+    graph_edges = [LineString([(0, 0), (0, 1)]), LineString([(0, 1), (1, 1)])]
+    graph_arrays = GraphArrays.from_lines(graph_edges)
+    assert [line.coords[:] for line in graph_arrays.to_lines()] == [line.coords[:] for line in graph_edges]
+    assert len(GraphArrays.from_lines([])) == 0
+
+
+def test_csr_dijkstra_unreachable_entry_point():
+    graph_edges = [LineString([(0, 0), (0, 1)]), LineString([(2, 2), (3, 3)])]
+    entry_points = [Point((0, 0)), Point((0, 1)), Point((3, 3)), Point((9, 9))]
+
+    graph = CSRGraph.from_lines(graph_edges)
+    lines = shortest_paths.compute_csr_dijkstra_shortest_paths(graph, entry_points)
+    assert [list(line.coords) for line in lines] == [[(0, 0), (0, 1)]]
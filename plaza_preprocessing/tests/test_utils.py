@@ -0,0 +1,51 @@
+from shapely.geometry import Polygon, LineString, Point
+from plaza_preprocessing.optimizer import utils
+
+
+def create_plaza_with_hole():
+    exterior = [(0, 0), (0.001, 0), (0.001, 0.001), (0, 0.001)]
+    hole = [(0.0004, 0.0004), (0.0006, 0.0004), (0.0006, 0.0006), (0.0004, 0.0006)]
+    return Polygon(exterior, [hole])
+
+
+def test_lines_visible():
+    plaza = create_plaza_with_hole()
+    lines = [
+        ((0, 0), (0.001, 0)),  # on the boundary
+        ((0, 0), (0.0004, 0.0004)),  # to a corner of the hole
+        ((0, 0), (0.001, 0.001)),  # through the hole
+        ((0.0002, 0.0002), (0.0002, 0.0008)),  # inside
+        ((0.0002, 0.0002), (0.002, 0.0002)),  # leaving the plaza
+        ((0.0004, 0.0004), (0.0006, 0.0004)),  # along an edge of the hole
+    ]
+    visible = utils.lines_visible(plaza, lines, delta_m=0.1)
+    assert list(visible) == [True, True, False, True, False, True]
+
+
+def test_lines_visible_tolerance():
+    plaza = create_plaza_with_hole()
+    offset = utils.meters_to_degrees(0.05)
+    lines = [((0.0002, 0.0002), (0.001 + offset, 0.0002))]
+    assert list(utils.lines_visible(plaza, lines, delta_m=0.1)) == [True]
+    assert list(utils.lines_visible(plaza, lines, delta_m=0.01)) == [False]
+
+
+def test_lines_visible_same_as_line_visible():
+    plaza = create_plaza_with_hole()
+    coords = [(0.0001 * x, 0.0001 * y) for x in range(0, 11, 3) for y in range(0, 11, 3)]
+    lines = [(start, end) for start in coords for end in coords if start < end]
+    expected = [utils.line_visible(plaza, LineString(line), 0.1) for line in lines]
+    assert list(utils.lines_visible(plaza, lines, 0.1)) == expected
+
+
+def test_lines_visible_empty():
+    assert len(utils.lines_visible(create_plaza_with_hole(), [], 0.1)) == 0
+
+
+def test_find_nearest_geometries_same_as_find_nearest_geometry():
+    lines = [LineString([(0.0001 * x, 0.0001 * y), (0.0001 * (x + 1), 0.0001 * (y + (x % 3) - 1))])
+             for x in range(10) for y in range(10)]
+    lines.append(LineString([(0, 0.0005), (0.001, 0.0005)]))  # long line with a large bounding box
+    points = [Point(0.00013 * x - 0.0002, 0.00017 * y - 0.0003) for x in range(12) for y in range(12)]
+    expected = [lines.index(utils.find_nearest_geometry(point, lines)) for point in points]
+    assert utils.find_nearest_geometries(points, lines) == expected
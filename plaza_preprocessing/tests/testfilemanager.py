@@ -15,7 +15,8 @@ TEST_PLAZAS = {
     'kreuzplatz': 'kreuzplatz.osm',
     'bahnhofstrasse': 'bahnhofstrasse.osm',
     'zuerich_hb': 'zuerich_hauptbahnhof.osm',
-    'fischmarktplatz': 'fischmarktplatz.osm'
+    'fischmarktplatz': 'fischmarktplatz.osm',
+    'sechselaeutenplatz': 'sechselaeutenplatz.osm'
 }
 
 
@@ -1,5 +1,7 @@
+import networkx as nx
 import testfilemanager
-from plaza_preprocessing.optimizer import optimizer
+from plaza_preprocessing.optimizer import optimizer, shortest_paths
+from plaza_preprocessing.optimizer.graphprocessor.rotationalsweep import RotationalSweepGraphProcessor
 
 
 def process_plaza(testfile, plaza_id, process_strategy, shortest_path_strategy, config):
@@ -14,3 +16,38 @@ def get_plaza_by_id(plazas, osm_id):
     plaza = list(filter(lambda p: p['osm_id'] == osm_id, plazas))
     assert len(plaza) == 1
     return plaza[0]
+
+
+def get_graph_inputs(testfile, config):
+    """ plaza geometries without obstacles and entry points that the graph processor gets for every plaza """
+    holder = testfilemanager.import_testfile(testfile, config)
+    recorder = _RecordingGraphProcessor(visibility_delta_m=0.1)
+    processor = optimizer.PlazaPreprocessor(holder, recorder, shortest_paths.compute_dijkstra_shortest_paths, config)
+    for plaza in holder.plazas:
+        processor._process_plaza(plaza)
+    return recorder.graph_inputs
+
+
+def get_path_lengths(graph_edges, entry_points):
+    """ length of the shortest path in the graph between every pair of entry points that are connected """
+    graph = shortest_paths.create_graph(graph_edges)
+    entry_coords = sorted(set((p.x, p.y) for p in entry_points))
+    path_lengths = {}
+    for i, start in enumerate(entry_coords):
+        if start not in graph:
+            continue
+        lengths = nx.single_source_dijkstra_path_length(graph, start)
+        for end in entry_coords[i + 1:]:
+            if end in lengths:
+                path_lengths[(start, end)] = lengths[end]
+    return path_lengths
+
+
+class _RecordingGraphProcessor(RotationalSweepGraphProcessor):
+    def __init__(self, visibility_delta_m):
+        super().__init__(visibility_delta_m)
+        self.graph_inputs = []
+
+    def create_graph(self, plaza_geometry, entry_points):
+        self.graph_inputs.append((plaza_geometry, entry_points))
+        return super().create_graph(plaza_geometry, entry_points)